@@ -3,7 +3,8 @@ import os
 from werkzeug.middleware.proxy_fix import ProxyFix
 
 from config import Config
-from app.extensions import db, migrate
+from app.extensions import db, init_migrate
+from app.commands import data_cli
 
 from app.auth import bp as auth_bp
 from app.dates import bp as dates_bp
@@ -19,17 +20,25 @@ def create_app(config_class=Config):
 
     # Initialize Flask extensions here
     db.init_app(app)
-    migrate.init_app(app, db)
+
+    # Migrations only run from the flask CLI, keep alembic out of the workers
+    if os.environ.get('FLASK_RUN_FROM_CLI') == 'true':
+        init_migrate(app)
 
     # Fix nginx set proxy header
     app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=1, x_host=1)
 
-    # Register blueprints
+    # Register blueprints. Flask cannot add routes once the first request is
+    # handled, so they are registered here; their heavy dependencies are
+    # imported by the views that need them instead
     app.register_blueprint(auth_bp)
     app.register_blueprint(dates_bp)
     app.register_blueprint(travel_bp)
     app.register_blueprint(finances_bp)
 
+    # Register commands
+    app.cli.add_command(data_cli)
+
     # Default page
     @app.route("/")
     def index_page():
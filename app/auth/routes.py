@@ -1,16 +1,11 @@
 from flask import Flask, jsonify, render_template, request, Blueprint, redirect, url_for, session, make_response, session, current_app
-from requests_oauthlib import OAuth2Session
 import json
 import uuid
 import os
 import secrets
-import requests
-from dotenv import load_dotenv
 from urllib.parse import urlencode
 from ..models.auth import require_email_authorization
 
-# Load environment variables
-load_dotenv()
 from app.auth import bp
 
 @bp.route('/authorize/<provider>')
@@ -65,6 +60,9 @@ def oauth2_callback(provider):
     Raises:
         HTTPException: An HTTP 404 error if the provider is not configured, a 401 error if there is an authentication error, or if the state parameter or authorization code is invalid.
     """
+    # requests is only needed here, keep it out of worker start up
+    import requests
+
     provider_data = current_app.config['OAUTH2_PROVIDERS'].get(provider)
     if provider_data is None:
         abort(404)
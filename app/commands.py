@@ -0,0 +1,74 @@
+import time
+
+import click
+from flask.cli import AppGroup
+
+from app.extensions import db
+from app.models.bulk import FORMATS, TABLES, dump_table, guess_format, iter_records, load_table
+from app.models.travelers import Traveler
+
+data_cli = AppGroup('data', help='Load and dump table data.')
+
+
+def _progress(table, start):
+    def report(count):
+        click.echo(f"{table}: {count:,} rows ({time.perf_counter() - start:.1f}s)", err=True)
+    return report
+
+
+@data_cli.command('init')
+def init():
+    """
+    Create the tables that do not exist yet and the default travelers.
+
+    Existing tables and rows are left alone, so it is safe to run again.
+    """
+    db.create_all()
+    for traveler in Traveler.create_defaults():
+        click.echo(f"Added traveler {traveler.name} on bit {traveler.bit}", err=True)
+
+
+@data_cli.command('load')
+@click.argument('table', type=click.Choice(sorted(TABLES)))
+@click.argument('path', type=click.Path(exists=True, dir_okay=False, allow_dash=True))
+@click.option('--format', 'file_format', type=click.Choice(FORMATS),
+              help='Format of the file. Defaults to json for .json files, ndjson otherwise.')
+@click.option('--replace', is_flag=True, help='Delete the rows of the table that are not in the file.')
+@click.option('--chunk-size', default=5000, show_default=True, help='Rows written per statement.')
+def load(table, path, file_format, replace, chunk_size):
+    """
+    Load the rows of a table from a JSON or NDJSON file.
+
+    The file is parsed incrementally and its rows are upserted on the
+    primary key in batches, within one transaction, so loading the same file
+    again is a no-op. Other tables are left alone.
+    """
+    file_format = file_format or guess_format(path)
+    start = time.perf_counter()
+    with click.open_file(path, 'r', encoding='utf-8') as file:
+        try:
+            count = load_table(TABLES[table], iter_records(file, file_format, table), replace=replace,
+                               chunk_size=chunk_size, progress=_progress(table, start))
+        except ValueError as e:
+            raise click.ClickException(str(e))
+    click.echo(f"Loaded {count:,} rows into {table} in {time.perf_counter() - start:.1f}s", err=True)
+
+
+@data_cli.command('dump')
+@click.argument('table', type=click.Choice(sorted(TABLES)))
+@click.argument('path', default='-', type=click.Path(dir_okay=False, writable=True, allow_dash=True))
+@click.option('--format', 'file_format', type=click.Choice(FORMATS),
+              help='Format of the file. Defaults to json for .json files, ndjson otherwise.')
+@click.option('--chunk-size', default=5000, show_default=True, help='Rows fetched at a time.')
+def dump(table, path, file_format, chunk_size):
+    """
+    Dump the rows of a table to a JSON or NDJSON file, or to stdout.
+
+    The dump can be restored with ``flask data load``.
+    """
+    file_format = file_format or guess_format(path)
+    start = time.perf_counter()
+    with click.open_file(path, 'wb') as file:
+        count = dump_table(TABLES[table], file, file_format, chunk_size=chunk_size,
+                           progress=_progress(table, start) if path != '-' else None)
+    click.echo(f"Dumped {count:,} rows of {table} in {time.perf_counter() - start:.1f}s", err=True)
@@ -1,12 +1,8 @@
 from flask import Flask, jsonify, render_template, request, Blueprint, redirect, url_for, session, make_response, session, current_app
 from datetime import datetime
-from dateutil.relativedelta import relativedelta
-from dotenv import load_dotenv
 from urllib.parse import urlencode
 from ..models.misc import remaining_days
 
-# Load environment variables
-load_dotenv()
 from app.dates import bp
 
 @bp.route('/')
@@ -32,6 +28,7 @@ def days_left():
     number_of_weekdays = remaining_days(start_date, end_date, excluded_dates)
 
     # Calculate the total number of months and days remaining
+    from dateutil.relativedelta import relativedelta
     delta = relativedelta(end_date, start_date)
     months_remaining = delta.months
     days_remaining = delta.days
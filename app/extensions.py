@@ -1,7 +1,13 @@
 from flask_sqlalchemy import SQLAlchemy
 db = SQLAlchemy()
 
-from flask_migrate import Migrate
-from app.extensions import db  # Assuming db is your SQLAlchemy instance
 
-migrate = Migrate()
\ No newline at end of file
+def init_migrate(app):
+    """
+    Set up Flask-Migrate for an app.
+
+    flask_migrate pulls in alembic, which is only needed by the ``flask db``
+    commands, so it is imported here rather than at module level.
+    """
+    from flask_migrate import Migrate
+    Migrate(app, db)
@@ -0,0 +1,161 @@
+"""
+Monthly cash-flow projection merging the mortgage schedules, the RSU payout
+ledger and the latest savings balance.
+
+Each input is turned into a component array over the horizon, memoized on
+the version of its rows. When an input changes, only its component is
+rebuilt, and the running balance is recomputed from the first month whose
+cash flow changed; a new savings balance only shifts it.
+"""
+import threading
+from datetime import date
+
+from app.models.amortization import mortgage_schedule
+from app.models.finances import Mortgage, RsuPayout, Savings
+from app.models.versions import TableVersion
+
+# Longest projection, in months
+MAX_MONTHS = 40 * 12
+
+FIELDS = ('month', 'payment', 'escrow', 'principal', 'interest', 'payout', 'balance')
+
+# Projections kept per worker, by start month and horizon
+CACHE_SIZE = 16
+
+_projections = {}
+_lock = threading.Lock()
+
+
+class _Projection:
+    """The memoized components and running balance of one start month and horizon."""
+
+    def __init__(self, start, months):
+        import numpy as np
+
+        self.start = start
+        self.months = months
+        self.mortgage_version = None
+        self.payout_version = None
+        self.savings_version = None
+        self.initial_balance = 0.0
+        self.mortgages = {name: np.zeros(months) for name in ('payment', 'escrow', 'principal', 'interest')}
+        self.payout = np.zeros(months)
+        # The balance of an empty projection, which the first refresh shifts and recomputes
+        self.balance = np.zeros(months)
+        self.rows = None
+
+    def _index(self, year, month):
+        return (year - self.start.year) * 12 + month - self.start.month
+
+    def _mortgage_components(self, mortgages):
+        import numpy as np
+
+        components = {name: np.zeros(self.months) for name in self.mortgages}
+        first = np.datetime64(self.start, 'M')
+        for mortgage in mortgages:
+            schedule = mortgage_schedule(mortgage)
+            offsets = (schedule.month - first).astype(int)
+            inside = (offsets >= 0) & (offsets < self.months)
+            offsets = offsets[inside]
+            components['payment'][offsets] += schedule.total_payment[inside]
+            components['escrow'][offsets] += schedule.escrow[inside]
+            components['principal'][offsets] += (schedule.principal + schedule.extra)[inside]
+            components['interest'][offsets] += schedule.interest[inside]
+        return components
+
+    def _payout_component(self):
+        import numpy as np
+
+        payout = np.zeros(self.months)
+        for row in RsuPayout.aggregate(self.start.year, self.start.month):
+            index = self._index(row['year'], row['month'])
+            if index >= self.months:
+                break
+            payout[index] = row['amount']
+        return payout
+
+    def refresh(self):
+        """
+        Bring the projection up to date with the database, rebuilding only
+        the components whose inputs changed.
+
+        :return: The index of the first month that changed, ``self.months`` if none did.
+        """
+        import numpy as np
+
+        changed = self.months
+        mortgages = Mortgage.query.order_by(Mortgage.id).all()
+        mortgage_version = tuple(mortgage.to_row() for mortgage in mortgages)
+        if mortgage_version != self.mortgage_version:
+            components = self._mortgage_components(mortgages)
+            for name, values in components.items():
+                different = np.flatnonzero(values != self.mortgages[name])
+                if different.size:
+                    changed = min(changed, int(different[0]))
+            self.mortgages, self.mortgage_version = components, mortgage_version
+
+        payout_version = TableVersion.current([RsuPayout.__tablename__])[RsuPayout.__tablename__][0]
+        if payout_version != self.payout_version:
+            payout = self._payout_component()
+            different = np.flatnonzero(payout != self.payout)
+            if different.size:
+                changed = min(changed, int(different[0]))
+            self.payout, self.payout_version = payout, payout_version
+
+        latest = Savings.get_latest()
+        savings_version = (latest.id, latest.balance, latest.last_updated) if latest else None
+        if savings_version != self.savings_version:
+            initial_balance = latest.balance if latest else 0.0
+            # Every month moves by the same amount
+            self.balance = self.balance + (initial_balance - self.initial_balance)
+            self.initial_balance, self.savings_version = initial_balance, savings_version
+            self.rows = None
+
+        if changed < self.months:
+            # Escrow is paid from its own account, as on the mortgage page
+            flow = self.payout[changed:] - self.mortgages['principal'][changed:] - self.mortgages['interest'][changed:]
+            opening = self.balance[changed - 1] if changed else self.initial_balance
+            self.balance = self.balance.copy()
+            self.balance[changed:] = opening + np.cumsum(flow)
+            self.rows = None
+        return changed
+
+    def to_rows(self):
+        import numpy as np
+
+        if self.rows is None:
+            months = np.datetime_as_string(np.datetime64(self.start, 'M') + np.arange(self.months), unit='M')
+            columns = [months.tolist()] + [self.mortgages[name].tolist()
+                                           for name in ('payment', 'escrow', 'principal', 'interest')]
+            self.rows = list(zip(*columns, self.payout.tolist(), self.balance.tolist()))
+        return self.rows
+
+
+def project(months, today=None):
+    """
+    Project the monthly cash flow from the current month on.
+
+    Every month holds the total mortgage 'payment', its 'escrow', the
+    'principal' (extra payments included) and 'interest' parts, the RSU
+    'payout' and the savings 'balance' at the end of the month, starting
+    from the latest balance and moved by the payouts less the principal and
+    interest paid.
+
+    :param months: The number of months to project, at most ``MAX_MONTHS``.
+    :param today: The date the projection starts from, defaults to today.
+    :return: A list of row tuples in ``FIELDS`` order, months as 'YYYY-MM'.
+    :raises ValueError: If the number of months is out of range.
+    """
+    if not 1 <= months <= MAX_MONTHS:
+        raise ValueError(f"months must be between 1 and {MAX_MONTHS}")
+    today = today or date.today()
+    start = date(today.year, today.month, 1)
+
+    with _lock:
+        projection = _projections.get((start, months))
+        if projection is None:
+            if len(_projections) >= CACHE_SIZE:
+                _projections.clear()
+            projection = _projections[(start, months)] = _Projection(start, months)
+        projection.refresh()
+        return projection.to_rows()
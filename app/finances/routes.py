@@ -1,8 +1,15 @@
-from flask import Flask, jsonify, render_template, request, Blueprint, redirect, url_for, session, make_response, session, current_app, abort
+from flask import Flask, jsonify, render_template, request, Blueprint, redirect, url_for, session, make_response, session, current_app, abort, Response, stream_with_context
 from datetime import datetime
 
-from ..models.finances import Mortgage, BonusPayment, Savings
+from ..models.finances import Mortgage, BonusPayment, RsuPayout, Savings
+from ..models.downsample import lttb
 from ..models.auth import require_email_authorization
+from ..models.versions import versioned
+from ..models.bulk import load_file
+from ..models.amortization import FIELDS as SCHEDULE_FIELDS, mortgage_schedule
+from ..models.serialize import LAYOUTS, json_response
+from ..models.sweep import sweep
+from .projection import FIELDS as PROJECTION_FIELDS, project
 
 from app.finances import bp
 
@@ -18,6 +25,7 @@ def savings():
     return render_template('finances/savings.html', title='Savings Details')
 
 @bp.route('/api/mortgage', methods=['GET'])
+@versioned(Mortgage)
 def get_mortgages():
     mortgages = Mortgage.get_all()
     mortgages_list = []
@@ -30,6 +38,7 @@ def get_mortgages():
     return jsonify(mortgages_list)
 
 @bp.route('/api/mortgage/<int:mortgage_id>', methods=['GET'])
+@versioned(Mortgage)
 def get_mortgage(mortgage_id):
     mortgage = Mortgage.get_by_id(mortgage_id)
     if mortgage:
@@ -37,6 +46,81 @@ def get_mortgage(mortgage_id):
     else:
         abort(404, description="Mortgage details not found.")
 
+def _month_amounts(name):
+    # Pairs given as YYYY-MM:amount, comma-separated or in repeated parameters
+    pairs = []
+    for value in request.args.getlist(name):
+        for item in filter(None, value.split(',')):
+            month, _, amount = item.partition(':')
+            try:
+                pairs.append((month.strip(), float(amount)))
+            except ValueError:
+                abort(400, description=f"{name} must be a list of YYYY-MM:amount pairs")
+    return pairs
+
+@bp.route('/api/mortgage/<int:mortgage_id>/schedule', methods=['GET'])
+@require_email_authorization
+@versioned(Mortgage)
+def get_mortgage_schedule(mortgage_id):
+    """
+    Produces the amortization schedule of a mortgage.
+
+    The schedule is computed with NumPy for all the periods at once and cached per version of the mortgage row, so repeated requests and other features reuse it.
+
+    Args:
+        mortgage_id (int): The unique identifier of the mortgage.
+        extra_monthly (float, optional): A query parameter with extra principal paid with every payment. Defaults to 0.
+        extra (str, optional): A query parameter with one-off extra principal payments as comma-separated YYYY-MM:amount pairs, e.g. '2025-06:10000'.
+        escrow (str, optional): A query parameter with escrow changes as comma-separated YYYY-MM:amount pairs, the new monthly escrow from that month on.
+        recast (str, optional): A query parameter with comma-separated YYYY-MM months from which the payment is recomputed over the rest of the term, after extra payments.
+        format (str, optional): A query parameter with the layout, 'records' or 'columns'. Defaults to 'records'.
+
+    Returns:
+        flask.Response: A JSON response with the periods up to payoff in 'items', each with its 'month' (YYYY-MM), scheduled 'payment', its 'principal' and 'interest', the 'extra' principal, the 'escrow', the 'total_payment', the 'balance' after it and the principal and interest paid to date, and a 'summary' with the number of 'periods', the 'monthly_payment', the 'total_interest', the 'total_paid' and the 'payoff_month'. A 400 error is returned for invalid parameters, and a 404 error if the mortgage does not exist.
+    """
+    mortgage = Mortgage.get_or_404(mortgage_id, description="Mortgage details not found.")
+    layout = request.args.get('format', default='records')
+    if layout not in LAYOUTS:
+        abort(400, description=f"format must be one of {', '.join(LAYOUTS)}")
+    extra_monthly = request.args.get('extra_monthly', default=0.0, type=float)
+    recasts = [month for value in request.args.getlist('recast') for month in value.split(',') if month]
+
+    try:
+        schedule = mortgage_schedule(mortgage, extra_monthly, _month_amounts('extra'), _month_amounts('escrow'),
+                                     recasts)
+    except ValueError as e:
+        abort(400, description=str(e))
+    return json_response(SCHEDULE_FIELDS, schedule.rows(), layout, extra={'summary': schedule.summary()})
+
+@bp.route('/api/mortgage/<int:mortgage_id>/sweep', methods=['POST'])
+@require_email_authorization
+def sweep_mortgage(mortgage_id):
+    """
+    Compare a grid of refinance and prepayment offers against a mortgage.
+
+    This endpoint accepts a JSON payload with lists of annual 'rates' in percent, 'terms' in years and monthly 'prepayments', and optionally the 'closing_costs' of refinancing. Every combination refinances the current balance of the mortgage. The grid is evaluated with NumPy in chunks, over a small process pool shared by the requests of the worker for very large grids, and streamed as it is computed.
+
+    Args:
+        mortgage_id (int): The unique identifier of the mortgage.
+
+    Returns:
+        flask.Response: An NDJSON response with a line per combination, holding its 'rate', 'term' and 'prepayment', the new 'monthly_payment', the number of 'periods' to payoff, the 'payoff_month' (YYYY-MM), the 'total_interest', the 'break_even_months' of lower payments covering the closing costs (null if the payment is not lower) and the 'net_savings' in interest against the current schedule, less the closing costs. The number of combinations is in the X-Combinations header. A 400 error is returned for an invalid grid, and a 404 error if the mortgage does not exist.
+    """
+    mortgage = Mortgage.get_or_404(mortgage_id, description="Mortgage details not found.")
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        abort(400, description="rates, terms and prepayments are required")
+
+    try:
+        count, chunks = sweep(mortgage, data.get('rates'), data.get('terms'), data.get('prepayments', [0]),
+                              data.get('closing_costs'))
+    except ValueError as e:
+        abort(400, description=str(e))
+
+    response = Response(stream_with_context(chunks), mimetype='application/x-ndjson')
+    response.headers['X-Combinations'] = str(count)
+    return response
+
 @bp.route('/api/mortgage', methods=['POST'])
 def create_mortgage():
     data = request.get_json()
@@ -72,30 +156,77 @@ def create_bonus_payment():
     bonus_payment = BonusPayment.add_bonus_payment(bonus_type, amount, payment_date, year_assigned)
     return {'id': bonus_payment.id, 'message': 'Bonus payment added successfully'}, 201
 
+@bp.route('/api/bonus_payment/<int:bonus_payment_id>', methods=['PUT'])
+def update_bonus_payment(bonus_payment_id):
+    """
+    Update a bonus payment, rescheduling its RSU payouts in the ledger.
+
+    Args:
+        bonus_payment_id (int): The unique identifier of the bonus payment.
+
+    Returns:
+        flask.Response: A JSON response containing the updated bonus payment, a 400 error for an invalid payment date, amount or year assigned, or a 404 error if the bonus payment does not exist.
+    """
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        abort(400, description="No data provided")
+    if 'payment_date' in data:
+        try:
+            data['payment_date'] = datetime.strptime(data['payment_date'], '%Y-%m-%d')
+        except (TypeError, ValueError):
+            abort(400, description="payment_date must be a date in YYYY-MM-DD format")
+    for name, number in (('amount', float), ('year_assigned', int)):
+        if name in data:
+            try:
+                data[name] = number(data[name])
+            except (TypeError, ValueError):
+                abort(400, description=f"{name} must be a number")
+
+    bonus_payment = BonusPayment.update_by_id(bonus_payment_id, data)
+    if bonus_payment is None:
+        abort(404, description="Bonus payment not found.")
+    return jsonify(bonus_payment.to_dict())
+
+@bp.route('/api/bonus_payment/<int:bonus_payment_id>', methods=['DELETE'])
+def delete_bonus_payment(bonus_payment_id):
+    if BonusPayment.delete_by_id(bonus_payment_id):
+        return jsonify({"status": "success", "message": "Bonus payment deleted."})
+    else:
+        abort(404, description="Bonus payment not found.")
+
 @bp.route('/api/aggregated_rsu_payouts', methods=['GET'])
+@versioned(BonusPayment, RsuPayout, key=lambda: datetime.now().strftime('%Y-%m'))
 def get_aggregated_rsu_payouts():
-    rsu_payments = BonusPayment.query.filter_by(bonus_type='rsu').all()
-    all_upcoming_payouts = []
-    for rsu_payment in rsu_payments:
-        all_upcoming_payouts.extend(rsu_payment.calculate_upcoming_rsu_payouts())
-    
-    # Aggregate payouts by month using a standard dictionary
-    payouts_by_month = {}
-    for payout in all_upcoming_payouts:
-        key = (payout['year'], payout['month'])
-        if key in payouts_by_month:
-            payouts_by_month[key] += payout['amount']
-        else:
-            payouts_by_month[key] = payout['amount']
-    
-    # Convert the dictionary to a sorted list of dictionaries
-    aggregated_payouts = sorted(
-        [{'year': year, 'month': month, 'amount': amount}
-         for (year, month), amount in payouts_by_month.items()],
-        key=lambda x: (x['year'], x['month'])
-    )
-    
-    return jsonify(aggregated_payouts)
+    # The ledger is written with the bonus payments, so this is one grouped index scan
+    now = datetime.now()
+    return jsonify(RsuPayout.aggregate(now.year, now.month))
+
+@bp.route('/api/projection', methods=['GET'])
+@require_email_authorization
+@versioned(Mortgage, BonusPayment, RsuPayout, Savings, key=lambda: datetime.now().strftime('%Y-%m'))
+def get_projection():
+    """
+    Produces the monthly cash-flow projection of the mortgages, RSU payouts and savings.
+
+    The projection is memoized per worker on the versions of its inputs, so an edit rebuilds only the stream it changes and the balances from the first month whose cash flow changed.
+
+    Args:
+        months (int, optional): A query parameter with the number of months to project from the current one, between 1 and 480. Defaults to 24.
+        format (str, optional): A query parameter with the layout, 'records' or 'columns'. Defaults to 'records'.
+
+    Returns:
+        flask.Response: A JSON response with a row per month, each with its 'month' (YYYY-MM), the total mortgage 'payment', its 'escrow', 'principal' (extra payments included) and 'interest', the RSU 'payout' and the savings 'balance' at the end of the month, or a 400 error for an invalid parameter.
+    """
+    layout = request.args.get('format', default='records')
+    if layout not in LAYOUTS:
+        abort(400, description=f"format must be one of {', '.join(LAYOUTS)}")
+    months = request.args.get('months', default=24, type=int)
+
+    try:
+        rows = project(months, datetime.now().date())
+    except ValueError as e:
+        abort(400, description=str(e))
+    return json_response(PROJECTION_FIELDS, rows, layout)
 
 @bp.route('/api/savings', methods=['POST'])
 @require_email_authorization
@@ -106,6 +237,7 @@ def create_savings():
 
 @bp.route('/api/savings/latest', methods=['GET'])
 @require_email_authorization
+@versioned(Savings)
 def get_latest_savings():
     latest_savings = Savings.get_latest()
     if latest_savings:
@@ -115,10 +247,55 @@ def get_latest_savings():
 
 @bp.route('/api/savings', methods=['GET'])
 @require_email_authorization
+@versioned(Savings)
 def get_savings():
     all_savings = Savings.get_all()
     return jsonify([savings.to_dict() for savings in all_savings])
 
+# Most points a downsampled series can be asked for
+MAX_POINTS = 10000
+
+def _datetime_arg(name):
+    value = request.args.get(name)
+    try:
+        return datetime.fromisoformat(value) if value else None
+    except ValueError:
+        abort(400, description=f"{name} must be an ISO 8601 date or time")
+
+@bp.route('/api/savings/rollup', methods=['GET'])
+@require_email_authorization
+@versioned(Savings)
+def get_savings_rollup():
+    """
+    Produces the savings balances over time, rolled up and downsampled for charting.
+
+    The balances are read with a range scan of the last_updated index and rolled up per period in SQL. Passing 'points' keeps that many points of the series with the Largest-Triangle-Three-Buckets algorithm, which preserves the peaks and troughs a chart shows.
+
+    Args:
+        bucket (str, optional): A query parameter with the period to roll up over, 'week', 'month' or 'year'. Defaults to every balance.
+        agg (str, optional): A query parameter with the aggregate of each period, 'last', 'min', 'max' or 'avg'. Defaults to 'last'.
+        points (int, optional): A query parameter with the number of points to downsample to, between 3 and 10000. Defaults to every point.
+        start (str, optional): A query parameter with the earliest date or time to include, in ISO 8601 format.
+        end (str, optional): A query parameter with the latest date or time to include, in ISO 8601 format.
+
+    Returns:
+        flask.Response: A JSON response with a 'date' array, of the times of the balances or the first days of the periods, and a 'balance' array, or a 400 error for an invalid parameter.
+    """
+    points = request.args.get('points', type=int)
+    if points is not None and not 3 <= points <= MAX_POINTS:
+        abort(400, description=f"points must be between 3 and {MAX_POINTS}")
+
+    try:
+        series = Savings.series(_datetime_arg('start'), _datetime_arg('end'), request.args.get('bucket'),
+                                request.args.get('agg', 'last'))
+    except ValueError as e:
+        abort(400, description=str(e))
+
+    if points is not None and len(series) > points:
+        times = [datetime.fromisoformat(date).timestamp() for date, _ in series]
+        series = [series[index] for index in lttb(times, [balance for _, balance in series], points).tolist()]
+    return json_response(('date', 'balance'), series, 'columns')
+
 @bp.route('/api/savings/<int:savings_id>', methods=['PUT'])
 @require_email_authorization
 def update_savings(savings_id):
@@ -140,5 +317,5 @@ def delete_savings(savings_id):
 
 @bp.route('/clearall')
 def clear_all():
-    Mortgage.clear_and_load('instance/finances.json')
+    load_file(Mortgage, 'instance/finances.json', replace=True)
     return jsonify({"status": "success", "message": "Mortgage details have been reset."})
\ No newline at end of file
@@ -0,0 +1,194 @@
+from datetime import date
+from functools import lru_cache
+from typing import NamedTuple
+
+# Schedules kept in the per-worker cache
+CACHE_SIZE = 256
+
+# Balances below this are paid off, to absorb floating point residue
+PAID_OFF = 0.005
+
+FIELDS = ('period', 'month', 'payment', 'principal', 'interest', 'extra', 'escrow', 'total_payment',
+          'balance', 'total_principal', 'total_interest')
+
+
+class Schedule(NamedTuple):
+    """
+    An amortization schedule, with a read-only NumPy array per field and one
+    element per monthly payment, up to the one paying the loan off.
+    """
+    period: object  # 1 for the first payment
+    month: object  # datetime64[M] of each payment
+    payment: object  # Scheduled principal and interest payment
+    principal: object  # Principal part of the scheduled payment
+    interest: object
+    extra: object  # Extra principal paid on top of the scheduled payment
+    escrow: object
+    total_payment: object  # payment + extra + escrow
+    balance: object  # Balance after the payment
+    total_principal: object  # Principal paid to date, extra included
+    total_interest: object  # Interest paid to date
+
+    def rows(self):
+        """Return the schedule as row tuples of plain Python values in ``FIELDS`` order, months as 'YYYY-MM'."""
+        import numpy as np
+
+        columns = [getattr(self, field).tolist() for field in FIELDS]
+        columns[1] = np.datetime_as_string(self.month, unit='M').tolist()
+        return list(zip(*columns))
+
+    def summary(self):
+        """Return the totals of the schedule as a dict of plain Python values."""
+        import numpy as np
+
+        paid = len(self.period) > 0
+        return {
+            'periods': len(self.period),
+            'monthly_payment': float(self.payment[0]) if paid else 0.0,
+            'total_interest': float(self.total_interest[-1]) if paid else 0.0,
+            'total_paid': float(self.total_payment.sum()),
+            'payoff_month': np.datetime_as_string(self.month[-1], unit='M') if paid else None,
+        }
+
+
+def monthly_payment(principal, monthly_rate, months):
+    """
+    Return the level payment repaying a loan, element-wise over NumPy arrays.
+
+    :param principal: The amount borrowed.
+    :param monthly_rate: The interest rate per month, as a fraction.
+    :param months: The number of payments.
+    """
+    import numpy as np
+
+    principal, monthly_rate, months = np.broadcast_arrays(*map(np.asarray, (principal, monthly_rate, months)))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        payment = principal * monthly_rate / -np.expm1(-months * np.log1p(monthly_rate))
+    # A loan without interest is repaid in equal parts
+    payment = np.where(monthly_rate == 0, principal / np.maximum(months, 1), payment)
+    return payment if payment.ndim else float(payment)
+
+
+def amortize(principal, annual_rate, months, extra=None, recasts=()):
+    """
+    Compute the balance after every payment of a fixed-rate loan.
+
+    The balance after ``k`` payments of a constant payment has a closed form,
+    so each run of payments between recasts is computed at once from the
+    cumulative sum of the discounted payments instead of month by month.
+
+    :param principal: The amount borrowed.
+    :param annual_rate: The annual interest rate, in percent.
+    :param months: The term of the loan in months.
+    :param extra: An array of the extra principal paid with each payment.
+    :param recasts: The 0-based periods from which the payment is recomputed
+        over the rest of the term, after extra payments.
+    :return: A tuple of arrays of the scheduled payment, interest, extra
+        principal and balance of each period, up to the one paying the loan off.
+    """
+    import numpy as np
+
+    rate = annual_rate / 12 / 100
+    extra = np.zeros(months) if extra is None else np.asarray(extra, dtype=float)
+    bounds = [0] + sorted({period for period in recasts if 0 < period < months}) + [months]
+    payments, interests, extras, balances = [], [], [], []
+    opening = float(principal)
+
+    for start, end in zip(bounds, bounds[1:]):
+        payment = monthly_payment(opening, rate, months - start)
+        growth = (1 + rate) ** np.arange(1, end - start + 1)
+        outflow = payment + extra[start:end]
+        # Balance after each payment: (1 + r)^k * (B0 - sum of the payments discounted to the start)
+        closing = growth * (opening - np.cumsum(outflow / growth))
+        openings = np.concatenate(([opening], closing[:-1]))
+        interest = openings * rate
+        scheduled = np.full(end - start, payment)
+        extra_paid = extra[start:end].copy()
+
+        paid_off = np.flatnonzero(closing < PAID_OFF)
+        if paid_off.size:
+            last = paid_off[0] + 1
+            due = openings[last - 1] + interest[last - 1]
+            scheduled, interest, extra_paid, closing = (
+                scheduled[:last], interest[:last], extra_paid[:last], closing[:last])
+            scheduled[-1] = min(payment, due)
+            extra_paid[-1] = max(due - scheduled[-1], 0.0)
+            closing[-1] = 0.0
+        payments.append(scheduled)
+        interests.append(interest)
+        extras.append(extra_paid)
+        balances.append(closing)
+        if paid_off.size:
+            break
+        opening = float(closing[-1])
+
+    return tuple(np.concatenate(parts) for parts in (payments, interests, extras, balances))
+
+
+def month_index(start, month):
+    """Return the 0-based period of a 'YYYY-MM' month in a loan starting on ``start``."""
+    year, number = map(int, month.split('-'))
+    return (year - start.year) * 12 + number - start.month
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _schedule(principal, annual_rate, term_years, start, monthly_escrow, extra_monthly, extras, escrows, recasts):
+    import numpy as np
+
+    months = int(term_years * 12)
+    extra = np.full(months, float(extra_monthly))
+    for period, amount in extras:
+        if 0 <= period < months:
+            extra[period] += amount
+
+    escrow = np.full(months, float(monthly_escrow or 0))
+    for period, amount in sorted(escrows):
+        escrow[max(period, 0):] = amount
+
+    payment, interest, extra_paid, balance = amortize(principal, annual_rate, months, extra, recasts)
+    count = len(payment)
+    principal_paid = payment - interest
+    escrow = escrow[:count]
+    schedule = Schedule(
+        period=np.arange(1, count + 1),
+        month=np.datetime64(date(start.year, start.month, 1), 'M') + np.arange(count),
+        payment=payment,
+        principal=principal_paid,
+        interest=interest,
+        extra=extra_paid,
+        escrow=escrow,
+        total_payment=payment + extra_paid + escrow,
+        balance=balance,
+        total_principal=np.cumsum(principal_paid + extra_paid),
+        total_interest=np.cumsum(interest),
+    )
+    for array in schedule:
+        array.setflags(write=False)
+    return schedule
+
+
+def mortgage_schedule(mortgage, extra_monthly=0.0, extras=(), escrows=(), recasts=()):
+    """
+    Return the amortization schedule of a mortgage, cached per version of its row.
+
+    The cache is keyed on the values of the row, so an edit to the mortgage
+    computes a new schedule and schedules of unchanged mortgages are reused
+    across requests and by other features of the worker.
+
+    :param mortgage: A ``Mortgage``.
+    :param extra_monthly: Extra principal paid with every payment.
+    :param extras: ``('YYYY-MM', amount)`` pairs of one-off extra principal payments.
+    :param escrows: ``('YYYY-MM', amount)`` pairs of the monthly escrow from that month on.
+    :param recasts: 'YYYY-MM' months from which the payment is recomputed over the rest of the term.
+    :return: A ``Schedule`` whose arrays must not be modified.
+    :raises ValueError: If a month is not in 'YYYY-MM' format.
+    """
+    start = mortgage.start_date
+    try:
+        extras = tuple(sorted((month_index(start, month), float(amount)) for month, amount in extras))
+        escrows = tuple(sorted((month_index(start, month), float(amount)) for month, amount in escrows))
+        recasts = tuple(sorted({month_index(start, month) for month in recasts}))
+    except (AttributeError, TypeError, ValueError):
+        raise ValueError("Months must be in YYYY-MM format and amounts numbers")
+    return _schedule(mortgage.principal, mortgage.interest_rate, mortgage.loan_term, start.date(),
+                     mortgage.monthly_escrow, float(extra_monthly), extras, escrows, recasts)
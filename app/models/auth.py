@@ -1,9 +1,15 @@
-from flask import session, current_app, redirect, url_for
+from flask import session, current_app, redirect, url_for, request
 import json
 import uuid
 import os
 from functools import wraps
 from datetime import datetime, timedelta
+from itsdangerous import BadSignature, URLSafeTimedSerializer
+
+# Share tokens are signed with SECRET_KEY under this salt, so they can't be
+# swapped with other signed values, and expire after SHARE_MAX_AGE seconds
+SHARE_SALT = 'map-share'
+SHARE_MAX_AGE = 90 * 24 * 3600
 
 def is_email_allowed(email, allowed_emails):
     """
@@ -44,3 +50,57 @@ def require_email_authorization(f):
             return redirect(url_for('auth.oauth2_authorize', provider='google'))
         return f(*args, **kwargs)
     return decorated_function
+
+def _share_serializer():
+    return URLSafeTimedSerializer(current_app.config['SECRET_KEY'], salt=SHARE_SALT)
+
+def share_token(which_map):
+    """
+    Sign a token letting anyone who holds it view the rendered images of a map.
+
+    Args:
+        which_map (str): The map the token is for.
+
+    Returns:
+        str: The token, for the 'token' query parameter.
+    """
+    return _share_serializer().dumps(which_map)
+
+def is_share_token_valid(token, which_map):
+    """
+    Check that a share token was signed for a map and has not expired.
+
+    Args:
+        token (str): The token, or None.
+        which_map (str): The map requested.
+
+    Returns:
+        bool: True if the token grants access to the map, False otherwise.
+    """
+    if not token:
+        return False
+    try:
+        return _share_serializer().loads(token, max_age=SHARE_MAX_AGE) == which_map
+    except BadSignature:
+        return False
+
+def require_email_or_share_token(f):
+    """
+    Decorator letting through authorized users, or requests carrying a valid share token.
+
+    The token is read from the 'token' query parameter and must have been signed by ``share_token`` for the 'which_map' of the route; any other request goes through ``require_email_authorization``.
+
+    Args:
+        f (function): The Flask view function to decorate.
+
+    Returns:
+        function: The decorated view function.
+    """
+    authorized = require_email_authorization(f)
+
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if is_share_token_valid(request.args.get('token'), kwargs.get('which_map')):
+            return f(*args, **kwargs)
+        return authorized(*args, **kwargs)
+    return decorated_function
@@ -0,0 +1,166 @@
+import uuid
+
+from sqlalchemy import delete, insert, update
+from sqlalchemy.exc import IntegrityError
+
+from app.extensions import db
+
+# Largest number of operations accepted in one batch
+MAX_BATCH_SIZE = 1000
+
+OPERATIONS = ('create', 'update', 'delete')
+
+
+class BatchMutations:
+    """
+    Mixin applying a list of create, update and delete operations in a single
+    transaction, with one bulk statement per kind of operation.
+
+    Models list the fields a create needs in ``batch_required``, may fill
+    in defaults by overriding ``batch_defaults`` and may translate payload
+    fields into columns by overriding ``column_values``.
+    """
+    batch_required = ()
+
+    @classmethod
+    def column_values(cls, data, current=None):
+        """
+        Translate the fields of an operation into column values.
+
+        :param data: A dict of fields.
+        :param current: A dict of the current column values of the entity, None for creates.
+        :raises ValueError: If a field has an invalid value.
+        """
+        return dict(data)
+
+    @classmethod
+    def batch_defaults(cls, rows):
+        """Fill in the defaults of rows about to be created."""
+        return rows
+
+    @classmethod
+    def _write_batch(cls, create_rows, update_rows, deleted):
+        if create_rows:
+            db.session.execute(insert(cls), cls.batch_defaults(create_rows))
+        if update_rows:
+            db.session.execute(update(cls), update_rows)
+        if deleted:
+            db.session.execute(delete(cls).where(cls.id.in_(deleted)))
+
+    @classmethod
+    def _write_one_by_one(cls, results, creates, update_rows, deleted, updates, deletes):
+        """
+        Apply the operations of a batch that broke a constraint one at a time,
+        each in a savepoint, reporting the ones at fault with a 409 and
+        committing the others.
+        """
+        writes = [([index], ([row], [], [])) for index, row in creates]
+        writes += [([index for index, _ in updates[row['id']]], ([], [row], [])) for row in update_rows]
+        writes += [(deletes[id], ([], [], [id])) for id in deleted]
+        try:
+            for indices, rows in writes:
+                try:
+                    with db.session.begin_nested():
+                        cls._write_batch(*rows)
+                except IntegrityError:
+                    for index in indices:
+                        result = results[index]
+                        results[index] = {key: result[key] for key in ('index', 'op', 'id')}
+                        results[index].update(status=409, error="Conflicts with another entry")
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+    @classmethod
+    def apply_batch(cls, operations):
+        """
+        Apply a batch of operations.
+
+        Every operation is a dict with an ``op`` of 'create', 'update' or
+        'delete', the entity ``id`` for updates and deletes and the fields in
+        ``data`` for creates and updates. Invalid operations are reported and
+        skipped; the valid ones are applied as creates, then updates, then
+        deletes, and committed together. When they break a constraint, such
+        as a duplicate link position, they are applied again one at a time
+        and the ones at fault are reported with a 409.
+
+        :param operations: A list of operation dicts.
+        :return: A list with a result dict per operation, holding its
+            ``index``, ``op``, HTTP-style ``status``, the entity ``id`` and
+            either the resulting ``entry`` or an ``error``.
+        """
+        columns = set(cls.__table__.columns.keys())
+        results = [None] * len(operations)
+        creates, updates, deletes = [], {}, {}
+
+        for index, operation in enumerate(operations):
+            if not isinstance(operation, dict) or operation.get('op') not in OPERATIONS:
+                results[index] = {'index': index, 'status': 400,
+                                  'error': f"op must be one of {', '.join(OPERATIONS)}"}
+                continue
+            op, data = operation['op'], operation.get('data') or {}
+            try:
+                values = cls.column_values(data) if isinstance(data, dict) else None
+            except ValueError as e:
+                results[index] = {'index': index, 'op': op, 'status': 400, 'error': str(e)}
+                continue
+            if values is None or set(values) - columns:
+                results[index] = {'index': index, 'op': op, 'status': 400, 'error': "Invalid data"}
+                continue
+
+            if op == 'create':
+                missing = [field for field in cls.batch_required if not values.get(field)]
+                if missing:
+                    results[index] = {'index': index, 'op': op, 'status': 400,
+                                      'error': f"Missing {', '.join(missing)}"}
+                    continue
+                creates.append((index, {**values, 'id': str(uuid.uuid4())}))
+            elif not operation.get('id'):
+                results[index] = {'index': index, 'op': op, 'status': 400, 'error': "Missing id"}
+            elif op == 'update':
+                fields = {key: value for key, value in data.items() if key != 'id'}
+                updates.setdefault(str(operation['id']), []).append((index, fields))
+            else:
+                deletes.setdefault(str(operation['id']), []).append(index)
+
+        ids = list(updates) + list(deletes)
+        existing = {}
+        if ids:
+            rows = db.session.query(*cls.__table__.columns).filter(cls.id.in_(ids))
+            existing = {row.id: row._asdict() for row in rows}
+
+        update_rows = []
+        for id, items in updates.items():
+            current = dict(existing.get(id) or {})
+            merged = {}
+            for index, fields in items:
+                values = cls.column_values(fields, current)
+                current.update(values)
+                merged.update(values)
+                results[index] = {'index': index, 'op': 'update', 'id': id, 'status': 200 if id in existing else 404}
+            if id in existing and merged:
+                update_rows.append({'id': id, **merged})
+        for id, indices in deletes.items():
+            for index in indices:
+                results[index] = {'index': index, 'op': 'delete', 'id': id, 'status': 200 if id in existing else 404}
+        for index, row in creates:
+            results[index] = {'index': index, 'op': 'create', 'id': row['id'], 'status': 201}
+
+        deleted = [id for id in deletes if id in existing]
+        try:
+            cls._write_batch([row for _, row in creates], update_rows, deleted)
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            cls._write_one_by_one(results, creates, update_rows, deleted, updates, deletes)
+        except Exception:
+            db.session.rollback()
+            raise
+
+        written = {result['id'] for result in results if result.get('status') in (200, 201)} - set(deletes)
+        entries = {entry.id: entry.to_dict() for entry in cls.query.filter(cls.id.in_(written))} if written else {}
+        for result in results:
+            if result.get('id') in entries:
+                result['entry'] = entries[result['id']]
+        return results
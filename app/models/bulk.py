@@ -0,0 +1,290 @@
+import datetime
+import json
+import uuid
+
+from sqlalchemy import Date, DateTime, Integer, String, delete, insert, text
+from werkzeug.http import parse_date
+
+from app.extensions import db
+from app.models.finances import BonusPayment, Mortgage, Savings
+from app.models.serialize import dumps, loads
+from app.models.travel import Links, Visited
+from app.models.travelers import Traveler
+from app.models.visits import Visit
+
+# Tables the data commands load and dump, by table name
+TABLES = {model.__table__.name: model for model in (Traveler, Visited, Visit, Links, Mortgage, BonusPayment, Savings)}
+
+FORMATS = ('ndjson', 'json')
+
+# Rows written per INSERT ... ON CONFLICT statement
+CHUNK_ROWS = 5000
+
+# Characters read from the file at a time while parsing a JSON array
+READ_SIZE = 1 << 16
+
+
+def guess_format(path):
+    """Guess the format of a data file from its extension, NDJSON unless it ends in '.json'."""
+    return 'json' if str(path).lower().endswith('.json') else 'ndjson'
+
+
+def iter_records(file, file_format, table=None):
+    """
+    Parse the records of a data file incrementally.
+
+    NDJSON files hold one object per line. JSON files hold an array of
+    objects, which is decoded one element at a time, or an object mapping
+    table names to an array or a single object, like instance/finances.json,
+    which is small enough to be decoded at once.
+
+    :param file: A text file object.
+    :param file_format: 'ndjson' or 'json'.
+    :param table: The table whose records to take from a JSON object.
+    :raises ValueError: If the file is not valid JSON or holds something other than objects.
+    """
+    if file_format == 'ndjson':
+        for number, line in enumerate(file, 1):
+            if line.strip():
+                record = loads(line)
+                if not isinstance(record, dict):
+                    raise ValueError(f"Line {number} is not an object")
+                yield record
+        return
+
+    decoder = json.JSONDecoder()
+    buffer = file.read(READ_SIZE).lstrip()
+    if buffer.startswith('{'):
+        data = json.loads(buffer + file.read())
+        records = data.get(table, []) if table else data
+        yield from [records] if isinstance(records, dict) else records
+        return
+    if not buffer.startswith('['):
+        raise ValueError("Expected a JSON array or object")
+
+    position, index, eof = 1, 0, False
+    while True:
+        # Skip the separators between elements, reading more once the buffer runs out
+        while position < len(buffer) and buffer[position] in ' \t\r\n,':
+            position += 1
+        if position == len(buffer):
+            if eof:
+                raise ValueError("Unterminated JSON array")
+            buffer, position = file.read(READ_SIZE), 0
+            eof = not buffer
+            continue
+        if buffer[position] == ']':
+            return
+        try:
+            record, end = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            # The element is cut off at the end of the buffer
+            if eof:
+                raise
+            more = file.read(READ_SIZE)
+            eof = not more
+            buffer, position = buffer[position:] + more, 0
+            continue
+        if not isinstance(record, dict):
+            raise ValueError(f"Element {index} is not an object")
+        yield record
+        position, index = end, index + 1
+
+
+def _parse_datetime(value):
+    if not isinstance(value, str):
+        return value
+    try:
+        return datetime.datetime.fromisoformat(value)
+    except ValueError:
+        # HTTP dates, as returned by the API
+        parsed = parse_date(value)
+        if parsed is None:
+            raise ValueError(f"Invalid date: {value!r}")
+        return parsed.replace(tzinfo=None)
+
+
+def _parse_date(value):
+    value = _parse_datetime(value)
+    return value.date() if isinstance(value, datetime.datetime) else value
+
+
+def _converters(model):
+    converters = {}
+    for column in model.__table__.columns:
+        if isinstance(column.type, DateTime):
+            converters[column.key] = _parse_datetime
+        elif isinstance(column.type, Date):
+            converters[column.key] = _parse_date
+    return converters
+
+
+def _upsert_statement(model, keys):
+    table = model.__table__
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    elif dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    else:
+        raise ValueError(f"Upserts are not supported on {dialect}")
+
+    statement = dialect_insert(table)
+    primary_key = [column.key for column in table.primary_key]
+    updated = {key: statement.excluded[key] for key in keys if key not in primary_key}
+    if not updated:
+        return statement.on_conflict_do_nothing(index_elements=primary_key)
+    return statement.on_conflict_do_update(index_elements=primary_key, set_=updated)
+
+
+def _write_chunk(model, rows):
+    # executemany needs the same keys in every row, so group them by key set
+    groups = {}
+    for row in rows:
+        groups.setdefault(tuple(sorted(row)), []).append(row)
+
+    primary_key = [column.key for column in model.__table__.primary_key]
+    for keys, group in groups.items():
+        if all(key in keys for key in primary_key):
+            statement = _upsert_statement(model, keys)
+        else:
+            # Rows without an integer primary key get one from the database
+            statement = insert(model.__table__)
+        db.session.execute(statement, group)
+
+
+def _sync_sequences(model):
+    """
+    Move the PostgreSQL sequences of integer primary keys past the largest
+    id, as loaded rows carry explicit ids the sequence never handed out.
+    """
+    if db.session.get_bind().dialect.name != 'postgresql':
+        return
+    table = model.__table__
+    for column in table.primary_key:
+        if isinstance(column.type, Integer):
+            # An empty table restarts the sequence at 1
+            db.session.execute(
+                text(f'SELECT setval(pg_get_serial_sequence(:table, :column), '
+                     f'COALESCE(MAX({column.name}), 1), MAX({column.name}) IS NOT NULL) FROM {table.name}'),
+                {'table': table.name, 'column': column.name},
+            )
+
+
+def load_table(model, records, replace=False, chunk_size=CHUNK_ROWS, progress=None):
+    """
+    Load records into a table in a single transaction.
+
+    Records are upserted on the primary key in chunks of ``chunk_size``, one
+    multi-row statement per chunk, so loading the same file again leaves the
+    table unchanged. Only the columns present in a record are updated. Rows
+    of tables with string primary keys are given a UUID when they have no id,
+    and on PostgreSQL the sequences of integer primary keys are moved past
+    the loaded ids.
+
+    :param model: The model of the table.
+    :param records: An iterable of record dicts, such as ``iter_records``.
+    :param replace: Delete the rows of the table first, instead of keeping the ones not in the records.
+    :param chunk_size: The number of rows written per statement.
+    :param progress: Called with the number of rows written after every chunk.
+    :return: The number of rows written.
+    :raises ValueError: If a record has unknown fields or an invalid value.
+    """
+    columns = set(model.__table__.columns.keys())
+    # Models translating payload fields into columns, such as traveler flags, do so on load too
+    translate = getattr(model, 'column_values', dict)
+    converters = _converters(model)
+    primary_key = [column for column in model.__table__.primary_key]
+    generated = [column.key for column in primary_key if isinstance(column.type, String)]
+
+    count, chunk = 0, []
+    try:
+        if replace:
+            db.session.execute(delete(model.__table__))
+        for index, record in enumerate(records):
+            row = dict(record) if record.keys() <= columns else translate(record)
+            unknown = set(row) - columns
+            if unknown:
+                raise ValueError(f"Record {index} has unknown fields: {', '.join(sorted(unknown))}")
+            for key, convert in converters.items():
+                if row.get(key) is not None:
+                    row[key] = convert(row[key])
+            for key in generated:
+                if not row.get(key):
+                    row[key] = str(uuid.uuid4())
+            chunk.append(row)
+            if len(chunk) == chunk_size:
+                _write_chunk(model, chunk)
+                count += len(chunk)
+                chunk = []
+                if progress:
+                    progress(count)
+        if chunk:
+            _write_chunk(model, chunk)
+            count += len(chunk)
+            if progress:
+                progress(count)
+        _sync_sequences(model)
+        # Models deriving other tables from this one, such as the RSU payout ledger, rebuild them here
+        if hasattr(model, 'after_load'):
+            model.after_load()
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return count
+
+
+def load_file(model, path, file_format=None, replace=False):
+    """
+    Load the rows of a table from a JSON or NDJSON file with ``load_table``.
+
+    :param model: The model of the table.
+    :param path: The path of the file.
+    :param file_format: 'ndjson' or 'json', guessed from the extension by default.
+    :param replace: Delete the rows of the table first.
+    :return: The number of rows written.
+    """
+    with open(path, 'r', encoding='utf-8') as file:
+        records = iter_records(file, file_format or guess_format(path), model.__table__.name)
+        return load_table(model, records, replace=replace)
+
+
+def _dump_value(value):
+    # Dates are written as ISO 8601 so they load back unchanged
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    return value
+
+
+def dump_table(model, file, file_format='ndjson', chunk_size=CHUNK_ROWS, progress=None):
+    """
+    Write every row of a table to a file, streaming them from the database.
+
+    :param model: The model of the table.
+    :param file: A binary file object.
+    :param file_format: 'ndjson' for one object per line, 'json' for an array.
+    :param chunk_size: The number of rows fetched and written at a time.
+    :param progress: Called with the number of rows written after every chunk.
+    :return: The number of rows written.
+    """
+    table = model.__table__
+    fields = [column.key for column in table.columns]
+    rows = (db.session.execute(table.select().order_by(*table.primary_key.columns),
+                               execution_options={'yield_per': chunk_size}))
+
+    count = 0
+    if file_format == 'json':
+        file.write(b'[')
+    for partition in rows.partitions():
+        records = [{field: _dump_value(value) for field, value in zip(fields, row)} for row in partition]
+        if file_format == 'json':
+            file.write((b',\n' if count else b'\n') + b',\n'.join(dumps(record) for record in records))
+        else:
+            file.write(b''.join(dumps(record) + b'\n' for record in records))
+        count += len(records)
+        if progress:
+            progress(count)
+    if file_format == 'json':
+        file.write(b'\n]\n' if count else b']\n')
+    return count
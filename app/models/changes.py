@@ -0,0 +1,214 @@
+from datetime import datetime
+
+from flask import Response, stream_with_context
+from sqlalchemy import event, func, select, text
+from sqlalchemy.orm import Session
+
+from app.extensions import db
+from app.models.serialize import dumps
+
+# Most changes returned at once
+MAX_CHANGES = 1000
+
+# Changes kept in the log, clients further behind reload the full list
+RETAIN_CHANGES = 10000
+
+# Milliseconds the browser waits before reconnecting to an event stream,
+# which is how often an open tab polls the log
+RETRY_MILLISECONDS = 5000
+
+# Key of the PostgreSQL advisory lock serializing the writers of the log
+CHANGE_LOG_LOCK = 0x6368616E
+
+
+class ChangeLog(db.Model):
+    """
+    An append-only log of the writes to the tables of ``ChangeFeed`` models.
+
+    Every created, updated or deleted entity gets an entry with the next
+    ``seq``, in the transaction of the write, so clients can ask for the
+    changes after the last ``seq`` they have seen. Writers of the log are
+    serialized until they commit, so entries become visible in ``seq`` order
+    and a client never skips a lower ``seq`` committed after a higher one.
+    """
+    __tablename__ = 'change_log'
+
+    seq = db.Column(db.Integer, primary_key=True)
+    table_name = db.Column(db.String(64), nullable=False)
+    entity_id = db.Column(db.String(36), nullable=False)
+    op = db.Column(db.String(6), nullable=False)  # 'upsert', 'delete' or 'reset'
+    changed_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_change_log_table_name_seq', 'table_name', 'seq'),
+    )
+
+    @classmethod
+    def latest(cls):
+        """Return the ``seq`` of the latest change, 0 if there is none."""
+        return db.session.query(func.max(cls.seq)).scalar() or 0
+
+
+class ChangeFeed:
+    """
+    Mixin logging the writes to a model in the ``ChangeLog``.
+
+    Writes through the session and bulk INSERT, UPDATE and DELETE statements
+    are both logged, so ``changes_since`` can return the entities changed
+    after a given ``seq`` instead of the whole table.
+    """
+
+    @classmethod
+    def changes_since(cls, since, limit=MAX_CHANGES):
+        """
+        Get the changes to the model after a sequence number.
+
+        Entities changed more than once are returned once, with their latest
+        change. Created and updated entities come with their current entry.
+
+        :param since: The ``seq`` of the last change already seen.
+        :param limit: The maximum number of log entries to read.
+        :return: A dict with the list of 'changes', each with its 'seq',
+            'op' ('upsert' or 'delete'), entity 'id' and, for upserts, the
+            'entry'; the 'last' sequence number read and whether there are
+            'more' changes after it. None if the changes after ``since`` were
+            pruned from the log or include a bulk write, after which the
+            full list has to be reloaded.
+        """
+        oldest = db.session.query(func.min(ChangeLog.seq)).scalar()
+        if oldest is not None and since < oldest - 1:
+            return None
+
+        rows = (db.session.query(ChangeLog.seq, ChangeLog.entity_id, ChangeLog.op)
+                .filter(ChangeLog.table_name == cls.__table__.name, ChangeLog.seq > since)
+                .order_by(ChangeLog.seq)
+                .limit(limit + 1)
+                .all())
+        more = len(rows) > limit
+        rows = rows[:limit]
+        if any(op == 'reset' for _, _, op in rows):
+            return None
+
+        latest = {}
+        for seq, entity_id, op in rows:
+            latest.pop(entity_id, None)
+            latest[entity_id] = (seq, op)
+
+        upserted = [entity_id for entity_id, (_, op) in latest.items() if op == 'upsert']
+        entries = {}
+        if upserted:
+            fields, entity_rows = cls.select_rows(cls.id.in_(upserted))
+            entries = {entry['id']: entry for entry in (dict(zip(fields, row)) for row in entity_rows)}
+
+        changes = []
+        for entity_id, (seq, op) in latest.items():
+            if entity_id in entries:
+                changes.append({'seq': seq, 'op': 'upsert', 'id': entity_id, 'entry': entries[entity_id]})
+            else:
+                changes.append({'seq': seq, 'op': 'delete', 'id': entity_id})
+        return {'changes': changes, 'last': rows[-1][0] if rows else since, 'more': more}
+
+
+def change_stream(model, since):
+    """
+    Build a Server-Sent Events response pushing the changes to a model.
+
+    Each change is sent as a 'change' event with its ``seq`` as the event id,
+    so the browser resumes from the last one it received when it reconnects.
+    The stream sends the changes in the log and ends right away, so an open
+    tab never holds a worker thread; the browser reconnects after
+    ``RETRY_MILLISECONDS``, which makes it a cheap poll. A 'reset' event
+    tells the client it fell too far behind and must reload the full list.
+
+    :param model: A ``ChangeFeed`` model.
+    :param since: The ``seq`` of the last change already seen.
+    """
+    def events():
+        cursor = since
+        yield f"retry: {RETRY_MILLISECONDS}\n\n"
+        while True:
+            feed = model.changes_since(cursor)
+            if feed is None:
+                yield "event: reset\ndata: {}\n\n"
+                return
+            for change in feed['changes']:
+                yield f"id: {change['seq']}\nevent: change\ndata: {dumps(change).decode()}\n\n"
+            cursor = feed['last']
+            if not feed['more']:
+                return
+
+    response = Response(stream_with_context(events()), mimetype='text/event-stream')
+    response.cache_control.no_cache = True
+    # Keep nginx from buffering the events
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def _feed_tables():
+    return {model.__table__.name: model for model in ChangeFeed.__subclasses__()}
+
+
+def record_changes(connection, changes):
+    """
+    Append changes to the log within the transaction of ``connection``, and
+    prune the entries older than the latest ``RETAIN_CHANGES``.
+
+    A write of more than ``MAX_CHANGES`` entities, such as a restore, is
+    logged as a single 'reset' of each table instead, since reloading the
+    full list is cheaper for clients than that many deltas.
+
+    :param connection: The connection of the transaction writing the entities.
+    :param changes: A list of ``(table_name, entity_id, op)`` tuples.
+    """
+    if len(changes) > MAX_CHANGES:
+        changes = [(table_name, '', 'reset') for table_name in sorted({change[0] for change in changes})]
+    if connection.dialect.name == 'postgresql':
+        # Held until commit, so a seq is never committed after a higher one.
+        # SQLite already serializes writers with its database lock.
+        connection.execute(text('SELECT pg_advisory_xact_lock(:key)'), {'key': CHANGE_LOG_LOCK})
+    table = ChangeLog.__table__
+    now = datetime.utcnow()
+    connection.execute(table.insert(), [
+        {'table_name': table_name, 'entity_id': str(entity_id), 'op': op, 'changed_at': now}
+        for table_name, entity_id, op in changes
+    ])
+    cutoff = select(func.max(table.c.seq) - RETAIN_CHANGES).scalar_subquery()
+    connection.execute(table.delete().where(table.c.seq <= cutoff))
+
+
+@event.listens_for(Session, 'after_flush')
+def _log_flushed_changes(session, flush_context):
+    tables = _feed_tables()
+    changes = [(obj.__table__.name, obj.id, 'upsert') for obj in session.new if obj.__table__.name in tables]
+    changes += [(obj.__table__.name, obj.id, 'upsert') for obj in session.dirty
+                if obj.__table__.name in tables and session.is_modified(obj)]
+    changes += [(obj.__table__.name, obj.id, 'delete') for obj in session.deleted if obj.__table__.name in tables]
+    if changes:
+        record_changes(session.connection(), changes)
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _log_bulk_changes(orm_execute_state):
+    # Bulk statements bypass the flush, so take the ids from their parameters,
+    # or select the rows their WHERE clause matches before they run
+    if not (orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete):
+        return
+    statement = orm_execute_state.statement
+    if statement.table.name not in _feed_tables():
+        return
+
+    parameters = orm_execute_state.parameters
+    rows = parameters if isinstance(parameters, list) else [parameters] if parameters else []
+    if orm_execute_state.is_insert or (rows and all(row.get('id') is not None for row in rows)):
+        ids = [row['id'] for row in rows if row.get('id') is not None]
+    elif getattr(statement, 'whereclause', None) is None:
+        # Every row is written
+        record_changes(orm_execute_state.session.connection(), [(statement.table.name, '', 'reset')])
+        return
+    else:
+        query = select(statement.table.c.id).where(statement.whereclause)
+        ids = orm_execute_state.session.connection().execute(query).scalars().all()
+
+    op = 'delete' if orm_execute_state.is_delete else 'upsert'
+    if ids:
+        record_changes(orm_execute_state.session.connection(), [(statement.table.name, id, op) for id in ids])
@@ -0,0 +1,44 @@
+def lttb(x, y, threshold):
+    """
+    Pick the points of a series that keep its shape, with Largest-Triangle-Three-Buckets.
+
+    The first and last points are kept. The points in between are split
+    into ``threshold - 2`` buckets, and from each the point forming the
+    largest triangle with the point kept from the previous bucket and the
+    average of the next bucket is kept.
+
+    :param x: A sequence of increasing x values, such as timestamps.
+    :param y: A sequence of y values, of the same length.
+    :param threshold: The number of points to keep, at least 3.
+    :return: A NumPy array of the indices of the points kept, in order, or
+        of every point if there are no more than ``threshold``.
+    """
+    import numpy as np
+
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    count = len(x)
+    if threshold >= count or threshold < 3:
+        return np.arange(count)
+
+    # Bucket i covers [edges[i], edges[i + 1]), the last one ends before the last point
+    edges = (np.arange(threshold - 1) * ((count - 2) / (threshold - 2))).astype(int) + 1
+    edges[-1] = count - 1
+    # Prefix sums give the average of every bucket without a loop
+    x_sums = np.concatenate(([0.0], np.cumsum(x)))
+    y_sums = np.concatenate(([0.0], np.cumsum(y)))
+    next_starts = edges[1:]
+    next_ends = np.append(edges[2:], count)
+    next_x = (x_sums[next_ends] - x_sums[next_starts]) / (next_ends - next_starts)
+    next_y = (y_sums[next_ends] - y_sums[next_starts]) / (next_ends - next_starts)
+
+    indices = np.empty(threshold, dtype=int)
+    indices[0], indices[-1] = 0, count - 1
+    previous = 0
+    for bucket in range(threshold - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        ax, ay = x[previous], y[previous]
+        areas = np.abs((ax - next_x[bucket]) * (y[start:end] - ay) - (ax - x[start:end]) * (next_y[bucket] - ay))
+        previous = start + int(np.argmax(areas))
+        indices[bucket + 1] = previous
+    return indices
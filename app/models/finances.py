@@ -3,13 +3,16 @@ import uuid
 from flask_sqlalchemy import SQLAlchemy
 from flask import abort
 from datetime import datetime
+from sqlalchemy import and_, delete, func, insert, or_, select
 from sqlalchemy.exc import IntegrityError
 
 
 from app.extensions import db
+from app.models.lookup import PrimaryKeyLookup
+from app.models.serialize import Serializable
 
 
-class Mortgage(db.Model):
+class Mortgage(PrimaryKeyLookup, Serializable, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     principal = db.Column(db.Float, nullable=False)
     interest_rate = db.Column(db.Float, nullable=False)
@@ -20,17 +23,10 @@ class Mortgage(db.Model):
     def __str__(self):
         return str(self.__class__) + ": " + str(self.__dict__)
     
-    def to_dict(self):
-        return {column.name: getattr(self, column.name) for column in self.__table__.columns}
-    
     @staticmethod
     def get_all():
         return Mortgage.query.all()
     
-    @staticmethod
-    def get_by_id(mortgage_id):
-        return Mortgage.query.get(mortgage_id)
-
     @staticmethod
     def create_from_json(json_data):
         new_mortgage = Mortgage(**json_data)
@@ -73,34 +69,31 @@ class Mortgage(db.Model):
 
         return total_monthly_payment
 
-    
-    @classmethod
-    def clear_and_load(cls, json_file_path):
-        # Clear existing data
-        cls.query.delete()
-        db.session.commit()
+# RSUs pay out in equal parts in these months, starting the year after they are assigned
+RSU_PAYOUT_MONTHS = (6, 12)
 
-        # Load new data from JSON file
-        with open(json_file_path, 'r') as file:
-            data = json.load(file)
-            mortgage_data = data['mortgage']
-            new_mortgage = cls(
-                principal=mortgage_data['principal'],
-                interest_rate=mortgage_data['interest_rate'],
-                start_date=mortgage_data['start_date'],
-                loan_term=mortgage_data['loan_term'],
-                monthly_escrow=mortgage_data['monthly_escrow']
-            )
-            db.session.add(new_mortgage)
-            db.session.commit()
+# Number of RSU payouts
+RSU_PAYOUTS = 6
 
-class BonusPayment(db.Model):
+
+class BonusPayment(PrimaryKeyLookup, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     bonus_type = db.Column(db.String(50), nullable=False)  # 'cash' or 'rsu'
     amount = db.Column(db.Float, nullable=False)
     payment_date = db.Column(db.DateTime, nullable=False)
     year_assigned = db.Column(db.Integer, nullable=False)
 
+    payouts = db.relationship('RsuPayout', cascade='all, delete-orphan')
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'bonus_type': self.bonus_type,
+            'amount': self.amount,
+            'payment_date': self.payment_date.strftime('%Y-%m-%d'),
+            'year_assigned': self.year_assigned,
+        }
+
     # Function to add a bonus payment to the database
     def add_bonus_payment(bonus_type, amount, payment_date, year_assigned):
         try:
@@ -110,6 +103,7 @@ class BonusPayment(db.Model):
                 payment_date=payment_date,
                 year_assigned=year_assigned
             )
+            new_bonus_payment.schedule_payouts()
             db.session.add(new_bonus_payment)
             db.session.commit()
             return new_bonus_payment  # Return the newly created BonusPayment object
@@ -117,49 +111,126 @@ class BonusPayment(db.Model):
             db.session.rollback()
             abort(500, description=str(e))  # Use Flask's abort to return an error
 
-    def get_cash_bonus(self, year):
-        # Assuming the cash bonus is received every December
-        return self.cash_bonus if year == self.year_assigned else 0
+    @classmethod
+    def update_by_id(cls, bonus_payment_id, data):
+        """
+        Update a bonus payment and reschedule its RSU payouts.
 
-    def get_rsu_payment(self, year, month):
-        # Assuming RSUs pay out 1/6th in June and December, starting the year after they're assigned
-        if year > self.year_assigned and month in [6, 12]:
-            return self.rsu_value / 6
-        return 0
+        :param bonus_payment_id: The id of the bonus payment.
+        :param data: A dict of the fields to change.
+        :return: The updated bonus payment, or None if it does not exist.
+        """
+        bonus_payment = cls.get_by_id(bonus_payment_id)
+        if bonus_payment is None:
+            return None
+        for key in ('bonus_type', 'amount', 'payment_date', 'year_assigned'):
+            if key in data:
+                setattr(bonus_payment, key, data[key])
+        bonus_payment.schedule_payouts()
+        db.session.commit()
+        return bonus_payment
 
-    def calculate_upcoming_rsu_payouts(self):
-        # This method assumes RSUs pay out 1/6th in June and December, starting the year after they're assigned
+    @classmethod
+    def delete_by_id(cls, bonus_payment_id):
+        bonus_payment = cls.get_by_id(bonus_payment_id)
+        if bonus_payment:
+            db.session.delete(bonus_payment)
+            db.session.commit()
+            return True
+        return False
+
+    def payout_schedule(self):
+        """
+        Return the RSU payouts of the bonus, 1/6th every June and December
+        starting the year after it was assigned, none for cash bonuses.
+
+        :return: A list of ``(year, month, amount)`` tuples.
+        """
         if self.bonus_type != 'rsu':
             return []
-
         payouts = []
-        current_year = datetime.now().year
-        current_month = datetime.now().month
-        payouts_remaining = 6  # Total number of payouts for RSUs
-
-        # Calculate the payouts starting from the June following the assignment year
-        for year in range(self.year_assigned + 1, self.year_assigned + 10):
-            for month in [6, 12]:
-                if year > current_year or (year == current_year and month >= current_month):
-                    payouts.append({
-                        'year': year,
-                        'month': month,
-                        'amount': self.amount / 6
-                    })
-                    payouts_remaining -= 1
-                    if payouts_remaining == 0:
-                        return payouts  # Stop after 6 payouts
+        for index in range(RSU_PAYOUTS):
+            year = self.year_assigned + 1 + index // len(RSU_PAYOUT_MONTHS)
+            payouts.append((year, RSU_PAYOUT_MONTHS[index % len(RSU_PAYOUT_MONTHS)], self.amount / RSU_PAYOUTS))
         return payouts
 
+    def schedule_payouts(self):
+        """Replace the payouts of the bonus in the ledger with its ``payout_schedule``."""
+        self.payouts = [RsuPayout(year=year, month=month, amount=amount)
+                        for year, month, amount in self.payout_schedule()]
+
+    @classmethod
+    def after_load(cls):
+        # Bulk loads bypass schedule_payouts, so rebuild the whole ledger
+        RsuPayout.rebuild()
+
     @staticmethod
     def find_all_rsu_payments():
         return BonusPayment.query.filter_by(bonus_type='rsu').all()
 
-class Savings(db.Model):
+
+class RsuPayout(db.Model):
+    """
+    The payout ledger of RSU bonuses, one row per scheduled payout.
+
+    Rows are written with their bonus payment, so the upcoming payouts per
+    month are a grouped range scan of the ``(year, month)`` index instead of
+    expanding every grant on each request.
+    """
+    __tablename__ = 'rsu_payout'
+
+    id = db.Column(db.Integer, primary_key=True)
+    bonus_payment_id = db.Column(db.Integer, db.ForeignKey('bonus_payment.id', ondelete='CASCADE'),
+                                 nullable=False, index=True)
+    year = db.Column(db.Integer, nullable=False)
+    month = db.Column(db.Integer, nullable=False)
+    amount = db.Column(db.Float, nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_rsu_payout_year_month_amount', 'year', 'month', 'amount'),
+    )
+
+    @classmethod
+    def aggregate(cls, year, month):
+        """
+        Total the payouts per month, from a month on.
+
+        :param year: The year of the first month.
+        :param month: The first month, 1 to 12.
+        :return: A list of dicts with the 'year', 'month' and total 'amount', in month order.
+        """
+        rows = (db.session.query(cls.year, cls.month, func.sum(cls.amount))
+                .filter(or_(cls.year > year, and_(cls.year == year, cls.month >= month)))
+                .group_by(cls.year, cls.month)
+                .order_by(cls.year, cls.month))
+        return [{'year': year, 'month': month, 'amount': amount} for year, month, amount in rows]
+
+    @classmethod
+    def rebuild(cls):
+        """Rewrite the whole ledger from the bonus payments, within the current transaction."""
+        db.session.execute(delete(cls))
+        rows = [{'bonus_payment_id': bonus_payment.id, 'year': year, 'month': month, 'amount': amount}
+                for bonus_payment in BonusPayment.query.filter_by(bonus_type='rsu')
+                for year, month, amount in bonus_payment.payout_schedule()]
+        if rows:
+            db.session.execute(insert(cls), rows)
+
+# Periods savings balances are rolled up over
+BUCKETS = ('week', 'month', 'year')
+
+# Aggregates of the balances in a period; 'last' is the latest balance
+AGGREGATES = ('last', 'min', 'max', 'avg')
+
+
+class Savings(PrimaryKeyLookup, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     balance = db.Column(db.Float, nullable=False)
     last_updated = db.Column(db.DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        db.Index('ix_savings_last_updated', 'last_updated'),
+    )
+
     def to_dict(self):
         return {
             'id': self.id,
@@ -182,9 +253,61 @@ class Savings(db.Model):
     def get_all(cls):
         return cls.query.all()
 
+    @classmethod
+    def _bucket(cls, bucket):
+        # The first day of the period of last_updated, as 'YYYY-MM-DD'
+        if db.session.get_bind().dialect.name == 'postgresql':
+            return func.to_char(func.date_trunc(bucket, cls.last_updated), 'YYYY-MM-DD')
+        if bucket == 'week':
+            # Weeks start on Monday, like date_trunc
+            return func.date(cls.last_updated, '-6 days', 'weekday 1')
+        return func.strftime('%Y-01-01' if bucket == 'year' else '%Y-%m-01', cls.last_updated)
+
+    @classmethod
+    def series(cls, start=None, end=None, bucket=None, agg='last'):
+        """
+        Load the balances in date order, optionally rolled up per period in SQL.
+
+        :param start: The earliest time to include, defaults to the first balance.
+        :param end: The latest time to include, defaults to the last balance.
+        :param bucket: 'week', 'month' or 'year' to roll the balances up per
+            period, None for every balance.
+        :param agg: How the balances of a period are rolled up, 'last', 'min', 'max' or 'avg'.
+        :return: A list of ``(date, balance)`` tuples, the date being the time
+            of the balance, or the first day of the period as 'YYYY-MM-DD'.
+        :raises ValueError: If the bucket or the aggregate is unknown.
+        """
+        if bucket is not None and bucket not in BUCKETS:
+            raise ValueError(f"bucket must be one of {', '.join(BUCKETS)}")
+        if agg not in AGGREGATES:
+            raise ValueError(f"agg must be one of {', '.join(AGGREGATES)}")
+
+        # Range scans of the last_updated index
+        criteria = [cls.last_updated.isnot(None)]
+        if start is not None:
+            criteria.append(cls.last_updated >= start)
+        if end is not None:
+            criteria.append(cls.last_updated <= end)
+
+        if bucket is None:
+            query = select(cls.last_updated, cls.balance).where(*criteria).order_by(cls.last_updated, cls.id)
+            return [(updated.isoformat(), balance) for updated, balance in db.session.execute(query)]
+
+        period = cls._bucket(bucket).label('period')
+        if agg == 'last':
+            latest = func.row_number().over(partition_by=period, order_by=(cls.last_updated.desc(), cls.id.desc()))
+            ranked = select(period, cls.balance, latest.label('rank')).where(*criteria).subquery()
+            query = (select(ranked.c.period, ranked.c.balance)
+                     .where(ranked.c.rank == 1)
+                     .order_by(ranked.c.period))
+        else:
+            aggregate = {'min': func.min, 'max': func.max, 'avg': func.avg}[agg]
+            query = select(period, aggregate(cls.balance)).where(*criteria).group_by(period).order_by(period)
+        return [(period, float(balance)) for period, balance in db.session.execute(query)]
+
     @classmethod
     def update(cls, savings_id, balance):
-        savings = cls.query.get(savings_id)
+        savings = cls.get_by_id(savings_id)
         if savings:
             savings.balance = balance
             db.session.commit()
@@ -193,7 +316,7 @@ class Savings(db.Model):
 
     @classmethod
     def delete(cls, savings_id):
-        savings = cls.query.get(savings_id)
+        savings = cls.get_by_id(savings_id)
         if savings:
             db.session.delete(savings)
             db.session.commit()
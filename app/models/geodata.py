@@ -0,0 +1,287 @@
+import glob
+import gzip
+import hashlib
+import json
+import os
+
+# Shapefiles the travel maps are compiled from. ``name_field`` is the
+# attribute stored in ``Visited.name`` and ``code_field`` a stable per-feature
+# code carried along for joins.
+LAYERS = {
+    'world': {
+        'source': 'country_data/ne_110m_admin_0_countries.shp',
+        'name_field': 'NAME_EN',
+        'code_field': 'ADM0_A3',
+    },
+    'states': {
+        'source': 'zip://country_data/cb_2018_us_state_500k.zip!cb_2018_us_state_500k.shp',
+        'name_field': 'NAME',
+        'code_field': 'STUSPS',
+    },
+    'cities': {
+        'source': 'country_data/tl_2023_us_uac20.shp',
+        'name_field': 'NAME20',
+        'code_field': 'UACE20',
+    },
+}
+
+# Detail levels emitted for every layer. ``tolerance`` is the simplification
+# tolerance in degrees, ``precision`` the number of decimals kept per
+# coordinate.
+LEVELS = {
+    'low': {'tolerance': 0.05, 'precision': 2},
+    'medium': {'tolerance': 0.01, 'precision': 3},
+    'high': {'tolerance': 0.001, 'precision': 4},
+}
+
+# Directory the compiled artifacts are written to and served from
+data_dir = 'app/static/data'
+
+# Maps '<which_map>.<level>' to the content-hashed artifact file name
+manifest_name = 'manifest.json'
+
+
+def read_layer(which_map):
+    """
+    Stream the features of the source shapefile of a layer.
+
+    The shapefile is read one record at a time so large layers can be built
+    on small machines. The NAD83 sources are taken as-is; they differ from
+    WGS84 by less than the coordinate precision kept.
+
+    :param which_map: A key of ``LAYERS``.
+    :return: A generator of ``(properties, geometry)`` tuples, where
+        properties holds the feature ``name`` and ``code``.
+    """
+    from app.models.shapefile import iter_shapefile
+
+    layer = LAYERS[which_map]
+    for attributes, geometry in iter_shapefile(layer['source']):
+        if geometry is not None:
+            yield {'name': attributes[layer['name_field']], 'code': attributes[layer['code_field']]}, geometry
+
+
+def compile_features(features, levels, outputs):
+    """
+    Simplify and quantize features into compact GeoJSON documents, one per
+    detail level, in a single pass.
+
+    Every feature is written to the outputs as soon as it is compiled, so
+    only one source feature is held in memory at a time.
+
+    :param features: An iterable of ``(properties, geometry)`` tuples.
+    :param levels: A dict mapping each level to its ``tolerance`` in degrees,
+        0 to keep every vertex, and ``precision``, the number of decimals
+        kept per coordinate.
+    :param outputs: A dict mapping each level to a text file object.
+    :return: A dict mapping each level to its total vertex count.
+    """
+    import numpy as np
+    import shapely
+
+    vertices = dict.fromkeys(levels, 0)
+    for output in outputs.values():
+        output.write('{"type":"FeatureCollection","features":[')
+    for properties, source in features:
+        for level, options in levels.items():
+            geometry = source
+            if options['tolerance']:
+                geometry = geometry.simplify(options['tolerance'], preserve_topology=True)
+            geometry = shapely.transform(geometry, lambda coords: np.round(coords, options['precision']))
+            if geometry.is_empty:
+                continue
+            feature = {
+                'type': 'Feature',
+                'properties': properties,
+                'geometry': shapely.geometry.mapping(geometry),
+            }
+            output = outputs[level]
+            output.write((',' if vertices[level] else '') + json.dumps(feature, separators=(',', ':')))
+            vertices[level] += shapely.get_num_coordinates(geometry)
+    for output in outputs.values():
+        output.write(']}')
+    return vertices
+
+
+def artifact_name(which_map, level, digest):
+    return f'{which_map}.{level}.{digest}.json'
+
+
+class ArtifactWriter:
+    """
+    A text file object writing an artifact as it is produced, with a pre-compressed sibling.
+
+    The text is hashed and compressed chunk by chunk into temporary files,
+    which ``close`` moves to their content-hashed names. The ``.gz`` sibling
+    is served by nginx's ``gzip_static``.
+    """
+
+    def __init__(self, output_dir, which_map, level):
+        self.output_dir = output_dir
+        self.which_map = which_map
+        self.level = level
+        self._temp_path = os.path.join(output_dir, f'{which_map}.{level}.{os.getpid()}.tmp')
+        self._hash = hashlib.sha256()
+        self._file = open(self._temp_path, 'wb')
+        # No file name and a fixed mtime keep the compressed output reproducible
+        self._gzip_file = open(self._temp_path + '.gz', 'wb')
+        self._gzip = gzip.GzipFile(filename='', mode='wb', compresslevel=9, mtime=0, fileobj=self._gzip_file)
+
+    def write(self, text):
+        data = text.encode()
+        self._hash.update(data)
+        self._file.write(data)
+        self._gzip.write(data)
+
+    def close(self):
+        """
+        Move the artifact to its content-hashed name, removing the artifacts
+        of earlier builds of the same layer and level.
+
+        :return: The file name of the artifact.
+        """
+        self._file.close()
+        self._gzip.close()
+        self._gzip_file.close()
+
+        name = artifact_name(self.which_map, self.level, self._hash.hexdigest()[:12])
+        for stale in glob.glob(os.path.join(self.output_dir, artifact_name(self.which_map, self.level, '*') + '*')):
+            if not os.path.basename(stale).startswith(name):
+                os.remove(stale)
+        path = os.path.join(self.output_dir, name)
+        for suffix in ('', '.gz'):
+            os.replace(self._temp_path + suffix, path + suffix)
+        return name
+
+    def discard(self):
+        """Remove the temporary files of an artifact that failed to build."""
+        for file in (self._file, self._gzip_file):
+            file.close()
+            os.remove(file.name)
+
+
+# Characters of an artifact read at a time
+READ_SIZE = 1 << 20
+
+
+def iter_artifact(name, directory=data_dir):
+    """
+    Stream the features of an artifact.
+
+    Features are decoded one at a time out of a buffer of the file, so only
+    a chunk of the text and a feature are held in memory.
+
+    :param name: The file name of the artifact.
+    :param directory: The directory of the artifact.
+    :return: A generator of GeoJSON feature dicts.
+    :raises ValueError: If the artifact is not a feature collection or is truncated.
+    """
+    decoder = json.JSONDecoder()
+    with open(os.path.join(directory, name), 'r') as file:
+        buffer = file.read(READ_SIZE)
+        marker = buffer.find('"features"')
+        position = buffer.find('[', marker) + 1
+        if marker < 0 or not position:
+            raise ValueError(f"{name} is not a feature collection")
+
+        while True:
+            while position < len(buffer) and buffer[position] in ', \t\r\n':
+                position += 1
+            if position < len(buffer):
+                if buffer[position] == ']':
+                    return
+                try:
+                    feature, position = decoder.raw_decode(buffer, position)
+                except json.JSONDecodeError:
+                    pass
+                else:
+                    yield feature
+                    continue
+            # The next feature runs past the buffer, read at least as much again
+            more = file.read(max(READ_SIZE, len(buffer) - position))
+            if not more:
+                raise ValueError(f"{name} is truncated")
+            buffer = buffer[position:] + more
+            position = 0
+
+
+def update_manifest(output_dir, entries):
+    """Merge ``entries`` into the manifest of ``output_dir``."""
+    path = os.path.join(output_dir, manifest_name)
+    manifest = {}
+    if os.path.exists(path):
+        with open(path, 'r') as file:
+            manifest = json.load(file)
+    manifest.update(entries)
+
+    temp_path = f'{path}.{os.getpid()}.tmp'
+    with open(temp_path, 'w') as file:
+        json.dump(manifest, file, indent=4, sort_keys=True)
+    os.replace(temp_path, path)
+
+
+_manifest_cache = {'mtime': None, 'manifest': {}}
+
+
+def load_manifest():
+    """
+    Return the manifest of the built artifacts.
+
+    The manifest is re-read whenever it changes on disk, so a rebuild is
+    picked up without restarting the workers.
+    """
+    path = os.path.join(data_dir, manifest_name)
+    mtime = os.stat(path).st_mtime
+    if _manifest_cache['mtime'] != mtime:
+        with open(path, 'r') as file:
+            _manifest_cache['manifest'] = json.load(file)
+        _manifest_cache['mtime'] = mtime
+    return _manifest_cache['manifest']
+
+
+def artifact_file(which_map, level):
+    """Resolve the current file name of an artifact through the manifest."""
+    return load_manifest()[f'{which_map}.{level}']
+
+
+def available_layers(level='low'):
+    """Return the layers that have been built, in ``LAYERS`` order."""
+    manifest = load_manifest()
+    return [which_map for which_map in LAYERS if f'{which_map}.{level}' in manifest]
+
+
+def build_layer(which_map, output_dir=data_dir):
+    """
+    Compile every detail level of a layer into ``output_dir``.
+
+    :param which_map: A key of ``LAYERS``.
+    :param output_dir: Directory the artifacts are written to.
+    :return: A list of dicts with the ``path``, ``bytes``, ``gzip_bytes`` and
+        ``vertices`` of each artifact.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+
+    # The shapefile is streamed once and every level is written as it goes
+    writers = {level: ArtifactWriter(output_dir, which_map, level) for level in LEVELS}
+    try:
+        vertices = compile_features(read_layer(which_map), LEVELS, writers)
+    except Exception:
+        for writer in writers.values():
+            writer.discard()
+        raise
+
+    artifacts = []
+    entries = {}
+    for level, writer in writers.items():
+        name = writer.close()
+        entries[f'{which_map}.{level}'] = name
+        path = os.path.join(output_dir, name)
+        artifacts.append({
+            'path': path,
+            'bytes': os.path.getsize(path),
+            'gzip_bytes': os.path.getsize(path + '.gz'),
+            'vertices': vertices[level],
+        })
+    update_manifest(output_dir, entries)
+    return artifacts
+
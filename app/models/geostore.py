@@ -0,0 +1,227 @@
+import glob
+import itertools
+import json
+import mmap
+import os
+import shutil
+import struct
+import tempfile
+
+from flask import current_app
+
+from app.models.geodata import artifact_file, artifact_name, iter_artifact
+
+
+MAGIC = b'GEOM'
+VERSION = 1
+
+# Magic, version and the counts of features, polygons, rings, coordinates and
+# bytes of the properties JSON, padded to 32 bytes
+HEADER = struct.Struct('<4s6I4x')
+
+# Features converted at once when a store is written
+BATCH_SIZE = 1000
+
+_store_cache = {}
+
+
+def write_store(path, features, batch_size=BATCH_SIZE):
+    """
+    Write features to a binary geometry store.
+
+    The file holds the header, then a float32 bounding box per feature, the
+    uint32 offsets of polygons per feature, rings per polygon and
+    coordinates per ring, the flat float32 coordinate array and finally the
+    feature properties as JSON. Every section is 4-byte aligned so it can be
+    mapped as a numpy array without copying.
+
+    Features are converted ``batch_size`` at a time and every section is
+    spooled to a temporary file, so memory does not grow with the layer.
+
+    :param path: The file to write.
+    :param features: An iterable of ``(properties, geometry)`` tuples, with
+        Polygon or MultiPolygon geometries.
+    :param batch_size: The number of features converted at once.
+    """
+    import numpy as np
+    import shapely
+
+    # Bounding boxes, feature, polygon and ring offsets, coordinates and properties
+    sections = [tempfile.TemporaryFile() for _ in range(6)]
+    bboxes, feature_file, polygon_file, ring_file, coords_file, props_file = sections
+    for offsets_file in (feature_file, polygon_file, ring_file):
+        offsets_file.write(np.zeros(1, dtype='<u4').tobytes())
+    counts = {'features': 0, 'polygons': 0, 'rings': 0, 'coords': 0}
+    props_file.write(b'[')
+
+    features = iter(features)
+    while batch := list(itertools.islice(features, batch_size)):
+        geometries = np.empty(len(batch), dtype=object)
+        geometries[:] = [geometry for _, geometry in batch]
+        # Polygons are stored as single-part multipolygons, so every batch has three levels of offsets
+        polygons = shapely.get_type_id(geometries) == shapely.GeometryType.POLYGON
+        geometries[polygons] = shapely.multipolygons(geometries[polygons][:, None])
+        _, coords, (ring_offsets, polygon_offsets, feature_offsets) = shapely.to_ragged_array(geometries)
+        bboxes.write(shapely.bounds(geometries).astype('<f4').tobytes())
+        # Offsets continue from the previous batches
+        feature_file.write((feature_offsets[1:] + counts['polygons']).astype('<u4').tobytes())
+        polygon_file.write((polygon_offsets[1:] + counts['rings']).astype('<u4').tobytes())
+        ring_file.write((ring_offsets[1:] + counts['coords']).astype('<u4').tobytes())
+        coords_file.write(coords.astype('<f4').tobytes())
+        for index, (properties, _) in enumerate(batch):
+            separator = b',' if counts['features'] or index else b''
+            props_file.write(separator + json.dumps(properties, separators=(',', ':')).encode())
+        counts['features'] += len(batch)
+        counts['polygons'] += len(polygon_offsets) - 1
+        counts['rings'] += len(ring_offsets) - 1
+        counts['coords'] += len(coords)
+    props_file.write(b']')
+
+    temp_path = f'{path}.{os.getpid()}.tmp'
+    with open(temp_path, 'wb') as file:
+        file.write(HEADER.pack(MAGIC, VERSION, counts['features'], counts['polygons'], counts['rings'],
+                               counts['coords'], props_file.tell()))
+        for section in sections:
+            section.seek(0)
+            shutil.copyfileobj(section, file)
+            section.close()
+    os.replace(temp_path, path)
+
+
+class GeometryStore:
+    """
+    Read-only view of a binary geometry store opened with ``mmap``.
+
+    All arrays are views into the mapped file, so every worker process that
+    opens the same store shares the same physical pages. Shapely geometries
+    are only built for the features a caller asks for.
+    """
+
+    def __init__(self, path):
+        import numpy as np
+
+        with open(path, 'rb') as file:
+            self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, features, polygons, rings, coords, props_length = HEADER.unpack_from(self._mmap)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} geometry store")
+
+        offset = HEADER.size
+
+        def section(dtype, count):
+            nonlocal offset
+            array = np.frombuffer(self._mmap, dtype=dtype, count=count, offset=offset)
+            offset += array.nbytes
+            return array
+
+        self.bboxes = section('<f4', features * 4).reshape(-1, 4)
+        self.feature_offsets = section('<u4', features + 1)
+        self.polygon_offsets = section('<u4', polygons + 1)
+        self.ring_offsets = section('<u4', rings + 1)
+        self.coords = section('<f4', coords * 2).reshape(-1, 2)
+        self._props_range = (offset, offset + props_length)
+        self._properties = None
+
+    def __len__(self):
+        return len(self.bboxes)
+
+    @property
+    def properties(self):
+        """The list of feature property dicts, decoded on first access."""
+        if self._properties is None:
+            self._properties = json.loads(self._mmap[slice(*self._props_range)])
+        return self._properties
+
+    def query_bbox(self, minx, miny, maxx, maxy):
+        """Return the indices of the features whose bounding box intersects the given one."""
+        import numpy as np
+
+        b = self.bboxes
+        return np.nonzero((b[:, 0] <= maxx) & (b[:, 2] >= minx) & (b[:, 1] <= maxy) & (b[:, 3] >= miny))[0]
+
+    def geometry(self, index):
+        """Build the shapely geometry of a single feature."""
+        return self.geometries([index])[0]
+
+    def geometries(self, indices=None):
+        """
+        Build shapely geometries for some or all features.
+
+        :param indices: Feature indices, defaults to every feature.
+        :return: A numpy array of MultiPolygon geometries.
+        """
+        import numpy as np
+        import shapely
+
+        if indices is None:
+            indices = np.arange(len(self))
+        geometries = np.empty(len(indices), dtype=object)
+        for i, index in enumerate(indices):
+            polygons = self.polygon_offsets[self.feature_offsets[index]:self.feature_offsets[index + 1] + 1]
+            rings = self.ring_offsets[polygons[0]:polygons[-1] + 1]
+            coords = self.coords[rings[0]:rings[-1]].astype(float)
+            geometries[i] = shapely.from_ragged_array(
+                shapely.GeometryType.MULTIPOLYGON, coords,
+                (rings - rings[0], polygons - polygons[0], np.array([0, len(polygons) - 1])),
+            )[0]
+        return geometries
+
+
+def store_dir():
+    """Return the directory the binary geometry stores are written to, in the instance folder."""
+    return os.path.join(current_app.instance_path, 'geodata')
+
+
+def store_path(which_map, level='high'):
+    name = os.path.splitext(artifact_file(which_map, level))[0]
+    return os.path.join(store_dir(), f'{name}.geom')
+
+
+def _prune_stores(which_map, level, keep):
+    for stale in glob.glob(os.path.join(store_dir(), artifact_name(which_map, level, '*') + '.geom')):
+        if stale != keep:
+            os.remove(stale)
+
+
+def build_store(which_map, level='high'):
+    """
+    Compile the artifact of a layer into a binary geometry store.
+
+    Stores built from earlier artifacts of the layer are removed.
+
+    :return: The path of the store.
+    """
+    import shapely.geometry
+
+    path = store_path(which_map, level)
+    # The artifact is streamed feature by feature rather than loaded whole
+    features = ((feature['properties'], shapely.geometry.shape(feature['geometry']))
+                for feature in iter_artifact(artifact_file(which_map, level)))
+
+    os.makedirs(store_dir(), exist_ok=True)
+    write_store(path, features)
+    _prune_stores(which_map, level, path)
+    return path
+
+
+def open_store(which_map, level='high'):
+    """
+    Open the geometry store of a layer, building it on first use.
+
+    Stores are named after the artifact they were built from, so a rebuilt
+    layer is picked up without restarting the workers. The mapping is kept
+    for the lifetime of the worker, but its pages belong to the page cache
+    and are shared by every process that maps the file.
+
+    :param which_map: A key of ``LAYERS``.
+    :param level: A key of ``LEVELS``.
+    :return: A ``GeometryStore``.
+    """
+    path = store_path(which_map, level)
+    key = (which_map, level)
+    if key not in _store_cache or _store_cache[key][0] != path:
+        if not os.path.exists(path):
+            build_store(which_map, level)
+        _store_cache[key] = (path, GeometryStore(path))
+    return _store_cache[key][1]
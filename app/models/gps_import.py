@@ -0,0 +1,202 @@
+import itertools
+import os
+import struct
+import xml.parsers.expat
+
+from app.models.locate import locate_names
+from app.models.travel import Visited
+
+# Points are deduplicated on a grid of this many degrees before they are
+# resolved, keeping the first point seen in every cell
+GRID_DEGREES = 0.05
+
+# Number of points resolved against the geometries at once
+BATCH_SIZE = 100_000
+
+# Bytes of a GPX file parsed at a time
+CHUNK_SIZE = 1 << 20
+
+GPX_POINT_TAGS = ('trkpt', 'rtept', 'wpt')
+JPEG_EXTENSIONS = ('.jpg', '.jpeg')
+
+
+def iter_gpx_points(file, chunk_size=CHUNK_SIZE):
+    """
+    Stream the track, route and waypoints of a GPX file.
+
+    The file is fed to expat a chunk at a time without building a tree, so
+    memory stays flat however long the track is.
+
+    :param file: A path or binary file object.
+    :return: A generator of ``(n, 2)`` numpy arrays of lat/lon pairs, one per chunk.
+    """
+    import numpy as np
+
+    coords = []
+
+    def start_element(name, attrs):
+        # Points missing a coordinate are skipped
+        if name.endswith(GPX_POINT_TAGS) and 'lat' in attrs and 'lon' in attrs:
+            coords.append(attrs['lat'])
+            coords.append(attrs['lon'])
+
+    parser = xml.parsers.expat.ParserCreate()
+    parser.StartElementHandler = start_element
+
+    handle = open(file, 'rb') if isinstance(file, (str, os.PathLike)) else file
+    try:
+        while True:
+            chunk = handle.read(chunk_size)
+            try:
+                parser.Parse(chunk, not chunk)
+            except xml.parsers.expat.ExpatError as e:
+                raise ValueError(f"Invalid GPX file: {e}") from e
+            if coords:
+                yield np.array(coords, dtype=float).reshape(-1, 2)
+                coords.clear()
+            if not chunk:
+                return
+    finally:
+        if handle is not file:
+            handle.close()
+
+
+def _exif_gps(tiff):
+    """Read the GPS position out of the TIFF structure of an EXIF block."""
+    endian = '<' if tiff[:2] == b'II' else '>'
+
+    def entries(offset):
+        count = struct.unpack_from(endian + 'H', tiff, offset)[0]
+        for i in range(count):
+            yield struct.unpack_from(endian + 'HHII', tiff, offset + 2 + 12 * i)
+
+    def degrees(offset):
+        values = struct.unpack_from(endian + 'IIIIII', tiff, offset)
+        return sum(values[i] / values[i + 1] / 60 ** (i // 2) for i in range(0, 6, 2) if values[i + 1])
+
+    ifd0 = struct.unpack_from(endian + 'I', tiff, 4)[0]
+    gps_ifd = next((value for tag, kind, count, value in entries(ifd0) if tag == 0x8825), None)
+    if gps_ifd is None:
+        return None
+
+    gps = {}
+    for tag, kind, count, value in entries(gps_ifd):
+        if tag in (1, 3):
+            # Reference letters fit inline in the value field
+            gps[tag] = struct.pack(endian + 'I', value)[:1]
+        elif tag in (2, 4):
+            gps[tag] = degrees(value)
+    if not all(tag in gps for tag in (1, 2, 3, 4)):
+        return None
+
+    lat = -gps[2] if gps[1] == b'S' else gps[2]
+    lon = -gps[4] if gps[3] == b'W' else gps[4]
+    return lat, lon
+
+
+def iter_jpeg_points(file):
+    """
+    Read the EXIF GPS position of a JPEG photo.
+
+    Only the JPEG segment headers up to the EXIF block are read, never the
+    image data.
+
+    :param file: A path or binary file object.
+    :return: A generator yielding at most one ``(1, 2)`` numpy array.
+    """
+    import numpy as np
+
+    handle = open(file, 'rb') if isinstance(file, (str, os.PathLike)) else file
+    try:
+        if handle.read(2) != b'\xff\xd8':
+            return
+        while True:
+            marker, length = struct.unpack('>2sH', handle.read(4))
+            if marker[0] != 0xff or marker[1] == 0xda:
+                # Start of scan, the image data follows and no EXIF block was found
+                return
+            segment = handle.read(length - 2)
+            if marker[1] == 0xe1 and segment.startswith(b'Exif\x00\x00'):
+                point = _exif_gps(segment[6:])
+                if point:
+                    yield np.array([point])
+                return
+    except struct.error:
+        return
+    finally:
+        if handle is not file:
+            handle.close()
+
+
+def iter_points(file, filename=None):
+    """
+    Stream the point batches of a GPX track or a photo, picked by file extension.
+
+    :param file: A path or binary file object.
+    :param filename: The name to pick the format by, defaults to ``file``.
+    """
+    extension = os.path.splitext(filename or str(file))[1].lower()
+    if extension == '.gpx':
+        return iter_gpx_points(file)
+    if extension in JPEG_EXTENSIONS:
+        return iter_jpeg_points(file)
+    raise ValueError(f"Unsupported file type: {extension}")
+
+
+def unique_points(batches, grid=GRID_DEGREES):
+    """
+    Deduplicate a stream of point batches on a coarse grid.
+
+    Every batch is deduplicated with numpy, so only one batch plus the set of
+    occupied cells is held in memory.
+
+    :param batches: An iterable of ``(n, 2)`` numpy arrays of lat/lon pairs.
+    :return: A tuple of the number of points read and the latitudes and
+        longitudes of the unique points as numpy arrays.
+    """
+    import numpy as np
+
+    seen = set()
+    lats, lons = [np.empty(0)], [np.empty(0)]
+    total = 0
+
+    for coords in batches:
+        total += len(coords)
+        cells = np.floor(coords / grid).astype(np.int64)
+        keys, first = np.unique(cells[:, 0] * 1_000_000 + cells[:, 1], return_index=True)
+        new = np.fromiter((key not in seen for key in keys.tolist()), dtype=bool, count=len(keys))
+        seen.update(keys[new].tolist())
+        lats.append(coords[first[new], 0])
+        lons.append(coords[first[new], 1])
+
+    return total, np.concatenate(lats), np.concatenate(lons)
+
+
+def resolve_places(lats, lons, batch_size=BATCH_SIZE):
+    """
+    Resolve points to the places containing them, in vectorized batches.
+
+    :return: A dict mapping each map ('world', 'states', 'cities') to the set of place names found.
+    """
+    places = {}
+    for start in range(0, len(lats), batch_size):
+        names = locate_names(lats[start:start + batch_size], lons[start:start + batch_size])
+        for which_map, found in names.items():
+            places.setdefault(which_map, set()).update(name for name in found if name)
+    return places
+
+
+def import_points(files, traveler):
+    """
+    Mark every place a set of GPX tracks and photos passes through as visited.
+
+    :param files: An iterable of ``(file, filename)`` tuples, where file is a
+        path or binary file object.
+    :param traveler: The name of the traveler to mark the places for.
+    :return: A dict with the number of ``points`` read, the number of
+        ``unique`` grid cells and the ``added`` and ``updated`` Visited entries.
+    """
+    points = itertools.chain.from_iterable(iter_points(file, filename) for file, filename in files)
+    total, lats, lons = unique_points(points)
+    added, updated = Visited.mark_visited(resolve_places(lats, lons), traveler)
+    return {'points': total, 'unique': len(lats), 'added': added, 'updated': updated}
@@ -0,0 +1,69 @@
+from app.models.geodata import available_layers
+from app.models.geostore import open_store, store_path
+
+_tree_cache = {}
+
+
+def layer_tree(which_map):
+    """
+    Return the feature properties of a layer, an STRtree over the parts of its
+    geometries and the feature index of every part.
+
+    Multi-part geometries are indexed per part so far-flung islands (or
+    Alaska across the antimeridian) don't inflate the bounding boxes. The
+    tree is built on first use and kept until the store of the layer is
+    rebuilt from a new artifact.
+    """
+    path = store_path(which_map)
+    if which_map not in _tree_cache or _tree_cache[which_map][0] != path:
+        import shapely
+
+        store = open_store(which_map)
+        parts, part_features = shapely.get_parts(store.geometries(), return_index=True)
+        _tree_cache[which_map] = (path, (store.properties, shapely.STRtree(parts), part_features))
+    return _tree_cache[which_map][1]
+
+
+def locate_points(lats, lons, layers=None):
+    """
+    Find the feature of every layer containing each point.
+
+    All points are tested against a layer with a single vectorized STRtree
+    query, so the cost per point stays in compiled code.
+
+    :param lats: A sequence of latitudes.
+    :param lons: A sequence of longitudes, the same length as ``lats``.
+    :param layers: Layers to search, defaults to every layer that has been built.
+    :return: A dict mapping each layer to a list holding, per point, the index
+        of the containing feature in ``open_store(which_map)`` or -1.
+    """
+    import numpy as np
+    import shapely
+
+    points = shapely.points(np.asarray(lons, dtype=float), np.asarray(lats, dtype=float))
+
+    matches = {}
+    for which_map in layers or available_layers('high'):
+        properties, tree, part_features = layer_tree(which_map)
+        point_index, part_index = tree.query(points, predicate='within')
+        found = np.full(len(points), -1)
+        found[point_index] = part_features[part_index]
+        matches[which_map] = found
+    return matches
+
+
+def locate_names(lats, lons, layers=None):
+    """
+    Find the name of the feature of every layer containing each point.
+
+    :return: A dict mapping each layer to a list holding, per point, the
+        feature name or None.
+    """
+    import numpy as np
+
+    names = {}
+    for which_map, found in locate_points(lats, lons, layers).items():
+        properties = layer_tree(which_map)[0]
+        lookup = np.array([feature['name'] for feature in properties] + [None], dtype=object)
+        names[which_map] = lookup[found].tolist()
+    return names
@@ -0,0 +1,37 @@
+from flask import abort
+
+from app.extensions import db
+
+
+class PrimaryKeyLookup:
+    """
+    Mixin for models read one entity at a time by primary key.
+
+    Lookups go through ``Session.get``, which checks the session's identity
+    map before querying. Flask-SQLAlchemy scopes the session to the request,
+    so an entity is loaded at most once per request, and a miss is a single
+    primary key index lookup however large the table grows.
+    """
+
+    @classmethod
+    def get_by_id(cls, id):
+        """
+        Get an entity by its primary key.
+
+        :param id: The primary key.
+        :return: The entity, or None if there is none.
+        """
+        return db.session.get(cls, id)
+
+    @classmethod
+    def get_or_404(cls, id, description=None):
+        """
+        Get an entity by its primary key, aborting with a 404 error if there is none.
+
+        :param id: The primary key.
+        :param description: The description of the 404 error.
+        """
+        entity = cls.get_by_id(id)
+        if entity is None:
+            abort(404, description=description or f"{cls.__name__} not found")
+        return entity
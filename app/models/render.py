@@ -0,0 +1,257 @@
+import glob
+import hashlib
+import json
+import os
+import struct
+import zlib
+
+from app.models.geostore import open_store, store_path
+from app.models.styled import join_status
+from app.models.tiles import _mercator
+from app.models.travel import Visited
+from app.models.travelers import SHARED_COLOR, Traveler
+
+# Lon/lat area drawn for every map, cropping Antarctica out of the world and
+# keeping Alaska and Hawaii in view on the US maps
+RENDER_BOUNDS = {
+    'world': (-180.0, -58.0, 180.0, 84.0),
+    'states': (-170.0, 17.0, -64.0, 72.0),
+    'cities': (-170.0, 17.0, -64.0, 72.0),
+}
+
+# Fill colors of ``style()`` in visited_map.js: the ``TRAVELER_COLORS``,
+# ``SHARED_COLOR``, black for places to visit and grey for the rest
+COLORS = {
+    'purple': (128, 0, 128),
+    'red': (255, 0, 0),
+    'blue': (0, 0, 255),
+    'green': (0, 128, 0),
+    'orange': (255, 165, 0),
+    'teal': (0, 128, 128),
+    'brown': (165, 42, 42),
+    'olive': (128, 128, 0),
+    'navy': (0, 0, 128),
+    'black': (0, 0, 0),
+    'grey': (128, 128, 128),
+}
+FILL_OPACITY = 0.7
+
+# Widths images are rendered at, other widths are rounded up to the next one
+# so a public link can't fill the cache with a render per pixel
+WIDTHS = (256, 512, 1024, 2048)
+DEFAULT_WIDTH = 1024
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+
+def visit_color(status, colors):
+    """
+    Return the fill color of a place from its visit status, as in ``statusColor()``.
+
+    :param status: The visit status of the place.
+    :param colors: The ``Traveler.colors()``.
+    """
+    visited = [color for name, color in colors if status.get(name)]
+    if len(visited) > 1:
+        return SHARED_COLOR
+    if visited:
+        return visited[0]
+    if status.get('todo'):
+        return 'black'
+    return 'grey'
+
+
+def render_width(width):
+    """Round a requested width up to the next of ``WIDTHS``, capped at the largest."""
+    return next((allowed for allowed in WIDTHS if allowed >= width), WIDTHS[-1])
+
+
+def render_digest(which_map, status, colors):
+    """
+    Hash the visit status of a map together with the geometry it is drawn from
+    and the traveler colors.
+
+    The digest only changes when a render would, so it keys the image cache.
+    """
+    payload = json.dumps([store_path(which_map, 'low'), status, colors], sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()[:16]
+
+
+def _project(which_map, width):
+    """
+    Project the features of a map to pixel coordinates.
+
+    :return: A tuple of the image height and a list of ``(code, geometry)``
+        tuples, clipped to the image and simplified to half a pixel.
+    """
+    import numpy as np
+    import shapely
+
+    store = open_store(which_map, 'low')
+    bounds = RENDER_BOUNDS[which_map]
+    corners = _mercator(np.array([[bounds[0], bounds[3]], [bounds[2], bounds[1]]]))
+    scale = width / (corners[1, 0] - corners[0, 0])
+    height = int(round((corners[1, 1] - corners[0, 1]) * scale))
+
+    indices = store.query_bbox(*bounds)
+    geometries = shapely.transform(store.geometries(indices), lambda coords: (_mercator(coords) - corners[0]) * scale)
+    geometries = shapely.simplify(shapely.clip_by_rect(geometries, 0, 0, width, height), 0.5)
+
+    features = [(store.properties[index]['code'], geometry)
+                for index, geometry in zip(indices, geometries) if not geometry.is_empty]
+    return height, features
+
+
+def _rings(geometry):
+    for polygon in getattr(geometry, 'geoms', [geometry]):
+        if polygon.geom_type != 'Polygon':
+            continue
+        for ring in [polygon.exterior, *polygon.interiors]:
+            yield ring.coords
+
+
+def render_svg(which_map, status, colors, width=DEFAULT_WIDTH):
+    """
+    Render a map as an SVG choropleth.
+
+    Features are merged into a single path per color with integer
+    coordinates relative to the previous vertex, which keeps the document to
+    a few kilobytes once compressed.
+
+    :param which_map: A key of ``RENDER_BOUNDS``.
+    :param status: A dict mapping feature codes to their visit status.
+    :param colors: The ``Traveler.colors()``.
+    :return: The SVG document as bytes.
+    """
+    import numpy as np
+
+    height, features = _project(which_map, width)
+
+    paths = {}
+    for code, geometry in features:
+        data = paths.setdefault(visit_color(status.get(code, {}), colors), [])
+        for ring in _rings(geometry):
+            coords = np.rint(np.asarray(ring)[:-1]).astype(int)
+            coords = coords[np.any(coords != np.roll(coords, 1, axis=0), axis=1)]
+            if len(coords) >= 3:
+                deltas = np.diff(coords, axis=0).ravel().tolist()
+                data.append(f'M{coords[0, 0]} {coords[0, 1]}l' + ' '.join(map(str, deltas)) + 'z')
+
+    body = ''.join(f'<path fill="{color}" d="{"".join(data)}"/>' for color, data in paths.items() if data)
+    return (f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" '
+            f'viewBox="0 0 {width} {height}"><g stroke="#fff" stroke-width="1" '
+            f'stroke-linejoin="round" fill-opacity="{FILL_OPACITY}" fill-rule="evenodd">'
+            f'{body}</g></svg>').encode()
+
+
+def _fill_rings(canvas, rings, value):
+    """
+    Fill polygon rings into a raster with the even-odd rule.
+
+    Pixels are filled when their center lies inside, scanning one row at a
+    time over the edges crossing it.
+    """
+    import numpy as np
+
+    edges = np.concatenate([np.column_stack([ring[:-1], ring[1:]]) for ring in rings])
+    edges = edges[edges[:, 1] != edges[:, 3]]
+    if not len(edges):
+        return
+    x0, y0, x1, y1 = edges.T
+
+    height, width = canvas.shape
+    first = max(int(np.ceil(edges[:, [1, 3]].min() - 0.5)), 0)
+    last = min(int(np.floor(edges[:, [1, 3]].max() - 0.5)), height - 1)
+    for row in range(first, last + 1):
+        center = row + 0.5
+        crossing = (y0 <= center) != (y1 <= center)
+        xs = np.sort(x0[crossing] + (center - y0[crossing]) * (x1[crossing] - x0[crossing])
+                     / (y1[crossing] - y0[crossing]))
+        starts = np.clip(np.ceil(xs[0::2] - 0.5).astype(int), 0, width)
+        ends = np.clip(np.floor(xs[1::2] - 0.5).astype(int) + 1, 0, width)
+        for start, end in zip(starts.tolist(), ends.tolist()):
+            canvas[row, start:end] = value
+
+
+def _png_chunk(tag, data):
+    return struct.pack('>I', len(data)) + tag + data + struct.pack('>I', zlib.crc32(tag + data))
+
+
+def render_png(which_map, status, colors, width=DEFAULT_WIDTH):
+    """
+    Render a map as a palette PNG choropleth.
+
+    Every feature is rasterized into a feature id raster; pixels bordering a
+    different feature become the white outline and the rest take the fill
+    color of their feature, blended at ``FILL_OPACITY`` over transparency.
+
+    :param which_map: A key of ``RENDER_BOUNDS``.
+    :param status: A dict mapping feature codes to their visit status.
+    :param colors: The ``Traveler.colors()``.
+    :return: The PNG image as bytes.
+    """
+    import numpy as np
+
+    height, features = _project(which_map, width)
+
+    ids = np.zeros((height, width), dtype=np.int32)
+    for feature_id, (_, geometry) in enumerate(features, start=1):
+        rings = [np.asarray(ring) for ring in _rings(geometry)]
+        if rings:
+            _fill_rings(ids, rings, feature_id)
+
+    # Palette: transparent background, white outline, then the fill colors
+    color_names = list(COLORS)
+    lookup = np.array([0] + [2 + color_names.index(visit_color(status.get(code, {}), colors)) for code, _ in features],
+                      dtype=np.uint8)
+    pixels = lookup[ids]
+    border = np.zeros_like(ids, dtype=bool)
+    border[:, :-1] |= ids[:, :-1] != ids[:, 1:]
+    border[:-1, :] |= ids[:-1, :] != ids[1:, :]
+    pixels[border] = 1
+
+    palette = bytes([0, 0, 0, 255, 255, 255]) + b''.join(bytes(COLORS[name]) for name in color_names)
+    alpha = bytes([0, 255] + [round(FILL_OPACITY * 255)] * len(color_names))
+    raw = np.hstack([np.zeros((height, 1), dtype=np.uint8), pixels]).tobytes()
+    return (PNG_SIGNATURE
+            + _png_chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 3, 0, 0, 0))
+            + _png_chunk(b'PLTE', palette)
+            + _png_chunk(b'tRNS', alpha)
+            + _png_chunk(b'IDAT', zlib.compress(raw, 9))
+            + _png_chunk(b'IEND', b''))
+
+
+RENDERERS = {'svg': render_svg, 'png': render_png}
+
+
+def get_render(cache_dir, which_map, image_format, width=DEFAULT_WIDTH):
+    """
+    Return the path of a rendered map, rendering it into ``cache_dir`` only
+    when the visited data or geometry of the map changed.
+
+    Renders are named ``<which_map>/<digest>.<width>.<format>``; renders of
+    an older digest are removed once a new one is written.
+
+    :param which_map: A key of ``RENDER_BOUNDS``.
+    :param image_format: 'svg' or 'png'.
+    """
+    # Joined on the feature codes like the styled map, so both agree on name variants
+    properties = open_store(which_map, 'low').properties
+    status = join_status(which_map, Visited.visit_status(which_map), [(feature, None) for feature in properties])
+    colors = Traveler.colors()
+    digest = render_digest(which_map, status, colors)
+    directory = os.path.join(cache_dir, which_map)
+    path = os.path.join(directory, f'{digest}.{width}.{image_format}')
+    if not os.path.exists(path):
+        os.makedirs(directory, exist_ok=True)
+        image = RENDERERS[image_format](which_map, status, colors, width)
+
+        temp_path = f'{path}.{os.getpid()}.tmp'
+        with open(temp_path, 'wb') as file:
+            file.write(image)
+        os.replace(temp_path, path)
+
+        for stale in glob.glob(os.path.join(directory, '*.*.*')):
+            if not os.path.basename(stale).startswith(digest) and not stale.endswith('.tmp'):
+                os.remove(stale)
+    return path
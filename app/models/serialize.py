@@ -0,0 +1,158 @@
+import datetime
+import decimal
+import json
+import operator
+import uuid
+
+from flask import Response, stream_with_context
+from werkzeug.http import http_date
+
+from app.extensions import db
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Listings longer than this are streamed as a chunked response
+STREAM_THRESHOLD = 5000
+
+# Rows encoded per chunk of a streamed response
+CHUNK_ROWS = 1000
+
+LAYOUTS = ('records', 'columns')
+
+
+def _default(value):
+    # Same conversions as Flask's JSON provider, so responses don't change shape
+    if isinstance(value, datetime.date):
+        return http_date(value)
+    if isinstance(value, (decimal.Decimal, uuid.UUID)):
+        return str(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(value):
+    """
+    Encode a value as compact JSON with sorted keys, like ``jsonify``.
+
+    orjson is used when it is installed, the stdlib encoder otherwise.
+
+    :return: The JSON document as bytes.
+    """
+    if orjson is not None:
+        return orjson.dumps(value, default=_default,
+                            option=orjson.OPT_SORT_KEYS | orjson.OPT_PASSTHROUGH_DATETIME)
+    return json.dumps(value, default=_default, sort_keys=True, separators=(',', ':')).encode()
+
+
+def loads(data):
+    """Decode a JSON document from bytes or str, with orjson when it is installed."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+class Serializable:
+    """
+    Mixin serializing model instances through a per-model ``attrgetter``.
+
+    The column names and the getter are built once per model instead of
+    walking ``__table__.columns`` with ``getattr`` for every row. Loaded
+    values are read straight from the instance ``__dict__``, past the
+    instrumented attributes; expired or deferred ones are loaded through them.
+    """
+    _serializer = None
+
+    @classmethod
+    def serializer(cls):
+        """Return the column names of the model and a getter returning them as a tuple."""
+        if cls.__dict__.get('_serializer') is None:
+            fields = tuple(column.key for column in cls.__table__.columns)
+            get_loaded = operator.itemgetter(*fields)
+            get_attributes = operator.attrgetter(*fields)
+
+            def getter(instance):
+                try:
+                    values = get_loaded(instance.__dict__)
+                except KeyError:
+                    values = get_attributes(instance)
+                return (values,) if len(fields) == 1 else values
+
+            cls._serializer = (fields, getter)
+        return cls._serializer
+
+    @classmethod
+    def select_rows(cls, *criteria, order_by=()):
+        """
+        Select plain row tuples of every column, without building instances.
+
+        :param criteria: Filter expressions.
+        :param order_by: Expressions to order the rows by, unordered by default.
+        :return: A tuple of the column names and the list of row tuples.
+        """
+        fields, _ = cls.serializer()
+        query = db.session.query(*cls.__table__.columns).filter(*criteria).order_by(*order_by)
+        return fields, [tuple(row) for row in query]
+
+    def to_row(self):
+        return self.serializer()[1](self)
+
+    def to_dict(self):
+        fields, getter = self.serializer()
+        return dict(zip(fields, getter(self)))
+
+
+def records(fields, rows):
+    """Zip row tuples into dicts."""
+    return [dict(zip(fields, row)) for row in rows]
+
+
+def columns(fields, rows):
+    """Transpose row tuples into a dict of one array per field."""
+    transposed = list(zip(*rows)) or [()] * len(fields)
+    return {field: list(values) for field, values in zip(fields, transposed)}
+
+
+def _stream_records(fields, rows, extra):
+    yield b'{"items":[' if extra is not None else b'['
+    chunk = []
+    first = True
+    for row in rows:
+        chunk.append(dict(zip(fields, row)))
+        if len(chunk) == CHUNK_ROWS:
+            yield (b'' if first else b',') + dumps(chunk)[1:-1]
+            chunk.clear()
+            first = False
+    if chunk:
+        yield (b'' if first else b',') + dumps(chunk)[1:-1]
+    if extra is None:
+        yield b']'
+    else:
+        yield b'],' + dumps(extra)[1:] if extra else b']}'
+
+
+def json_response(fields, rows, layout='records', extra=None, status=200):
+    """
+    Build a JSON response for a listing of row tuples.
+
+    In the 'records' layout the body is an array of objects, or, when
+    ``extra`` is given, an object with the array in 'items' and the keys of
+    ``extra`` alongside. In the 'columns' layout it is an object with an
+    array per field, plus the keys of ``extra``. Record listings longer than
+    ``STREAM_THRESHOLD`` are encoded and sent in chunks.
+
+    :param fields: The field names of the row tuples.
+    :param rows: A sequence of row tuples.
+    :param layout: 'records' or 'columns'.
+    :param extra: A dict of other top-level keys, such as a pagination cursor.
+    """
+    if layout == 'columns':
+        return Response(dumps({**columns(fields, rows), **(extra or {})}), status=status,
+                        mimetype='application/json')
+    if len(rows) > STREAM_THRESHOLD:
+        return Response(stream_with_context(_stream_records(fields, rows, extra)), status=status,
+                        mimetype='application/json')
+    body = records(fields, rows)
+    return Response(dumps(body if extra is None else {'items': body, **extra}), status=status,
+                    mimetype='application/json')
@@ -0,0 +1,174 @@
+import datetime
+import os
+import struct
+import zipfile
+
+SHP_FILE_CODE = 9994
+
+# Shape types with polygon rings, plus their Z and M variants
+POLYGON_TYPES = (5, 15, 25)
+
+
+def _open_member(source, extension):
+    """
+    Open a sibling file of a shapefile.
+
+    :param source: A path to a ``.shp`` file, or ``zip://<archive>!<member>.shp``
+        for a shapefile inside a zip archive.
+    :param extension: The extension of the sibling to open, e.g. '.dbf'.
+    :return: A binary file object.
+    """
+    if source.startswith('zip://'):
+        archive, member = source[len('zip://'):].split('!', 1)
+        return zipfile.ZipFile(archive).open(os.path.splitext(member)[0] + extension)
+    return open(os.path.splitext(source)[0] + extension, 'rb')
+
+
+def _read_encoding(source):
+    try:
+        with _open_member(source, '.cpg') as file:
+            return file.read().decode('ascii').strip() or 'utf-8'
+    except (OSError, KeyError):
+        return 'latin-1'
+
+
+def iter_dbf_records(file, encoding='utf-8'):
+    """
+    Stream the records of a dBASE file.
+
+    :param file: A binary file object positioned at the start of the file.
+    :param encoding: The encoding of character fields.
+    :return: A generator of dicts mapping field names to values, or None for
+        deleted records so the stream stays aligned with the ``.shp`` file.
+    """
+    header = file.read(32)
+    count, header_length, record_length = struct.unpack('<xxxxIHH20x', header)
+
+    fields = []
+    for _ in range((header_length - 33) // 32):
+        descriptor = file.read(32)
+        name = descriptor[:11].split(b'\x00', 1)[0].decode('ascii')
+        fields.append((name, chr(descriptor[11]), descriptor[16], descriptor[17]))
+    file.read(header_length - 32 - 32 * len(fields))
+
+    for _ in range(count):
+        record = file.read(record_length)
+        if len(record) < record_length:
+            return
+        if record[:1] == b'*':
+            yield None
+            continue
+
+        values = {}
+        offset = 1
+        for name, kind, length, decimals in fields:
+            raw = record[offset:offset + length]
+            offset += length
+            values[name] = _dbf_value(raw, kind, decimals, encoding)
+        yield values
+
+
+def _dbf_value(raw, kind, decimals, encoding):
+    if kind == 'C':
+        return raw.decode(encoding).rstrip(' \x00')
+    text = raw.strip(b' \x00').decode('ascii')
+    if not text or text.strip('*?') == '':
+        return None
+    if kind in ('N', 'F'):
+        return float(text) if decimals or kind == 'F' or '.' in text else int(text)
+    if kind == 'L':
+        return text in 'YyTt'
+    if kind == 'D':
+        return datetime.date(int(text[:4]), int(text[4:6]), int(text[6:8]))
+    return text
+
+
+def iter_shp_records(file):
+    """
+    Stream the shapes of a ``.shp`` file.
+
+    Only one record is held in memory at a time.
+
+    :param file: A binary file object positioned at the start of the file.
+    :return: A generator yielding, per record, a list of rings as ``(n, 2)``
+        numpy arrays, or None for null shapes.
+    """
+    import numpy as np
+
+    header = file.read(100)
+    if len(header) < 100 or struct.unpack('>i', header[:4])[0] != SHP_FILE_CODE:
+        raise ValueError("Not a shapefile")
+
+    while True:
+        record_header = file.read(8)
+        if len(record_header) < 8:
+            return
+        length = struct.unpack('>ii', record_header)[1] * 2
+        content = file.read(length)
+
+        shape_type = struct.unpack('<i', content[:4])[0]
+        if shape_type == 0:
+            yield None
+            continue
+        if shape_type not in POLYGON_TYPES:
+            raise ValueError(f"Unsupported shape type {shape_type}")
+
+        num_parts, num_points = struct.unpack('<ii', content[36:44])
+        parts = np.frombuffer(content, dtype='<i4', count=num_parts, offset=44)
+        points = np.frombuffer(content, dtype='<f8', count=num_points * 2, offset=44 + 4 * num_parts)
+        points = points.reshape(-1, 2)
+        yield np.split(points, parts[1:])
+
+
+def _rings_to_geometry(rings):
+    """
+    Assemble shapefile rings into a polygon or multipolygon.
+
+    Shapefiles store outer rings clockwise and holes counter-clockwise; every
+    hole is assigned to the outer ring containing it.
+    """
+    import shapely
+
+    shells, holes = [], []
+    for ring in rings:
+        if len(ring) < 4:
+            continue
+        x, y = ring[:, 0], ring[:, 1]
+        signed_area = (x[:-1] * y[1:] - x[1:] * y[:-1]).sum()
+        (holes if signed_area > 0 else shells).append(ring)
+
+    polygons = [[shell] for shell in shells]
+    if holes:
+        prepared = [shapely.Polygon(shell) for shell in shells]
+        shapely.prepare(prepared)
+        for hole in holes:
+            point = shapely.Point(hole[0])
+            owner = next((i for i, shell in enumerate(prepared) if shell.contains(point)), None)
+            if owner is None:
+                # An orphan hole is most likely a mis-oriented shell
+                polygons.append([hole])
+            else:
+                polygons[owner].append(hole)
+
+    geometries = [shapely.Polygon(rings[0], rings[1:]) for rings in polygons]
+    if len(geometries) == 1:
+        return geometries[0]
+    return shapely.MultiPolygon(geometries)
+
+
+def iter_shapefile(source):
+    """
+    Stream the features of a shapefile record by record.
+
+    Memory use is bounded by the largest single record, which keeps large
+    files readable on small machines.
+
+    :param source: A path to a ``.shp`` file, or ``zip://<archive>!<member>.shp``.
+    :return: A generator of ``(attributes, geometry)`` tuples, where geometry
+        is a shapely geometry or None.
+    """
+    encoding = _read_encoding(source)
+    with _open_member(source, '.shp') as shp, _open_member(source, '.dbf') as dbf:
+        for attributes, rings in zip(iter_dbf_records(dbf, encoding), iter_shp_records(shp)):
+            if attributes is not None:
+                yield attributes, _rings_to_geometry(rings) if rings else None
@@ -0,0 +1,161 @@
+import hashlib
+import json
+import os
+
+from app.models.geodata import artifact_file, data_dir
+from app.models.travel import Visited
+from app.models.travelers import Traveler
+
+# Place names found in Visited that differ from the shapefile names, mapped
+# to the code of the feature they refer to. Codes themselves are accepted as
+# names as well.
+NAME_ALIASES = {
+    'world': {
+        'United States': 'USA',
+        'US': 'USA',
+        'UK': 'GBR',
+        'Great Britain': 'GBR',
+        'England': 'GBR',
+        'Scotland': 'GBR',
+        'Wales': 'GBR',
+        'Northern Ireland': 'GBR',
+        'China': 'CHN',
+        'Czechia': 'CZE',
+        'Holland': 'NLD',
+        'The Netherlands': 'NLD',
+        'Bahamas': 'BHS',
+        'Gambia': 'GMB',
+        "Cote d'Ivoire": 'CIV',
+        "Côte d'Ivoire": 'CIV',
+        'Timor-Leste': 'TLS',
+        'Swaziland': 'SWZ',
+        'Macedonia': 'MKD',
+        'Burma': 'MMR',
+        'Viet Nam': 'VNM',
+        'Korea': 'KOR',
+        'Republic of Korea': 'KOR',
+        'DRC': 'COD',
+        'Congo': 'COG',
+        'Turkiye': 'TUR',
+        'Türkiye': 'TUR',
+    },
+    'states': {
+        'Washington DC': 'DC',
+        'Washington, D.C.': 'DC',
+    },
+}
+
+_features_cache = {}
+_styled_cache = {}
+_status_cache = {}
+
+
+def _layer_features(which_map, level):
+    """
+    Return the features of an artifact as ``(properties, geometry)`` tuples,
+    with the geometry already serialized so it is never encoded again.
+
+    Parsed once per worker and artifact.
+    """
+    key = (which_map, level)
+    name = artifact_file(which_map, level)
+    if key not in _features_cache or _features_cache[key][0] != name:
+        with open(os.path.join(data_dir, name), 'r') as file:
+            collection = json.load(file)
+        features = [(feature['properties'], json.dumps(feature['geometry'], separators=(',', ':')))
+                    for feature in collection['features']]
+        _features_cache[key] = (name, features)
+    return _features_cache[key][1]
+
+
+def unvisited():
+    """Return the visit status of a place nobody visited, a flag per traveler and 'todo'."""
+    return dict.fromkeys(Traveler.names() + ['todo'], False)
+
+
+def join_status(which_map, status, features):
+    """
+    Join visit statuses onto feature codes.
+
+    Names are resolved to codes through the layer's own names, then
+    ``NAME_ALIASES``, then the codes themselves. A code visited under
+    several names combines their flags.
+
+    :param status: A dict mapping place names to their visit status.
+    :param features: A list of ``(properties, geometry)`` tuples.
+    :return: A dict mapping feature codes to their visit status.
+    """
+    codes = {properties['name']: properties['code'] for properties, _ in features}
+    codes.update(NAME_ALIASES.get(which_map, {}))
+    codes.update({code: code for code in list(codes.values())})
+
+    empty = unvisited()
+    by_code = {}
+    for name, flags in status.items():
+        code = codes.get(name)
+        if code is None:
+            continue
+        merged = by_code.setdefault(code, dict(empty))
+        for key in empty:
+            merged[key] = merged[key] or flags[key]
+    return by_code
+
+
+def _digest(which_map, level, status):
+    payload = json.dumps([artifact_file(which_map, level), Traveler.names(), status], sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()[:16]
+
+
+def styled_status(which_map):
+    """
+    Return the visit status of a map joined onto its feature codes.
+
+    This is the small payload the map page styles the static artifact with,
+    cached per worker like ``styled_geojson``.
+
+    :param which_map: A key of ``LAYERS``.
+    :return: A tuple of the digest and the JSON object mapping feature codes
+        to their visit status, as bytes. Unvisited features are left out.
+    """
+    status = Visited.visit_status(which_map)
+    digest = _digest(which_map, 'low', status)
+    if which_map in _status_cache and _status_cache[which_map][0] == digest:
+        return _status_cache[which_map]
+
+    by_code = join_status(which_map, status, _layer_features(which_map, 'low'))
+    _status_cache[which_map] = (digest, json.dumps(by_code, separators=(',', ':')).encode())
+    return _status_cache[which_map]
+
+
+def styled_geojson(which_map, level='low'):
+    """
+    Return an artifact with the visit status merged into every feature.
+
+    The result is cached per worker under a hash of the map's Visited rows
+    and the artifact, so any write to Visited invalidates it in every worker
+    on its next request.
+
+    :param which_map: A key of ``LAYERS``.
+    :param level: A key of ``LEVELS``.
+    :return: A tuple of the digest and the GeoJSON document as bytes.
+    """
+    status = Visited.visit_status(which_map)
+    digest = _digest(which_map, level, status)
+
+    key = (which_map, level)
+    if key in _styled_cache and _styled_cache[key][0] == digest:
+        return _styled_cache[key]
+
+    features = _layer_features(which_map, level)
+    by_code = join_status(which_map, status, features)
+    empty = unvisited()
+    parts = [
+        '{"type":"Feature","properties":'
+        + json.dumps({**properties, **by_code.get(properties['code'], empty)}, separators=(',', ':'))
+        + ',"geometry":' + geometry + '}'
+        for properties, geometry in features
+    ]
+    body = ('{"type":"FeatureCollection","features":[' + ','.join(parts) + ']}').encode()
+
+    _styled_cache[key] = (digest, body)
+    return _styled_cache[key]
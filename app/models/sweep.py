@@ -0,0 +1,205 @@
+import atexit
+import collections
+import math
+import os
+import threading
+from datetime import date
+
+from app.models.amortization import monthly_payment, mortgage_schedule
+from app.models.serialize import dumps
+
+# Combinations evaluated per chunk, and per task of the process pool
+CHUNK_SIZE = 50_000
+
+# Sweeps larger than this are spread over a process pool, on machines with more than one CPU
+POOL_THRESHOLD = 500_000
+
+# Processes of the pool shared by the sweeps of a gunicorn worker, so
+# concurrent sweeps queue on it instead of each spawning its own
+POOL_WORKERS = 2
+
+# Largest grid accepted
+MAX_COMBINATIONS = 4_000_000
+
+# Longest term accepted, in years
+MAX_TERM = 50
+
+FIELDS = ('rate', 'term', 'prepayment', 'monthly_payment', 'periods', 'payoff_month', 'total_interest',
+          'break_even_months', 'net_savings')
+
+# Process pool of this worker, see _shared_pool
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _numbers(name, values, minimum, maximum):
+    if not isinstance(values, list) or not values:
+        raise ValueError(f"{name} must be a non-empty list of numbers")
+    try:
+        values = [float(value) for value in values]
+    except (TypeError, ValueError):
+        raise ValueError(f"{name} must be a non-empty list of numbers")
+    if not all(minimum <= value <= maximum for value in values):
+        raise ValueError(f"{name} must be between {minimum} and {maximum}")
+    return values
+
+
+def _shared_pool():
+    """Return the process pool of this worker, started on first use."""
+    global _pool
+    # multiprocessing is only needed by large sweeps, keep it out of start up
+    from concurrent.futures import ProcessPoolExecutor
+    from multiprocessing import get_context
+
+    with _pool_lock:
+        if _pool is None:
+            # Spawn rather than fork, gunicorn workers run other request threads
+            _pool = ProcessPoolExecutor(max_workers=POOL_WORKERS, mp_context=get_context('spawn'))
+            atexit.register(_pool.shutdown, cancel_futures=True)
+        return _pool
+
+
+def _pooled(tasks):
+    """
+    Evaluate chunks on the shared pool, in order.
+
+    Only a few chunks per pool process are queued at a time, so concurrent
+    sweeps take turns and the chunks of an abandoned sweep are cancelled.
+    """
+    global _pool
+    from concurrent.futures.process import BrokenProcessPool
+
+    pool = _shared_pool()
+    pending = collections.deque()
+    try:
+        for task in tasks:
+            pending.append(pool.submit(_evaluate_chunk, task))
+            if len(pending) >= 2 * POOL_WORKERS:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    except BrokenProcessPool:
+        # A pool process died; the next sweep starts a new pool
+        with _pool_lock:
+            if _pool is pool:
+                _pool = None
+        raise
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+def evaluate(balance, rates, terms, prepayments):
+    """
+    Evaluate refinancing a balance for arrays of offers, element-wise.
+
+    With a constant payment the balance has a closed form, so the payoff
+    period and the interest paid come straight from it, without stepping
+    through the months.
+
+    :param balance: The balance refinanced.
+    :param rates: An array of annual interest rates, in percent.
+    :param terms: An array of terms, in years.
+    :param prepayments: An array of extra principal paid every month.
+    :return: A tuple of arrays of the scheduled monthly payment, the number
+        of periods up to payoff and the total interest paid.
+    """
+    import numpy as np
+
+    rate = rates / 12 / 100
+    months = np.rint(terms * 12)
+    payment = monthly_payment(balance, rate, months)
+    outflow = payment + prepayments
+    growth = np.log1p(rate)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # Solve balance * (1 + r)^k = outflow * ((1 + r)^k - 1) / r for k
+        exact = np.where(rate > 0, -np.log1p(-rate * balance / outflow) / growth, balance / outflow)
+    periods = np.maximum(np.ceil(exact - 1e-9), 1)
+    # The balance before the last payment, which pays it off with its interest
+    elapsed = (periods - 1) * growth
+    before_last = np.where(
+        rate > 0,
+        np.exp(elapsed) * balance - outflow * np.expm1(elapsed) / np.where(rate > 0, rate, 1),
+        balance - (periods - 1) * outflow,
+    )
+    total_paid = (periods - 1) * outflow + np.maximum(before_last, 0) * (1 + rate)
+    return payment, periods.astype(int), total_paid - balance
+
+
+def _evaluate_chunk(task):
+    # Top level so the process pool can pickle it
+    import numpy as np
+
+    balance, rates, terms, prepayments, closing_costs, base_payment, base_interest, first_month = task
+    payment, periods, interest = evaluate(balance, rates, terms, prepayments)
+    savings = base_payment - payment
+    with np.errstate(divide='ignore', invalid='ignore'):
+        break_even = np.where(savings > 0, np.ceil(closing_costs / savings), -1).astype(int)
+    payoff = np.datetime_as_string(np.datetime64(first_month, 'M') + periods - 1, unit='M')
+    net = base_interest - interest - closing_costs
+    rows = zip(rates.tolist(), terms.tolist(), prepayments.tolist(), payment.tolist(), periods.tolist(),
+               payoff.tolist(), interest.tolist(),
+               [months if months >= 0 else None for months in break_even.tolist()], net.tolist())
+    # Encoded here so pool workers share the encoding, the bulk of the work
+    return b''.join(dumps(dict(zip(FIELDS, row))) + b'\n' for row in rows)
+
+
+def sweep(mortgage, rates, terms, prepayments, closing_costs=0.0, today=None):
+    """
+    Compare refinance and prepayment offers against a mortgage.
+
+    Every combination of rate, term and prepayment refinances the balance
+    left after the payments made before this month. The grid is evaluated in
+    NumPy chunks of ``CHUNK_SIZE`` combinations, spread over the worker's
+    shared pool of ``POOL_WORKERS`` processes once it is larger than
+    ``POOL_THRESHOLD``, and yielded chunk by chunk as NDJSON.
+
+    :param mortgage: The ``Mortgage`` refinanced.
+    :param rates: A list of annual interest rates, in percent.
+    :param terms: A list of terms, in years.
+    :param prepayments: A list of extra principal amounts paid every month.
+    :param closing_costs: The cost of refinancing, recovered by the lower payment.
+    :param today: The date of the refinance, defaults to today.
+    :return: A tuple of the number of combinations and a generator of NDJSON
+        chunks, with an object of the ``FIELDS`` per combination, in grid
+        order. 'break_even_months' is the number of
+        months of lower payments covering the closing costs, None if the
+        payment is not lower, and 'net_savings' the interest saved over the
+        rest of the current schedule, less the closing costs.
+    :raises ValueError: If a list is empty or holds invalid values, or the grid is too large.
+    """
+    import numpy as np
+
+    rates = _numbers('rates', rates, 0, 100)
+    terms = _numbers('terms', terms, 1 / 12, MAX_TERM)
+    prepayments = _numbers('prepayments', prepayments, 0, math.inf)
+    count = len(rates) * len(terms) * len(prepayments)
+    if count > MAX_COMBINATIONS:
+        raise ValueError(f"The grid has {count} combinations, more than {MAX_COMBINATIONS}")
+    try:
+        closing_costs = float(closing_costs or 0)
+    except (TypeError, ValueError):
+        raise ValueError("closing_costs must be a number")
+
+    today = today or date.today()
+    schedule = mortgage_schedule(mortgage)
+    paid = int(np.searchsorted(schedule.month, np.datetime64(today, 'M')))
+    balance = float(schedule.balance[paid - 1]) if paid else float(mortgage.principal)
+    base_interest = float(schedule.total_interest[-1] - (schedule.total_interest[paid - 1] if paid else 0))
+    base_payment = float(schedule.payment[0])
+    if balance < 0.01:
+        raise ValueError("The mortgage is paid off")
+    first_month = date(today.year, today.month, 1)
+
+    grid = [axis.ravel() for axis in np.meshgrid(rates, terms, prepayments, indexing='ij')]
+    tasks = [(balance, *(axis[start:start + CHUNK_SIZE] for axis in grid), closing_costs, base_payment,
+              base_interest, first_month)
+             for start in range(0, count, CHUNK_SIZE)]
+
+    def chunks():
+        if count <= POOL_THRESHOLD or (os.cpu_count() or 1) < 2:
+            yield from map(_evaluate_chunk, tasks)
+            return
+        yield from _pooled(tasks)
+
+    return count, chunks()
@@ -0,0 +1,119 @@
+import json
+import math
+import os
+
+from app.models.geostore import open_store
+
+# Deepest zoom level tiles are cut for
+MAX_ZOOM = 10
+
+# Tile coordinates are integers in [0, TILE_EXTENT) on both axes
+TILE_EXTENT = 1024
+
+# Geometry is clipped this many tile units beyond the tile edge so outlines
+# are not drawn along tile borders
+TILE_BUFFER = 16
+
+# Latitude limit of the Web Mercator projection
+MAX_LATITUDE = 85.0511287798
+
+
+def _mercator(coords):
+    """Project lon/lat coordinates to Web Mercator, normalized to [0, 1]."""
+    import numpy as np
+
+    lon = coords[:, 0]
+    lat = np.clip(coords[:, 1], -MAX_LATITUDE, MAX_LATITUDE)
+    x = (lon + 180.0) / 360.0
+    y = (1.0 - np.log(np.tan(np.radians(lat)) + 1.0 / np.cos(np.radians(lat))) / math.pi) / 2.0
+    return np.column_stack([x, y])
+
+
+def _lonlat(x, y):
+    """Unproject normalized Web Mercator coordinates to lon/lat."""
+    lon = x * 360.0 - 180.0
+    lat = math.degrees(math.atan(math.sinh(math.pi * (1.0 - 2.0 * y))))
+    return lon, lat
+
+
+def is_valid_tile(z, x, y):
+    return 0 <= z <= MAX_ZOOM and 0 <= x < 2 ** z and 0 <= y < 2 ** z
+
+
+def render_tile(which_map, z, x, y):
+    """
+    Cut a single tile out of a layer.
+
+    Features touching the tile are picked by the bounding boxes of the
+    geometry store, so only their geometries are built and projected. They
+    are clipped to the tile, simplified to half a pixel at this zoom and
+    quantized to integer tile coordinates, with y pointing down.
+
+    :param which_map: A key of ``LAYERS``.
+    :return: A dict with the tile ``extent`` and its ``features``, each holding
+        the feature ``name``, ``code`` and a list of ``rings`` as flat
+        ``[x0, y0, x1, y1, ...]`` lists.
+    """
+    import numpy as np
+    import shapely
+
+    store = open_store(which_map)
+
+    scale = 2 ** z * TILE_EXTENT
+    buffer = TILE_BUFFER / scale
+    bounds = (x / 2 ** z - buffer, y / 2 ** z - buffer,
+              (x + 1) / 2 ** z + buffer, (y + 1) / 2 ** z + buffer)
+    west, north = _lonlat(max(bounds[0], 0.0), max(bounds[1], 0.0))
+    east, south = _lonlat(min(bounds[2], 1.0), min(bounds[3], 1.0))
+    # Polar latitudes are clamped onto the edge rows by the projection
+    if bounds[1] <= 0:
+        north = 90.0
+    if bounds[3] >= 1:
+        south = -90.0
+
+    indices = store.query_bbox(west, south, east, north)
+    projected = shapely.transform(store.geometries(indices), _mercator)
+
+    features = []
+    for index, geometry in zip(indices, projected):
+        geometry = shapely.clip_by_rect(geometry, *bounds)
+        geometry = shapely.simplify(geometry, 0.5 * TILE_EXTENT / 256 / scale)
+        if geometry.is_empty:
+            continue
+
+        rings = []
+        for polygon in getattr(geometry, 'geoms', [geometry]):
+            if polygon.geom_type != 'Polygon':
+                continue
+            for ring in [polygon.exterior, *polygon.interiors]:
+                coords = np.rint(np.asarray(ring.coords) * scale - (x * TILE_EXTENT, y * TILE_EXTENT))
+                if len(coords) >= 4:
+                    rings.append(coords.astype(int).ravel().tolist())
+        if rings:
+            features.append({**store.properties[index], 'rings': rings})
+
+    return {'extent': TILE_EXTENT, 'features': features}
+
+
+def tile_path(cache_dir, which_map, z, x, y):
+    return os.path.join(cache_dir, which_map, str(z), str(x), f'{y}.json')
+
+
+def get_tile(cache_dir, which_map, z, x, y):
+    """
+    Return the path of a tile, rendering it into ``cache_dir`` on first use.
+
+    Tiles are laid out as ``<which_map>/<z>/<x>/<y>.json`` so the cache
+    directory can be served by nginx as-is once warm.
+    """
+    path = tile_path(cache_dir, which_map, z, x, y)
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tile = render_tile(which_map, z, x, y)
+
+        # Write to a temporary file first so concurrent workers never serve a partial tile
+        temp_path = f'{path}.{os.getpid()}.tmp'
+        with open(temp_path, 'w') as file:
+            json.dump(tile, file, separators=(',', ':'))
+        os.replace(temp_path, path)
+    return path
@@ -1,9 +1,17 @@
+import base64
 import json
 import uuid
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import func
+from sqlalchemy import and_, case, func, or_, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import object_session
 
 from app.extensions import db
+from app.models.batch import BatchMutations
+from app.models.changes import ChangeFeed
+from app.models.lookup import PrimaryKeyLookup
+from app.models.serialize import Serializable, records
+from app.models.travelers import Traveler
 
 # File path for the visited data file
 visited_file_path = 'instance/visited.json'
@@ -11,30 +19,100 @@ visited_file_path = 'instance/visited.json'
 # File path for the links data file
 links_file_path = 'instance/links.json'
 
+# Distance between the positions of consecutive links after a rebalance,
+# so about log2(POSITION_GAP) moves fit between two links before it is needed
+POSITION_GAP = 1024
 
-class Visited(db.Model):
+# Gap below which a move rebalances the positions before taking its own
+REBALANCE_GAP = 8
+
+
+class Visited(PrimaryKeyLookup, BatchMutations, Serializable, ChangeFeed, db.Model):
     id = db.Column(db.String(36), primary_key=True)
     name = db.Column(db.String(120), nullable=False)
-    john = db.Column(db.Boolean, default=False)
-    marcia = db.Column(db.Boolean, default=False)
+    travelers = db.Column(db.Integer, nullable=False, default=0)  # Bitmask of Traveler.bit
     todo = db.Column(db.Boolean, default=False)
     which_map = db.Column(db.String(50))
 
+    __table_args__ = (
+        db.Index('ix_visited_which_map_name', 'which_map', 'name'),
+    )
+
+    batch_required = ('name', 'which_map')
+
     def __str__(self):
         return str(self.__class__) + ": " + str(self.__dict__)
     
-    def to_dict(self):
-        return {column.name: getattr(self, column.name) for column in self.__table__.columns}
-    
     @staticmethod
     def load_visited_data():
-        return [visited.to_dict() for visited in Visited.query.all()]
+        return records(*Visited.select_rows())
+
+    @classmethod
+    def expand_travelers(cls, fields, rows):
+        """
+        Replace the travelers bitmask of row tuples by a boolean per traveler,
+        keyed by the traveler's name.
+
+        :param fields: The field names of the rows.
+        :param rows: A list of row tuples.
+        :return: A tuple of the new field names and the new list of row tuples.
+        """
+        fields = tuple(fields)
+        if 'travelers' not in fields:
+            return fields, rows
+        index = fields.index('travelers')
+        bits = Traveler.bits()
+        fields = fields[:index] + tuple(name for name, _ in bits) + fields[index + 1:]
+        rows = [row[:index] + tuple(bool(row[index] >> bit & 1) for _, bit in bits) + row[index + 1:]
+                for row in rows]
+        return fields, rows
+
+    @classmethod
+    def select_rows(cls, *criteria, order_by=()):
+        return cls.expand_travelers(*super().select_rows(*criteria, order_by=order_by))
+
+    def to_dict(self):
+        # The bitmask of a single instance is expanded in place, from the
+        # flags memoized in its session; listings expand it over row tuples
+        # in select_rows instead
+        entry = super().to_dict()
+        entry.update(Traveler.flags(entry.pop('travelers'), object_session(self)))
+        return entry
+
+    @classmethod
+    def column_values(cls, data, current=None):
+        """
+        Translate the fields of an API payload into column values.
+
+        A boolean per traveler name, or a 'travelers' list of names, is
+        folded into the ``travelers`` bitmask; a 'travelers' integer is taken
+        as the bitmask itself, as in table dumps.
+
+        :param data: A dict of fields.
+        :param current: A dict of the current column values, whose bitmask the traveler flags are applied to.
+        :return: A dict of column values.
+        :raises ValueError: If 'travelers' names an unknown traveler.
+        """
+        bits = dict(Traveler.bits())
+        values, mask, changed = {}, (current or {}).get('travelers') or 0, False
+        for key, value in data.items():
+            if key in bits:
+                mask = mask | 1 << bits[key] if value else mask & ~(1 << bits[key])
+                changed = True
+            elif key == 'travelers':
+                mask = value if isinstance(value, int) else Traveler.mask(value)
+                changed = True
+            else:
+                values[key] = value
+        if changed:
+            values['travelers'] = mask
+        return values
 
     @classmethod
     def update_entry(cls, id, data):
-        visited_entry = cls.query.get(id)
+        visited_entry = cls.get_by_id(id)
         if visited_entry:
-            for key, value in data.items():
+            for key, value in cls.column_values(data, {'travelers': visited_entry.travelers}).items():
                 if hasattr(visited_entry, key):
                     setattr(visited_entry, key, value)
             db.session.commit()
@@ -43,7 +121,7 @@ class Visited(db.Model):
     
     @classmethod
     def delete_by_id(cls, id):
-        visited_entry = cls.query.get(id)
+        visited_entry = cls.get_by_id(id)
         if visited_entry:
             db.session.delete(visited_entry)
             db.session.commit()
@@ -51,18 +129,17 @@ class Visited(db.Model):
         return False
     
     @staticmethod
-    def save_visited_data(name, john, marcia, todo, which_map):
-        visited = Visited(name=name, john=john, marcia=marcia, todo=todo, which_map=which_map)
+    def save_visited_data(name, travelers, todo, which_map):
+        visited = Visited(name=name, travelers=travelers, todo=todo, which_map=which_map)
         db.session.add(visited)
         db.session.commit()
 
     @classmethod
-    def add_new_entry(cls, name, john, marcia, todo, which_map):
+    def add_new_entry(cls, name, travelers, todo, which_map):
         new_visited = cls(
             id=str(uuid.uuid4()),  # Generate a unique UUID for the new entry
             name=name,
-            john=john,
-            marcia=marcia,
+            travelers=travelers,
             todo=todo,
             which_map=which_map
         )
@@ -71,37 +148,185 @@ class Visited(db.Model):
         return new_visited
     
     @classmethod
-    def import_visited_data(cls):
-        with open('instance/visited.json', 'r') as file:
-            visited_data = json.load(file)
-            for item in visited_data:
-                visited = cls(
-                    name=item['name'],
-                    id=item['id'],
-                    john=item['john'],
-                    marcia=item['marcia'],
-                    todo=item['todo'],
-                    which_map=item['which_map']
-                )
-                db.session.add(visited)
-            db.session.commit()
+    def query_map(cls, which_map, fields=None, limit=None, after=None):
+        """
+        Load the entries of one map, ordered by name, with an indexed query.
+
+        Pages are fetched with a keyset cursor on ``(name, id)`` so every page
+        is an index range scan, however deep into the map it is.
+
+        :param which_map: The map to load, 'world', 'states' or 'cities'.
+        :param fields: Field names to return, columns or traveler names, defaults to every field.
+        :param limit: The maximum number of entries to return, defaults to all of them.
+        :param after: The cursor returned with the previous page.
+        :return: A tuple of the field names, the list of row tuples and the
+            cursor of the next page, or None when there are no more entries.
+        :raises ValueError: If a field is unknown or the cursor is invalid.
+        """
+        names = Traveler.names()
+        available = [column.name for column in cls.__table__.columns if column.name != 'travelers']
+        fields = list(fields or cls.expand_travelers(cls.serializer()[0], [])[0])
+        unknown = set(fields) - set(available) - set(names)
+        if unknown:
+            raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}")
+
+        # Traveler flags are all read from the bitmask
+        selected = [field for field in fields if field in available]
+        if set(fields) & set(names):
+            selected.append('travelers')
+        columns = [cls.__table__.columns[field] for field in selected]
+        query = (db.session.query(cls.name, cls.id, *columns)
+                 .filter(cls.which_map == which_map)
+                 .order_by(cls.name, cls.id))
+        if after:
+            try:
+                name, id = json.loads(base64.urlsafe_b64decode(after.encode()))
+            except (ValueError, TypeError):
+                raise ValueError("Invalid cursor")
+            query = query.filter(or_(cls.name > name, and_(cls.name == name, cls.id > id)))
+        if limit is not None:
+            query = query.limit(limit + 1)
+
+        rows = query.all()
+        next_cursor = None
+        if limit is not None and len(rows) > limit:
+            rows = rows[:limit]
+            last = rows[-1]
+            next_cursor = base64.urlsafe_b64encode(json.dumps([last[0], last[1]]).encode()).decode()
+        expanded, rows = cls.expand_travelers(selected, [tuple(row[2:]) for row in rows])
+        if list(expanded) != fields:
+            positions = [expanded.index(field) for field in fields]
+            rows = [tuple(row[position] for position in positions) for row in rows]
+        return fields, rows, next_cursor
+
+    @classmethod
+    def visit_status(cls, which_map):
+        """
+        Return the visit status of every place of a map.
 
-class Links(db.Model):
+        :param which_map: The map to load, 'world', 'states' or 'cities'.
+        :return: A dict mapping place names to dicts of a flag per traveler and the 'todo' flag.
+        """
+        bits = Traveler.bits()
+        rows = (cls.query
+                .with_entities(cls.name, cls.travelers, cls.todo)
+                .filter(cls.which_map == which_map)
+                .order_by(cls.name))
+        return {name: {**{traveler: bool(mask >> bit & 1) for traveler, bit in bits}, 'todo': bool(todo)}
+                for name, mask, todo in rows}
+
+    @classmethod
+    def stats(cls, which_map=None):
+        """
+        Count the visited places per traveler and per combination of travelers.
+
+        The entries are grouped by map, travelers bitmask and todo flag in a
+        single query; the per-traveler counts are summed from the groups.
+
+        :param which_map: The map to count, defaults to every map.
+        :return: A dict mapping each map to a dict with the 'total' number of
+            places, the number of 'todo' places, the number of places 'visited'
+            by any traveler, a count per traveler under 'travelers' and the
+            'combinations' of travelers with their counts, most common first.
+        """
+        query = (db.session.query(cls.which_map, cls.travelers, func.count(), func.sum(case((cls.todo, 1), else_=0)))
+                 .group_by(cls.which_map, cls.travelers))
+        if which_map is not None:
+            query = query.filter(cls.which_map == which_map)
+
+        bits = Traveler.bits()
+        stats = {}
+        for place_map, mask, count, todo in query:
+            summary = stats.setdefault(place_map, {
+                'total': 0, 'todo': 0, 'visited': 0,
+                'travelers': {name: 0 for name, _ in bits}, 'combinations': [],
+            })
+            summary['total'] += count
+            summary['todo'] += todo or 0
+            names = [name for name, bit in bits if mask >> bit & 1]
+            if names:
+                summary['visited'] += count
+            for name in names:
+                summary['travelers'][name] += count
+            summary['combinations'].append({'travelers': names, 'count': count})
+        for summary in stats.values():
+            summary['combinations'].sort(key=lambda combination: (-combination['count'], combination['travelers']))
+        return stats
+
+    @classmethod
+    def mark_visited(cls, places, traveler):
+        """
+        Mark places as visited by a traveler in a single transaction.
+
+        :param places: A dict mapping a map ('world', 'states', 'cities') to place names.
+        :param traveler: The name of the traveler.
+        :return: A tuple of the lists of added and updated entries.
+        :raises ValueError: If the traveler does not exist.
+        """
+        bit = Traveler.mask([traveler])
+        added, updated = [], []
+        for which_map, names in places.items():
+            existing = {
+                visited.name: visited
+                for visited in cls.query.filter(cls.which_map == which_map, cls.name.in_(names))
+            }
+            for name in sorted(names):
+                visited = existing.get(name)
+                if visited is None:
+                    visited = cls(id=str(uuid.uuid4()), name=name, travelers=0,
+                                  todo=False, which_map=which_map)
+                    db.session.add(visited)
+                    added.append(visited)
+                elif not visited.travelers & bit:
+                    updated.append(visited)
+                else:
+                    continue
+                visited.travelers |= bit
+        db.session.commit()
+        return added, updated
+
+class Links(PrimaryKeyLookup, BatchMutations, Serializable, ChangeFeed, db.Model):
+    """
+    A travel link, ordered by a sparse ``position``.
+
+    Positions are ``POSITION_GAP`` apart, so moving a link between two others
+    takes the midpoint of their positions and updates a single row. The
+    positions are spread out again only once the gaps between them run out.
+    """
     id = db.Column(db.String(36), primary_key=True)
     name = db.Column(db.String(120), nullable=False)
     url = db.Column(db.String(200), nullable=False)
     notes = db.Column(db.Text, nullable=True)
     position = db.Column(db.Integer)
 
+    __table_args__ = (
+        db.Index('ix_links_position', 'position', unique=True),
+    )
+
+    batch_required = ('name', 'url')
+
     def __str__(self):
         return str(self.__class__) + ": " + str(self.__dict__)
     
-    def to_dict(self):
-        return {column.name: getattr(self, column.name) for column in self.__table__.columns}
-    
+    @classmethod
+    def next_position(cls):
+        """Return the position after the last link, read from the end of the position index."""
+        return (db.session.query(func.max(cls.position)).scalar() or 0) + POSITION_GAP
+
+    @classmethod
+    def batch_defaults(cls, rows):
+        # New links are appended after the current last position, in batch order
+        next_position = cls.next_position()
+        for row in rows:
+            row.setdefault('notes', '')
+            if row.get('position') is None:
+                row['position'] = next_position
+                next_position += POSITION_GAP
+        return rows
+
     @staticmethod
     def load_links_data():
-        return [link.to_dict() for link in Links.query.all()]
+        return [link.to_dict() for link in Links.query.order_by(Links.position).all()]
 
     @staticmethod
     def save_links_data(name, url, notes, position):
@@ -111,18 +336,13 @@ class Links(db.Model):
 
     @staticmethod
     def add_link(name, url, notes):
-        # Find the highest position value in the database
-        max_position = db.session.query(func.max(Links.position)).scalar() or 0
-        # Calculate the next position
-        next_position = max_position + 1
-
-        # Create a new link with the next position
+        # Create a new link after the last one
         link = Links(
             id=str(uuid.uuid4()),  # Generate a unique UUID for the new link
             name=name,
             url=url,
             notes=notes,
-            position=next_position
+            position=Links.next_position()
         )
         db.session.add(link)
         db.session.commit()
@@ -135,31 +355,105 @@ class Links(db.Model):
         db.session.commit()
 
     @classmethod
-    def get_by_id(cls, id):
-        return cls.query.get(id)
-    
+    def _position_of(cls, id):
+        position = db.session.query(cls.position).filter(cls.id == id).scalar()
+        if position is None:
+            raise ValueError(f"Unknown link: {id}")
+        return position
+
+    @classmethod
+    def _neighbors(cls, id, after=None, before=None):
+        # The positions between which the link goes, each found with one
+        # lookup on the position index; the link itself is left out.
+        others = cls.id != id
+        if after is not None:
+            low = cls._position_of(after)
+            if before is not None:
+                high = cls._position_of(before)
+            else:
+                high = (db.session.query(func.min(cls.position)).filter(cls.position > low, others).scalar()
+                        or low + 2 * POSITION_GAP)
+        else:
+            high = cls._position_of(before)
+            low = db.session.query(func.max(cls.position)).filter(cls.position < high, others).scalar() or 0
+        if low >= high:
+            raise ValueError("The after link must come before the before link")
+        if before is not None and after is not None:
+            between = (db.session.query(cls.id)
+                       .filter(cls.position > low, cls.position < high, others)
+                       .first())
+            if between:
+                raise ValueError("after and before must be next to each other")
+        return low, high
+
+    @classmethod
+    def move(cls, id, after=None, before=None):
+        """
+        Move a link between two others, updating only its own position unless
+        the gap between them ran out and every position is spread out again.
+
+        :param id: The id of the link to move.
+        :param after: The id of the link to put it after, None to put it first.
+        :param before: The id of the link to put it before, None to put it last.
+            At least one of ``after`` and ``before`` is required.
+        :return: The moved link, or None if it does not exist.
+        :raises ValueError: If neither neighbor is given, a neighbor does not
+            exist or is the link itself, or the neighbors are not adjacent.
+        :raises IntegrityError: If concurrent moves took the position twice.
+        """
+        link = cls.get_by_id(id)
+        if link is None:
+            return None
+        if after is None and before is None:
+            raise ValueError("after or before is required")
+        if id in (after, before):
+            raise ValueError("A link cannot be moved next to itself")
+
+        # A concurrent move or rebalance may take the same position first, so
+        # the move is retried once on the positions it committed
+        for attempt in range(2):
+            try:
+                low, high = cls._neighbors(id, after, before)
+                if high - low < 2 * REBALANCE_GAP:
+                    # Rebalanced in the same transaction, so the neighbors
+                    # are never read from half-renumbered positions
+                    cls._renumber()
+                    low, high = cls._neighbors(id, after, before)
+                link.position = (low + high) // 2
+                db.session.commit()
+                return link
+            except IntegrityError:
+                db.session.rollback()
+                if attempt:
+                    raise
+
+    @classmethod
+    def _renumber(cls):
+        ids = [id for (id,) in db.session.query(cls.id).order_by(cls.position.is_(None), cls.position, cls.id)]
+        # Negate the positions first so the new ones never collide with old
+        # ones under the unique index while the rows are renumbered
+        db.session.execute(update(cls).where(cls.position > 0).values(position=-cls.position))
+        if ids:
+            db.session.execute(update(cls), [{'id': id, 'position': (index + 1) * POSITION_GAP}
+                                             for index, id in enumerate(ids)])
+        return len(ids)
+
+    @classmethod
+    def rebalance(cls):
+        """
+        Spread the positions ``POSITION_GAP`` apart again, keeping the order.
+
+        :return: The number of links renumbered.
+        """
+        count = cls._renumber()
+        db.session.commit()
+        return count
+
     @classmethod
     def delete_by_id(cls, id):
-        link_to_delete = cls.query.get(id)
+        link_to_delete = cls.get_by_id(id)
         if link_to_delete:
             db.session.delete(link_to_delete)
             db.session.commit()
             return True
         return False
-
-    @classmethod
-    def import_links_data(cls):
-        db.drop_all()
-        db.create_all()
-        with open('instance/links.json', 'r') as file:
-            links_data = json.load(file)
-            for item in links_data:
-                link = cls(
-                    id=item['id'],
-                    name=item['name'],
-                    url=item['url'],
-                    notes=item['notes'],
-                    position=item['position']
-                )
-                db.session.add(link)
-            db.session.commit()
@@ -0,0 +1,156 @@
+import re
+
+from app.extensions import db
+from app.models.lookup import PrimaryKeyLookup
+
+# The visited bitmask is a 32-bit signed integer, so bits 0 to 30 are usable
+MAX_TRAVELERS = 31
+
+NAME_PATTERN = re.compile(r'^[a-z][a-z0-9_]{0,49}$')
+
+# Travelers of a new database, in bit order
+DEFAULT_TRAVELERS = ('john', 'marcia')
+
+# Keys of visited entries that traveler names would clash with
+RESERVED_NAMES = {'id', 'name', 'todo', 'which_map', 'travelers'}
+
+# Fill color of the places visited by a single traveler, by bit, wrapping
+# around past the last; places visited by several travelers are SHARED_COLOR
+TRAVELER_COLORS = ('blue', 'red', 'green', 'orange', 'teal', 'brown', 'olive', 'navy')
+SHARED_COLOR = 'purple'
+
+
+class Traveler(PrimaryKeyLookup, db.Model):
+    """
+    A person whose visits are tracked, owning one bit of ``Visited.travelers``.
+
+    Visited entries are serialized with a boolean per traveler under the
+    traveler's name, so adding a traveler needs no schema change.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(50), nullable=False, unique=True)
+    bit = db.Column(db.Integer, nullable=False, unique=True)
+
+    @property
+    def color(self):
+        return TRAVELER_COLORS[self.bit % len(TRAVELER_COLORS)]
+
+    def to_dict(self):
+        return {'id': self.id, 'name': self.name, 'bit': self.bit, 'color': self.color}
+
+    @classmethod
+    def bits(cls, session=None):
+        """
+        Return the name and bit of every traveler, ordered by bit.
+
+        Loaded once per session, that is once per request, since serializing
+        visited entries needs them for every row.
+
+        :param session: The session to load them with, defaults to ``db.session``.
+        :return: A list of ``(name, bit)`` tuples.
+        """
+        session = db.session if session is None else session
+        bits = session.info.get('traveler_bits')
+        if bits is None:
+            bits = session.info['traveler_bits'] = [(name, bit) for name, bit in
+                                                    session.query(cls.name, cls.bit).order_by(cls.bit)]
+        return bits
+
+    @classmethod
+    def flags(cls, mask, session=None):
+        """
+        Return the flag of every traveler in a bitmask, ordered by bit.
+
+        Memoized per mask next to ``bits``, as a table only holds a few
+        distinct masks.
+
+        :param mask: A travelers bitmask.
+        :param session: The session the travelers are loaded with, defaults to ``db.session``.
+        :return: A list of ``(name, bool)`` tuples.
+        """
+        info = (db.session if session is None else session).info
+        flags = info.get('traveler_flags')
+        if flags is None:
+            flags = info['traveler_flags'] = {}
+        expanded = flags.get(mask)
+        if expanded is None:
+            expanded = flags[mask] = [(name, bool(mask >> bit & 1)) for name, bit in cls.bits(session)]
+        return expanded
+
+    @staticmethod
+    def _forget():
+        db.session.info.pop('traveler_bits', None)
+        db.session.info.pop('traveler_flags', None)
+
+    @classmethod
+    def names(cls):
+        """Return the names of the travelers, ordered by bit."""
+        return [name for name, _ in cls.bits()]
+
+    @classmethod
+    def colors(cls):
+        """Return the name and fill color of every traveler, ordered by bit."""
+        return [(name, TRAVELER_COLORS[bit % len(TRAVELER_COLORS)]) for name, bit in cls.bits()]
+
+    @classmethod
+    def mask(cls, names):
+        """
+        Return the bitmask of a set of travelers.
+
+        :param names: Traveler names.
+        :raises ValueError: If a name is not a traveler.
+        """
+        bits = dict(cls.bits())
+        unknown = set(names) - set(bits)
+        if unknown:
+            raise ValueError(f"Unknown travelers: {', '.join(sorted(unknown))}")
+        mask = 0
+        for name in names:
+            mask |= 1 << bits[name]
+        return mask
+
+    @classmethod
+    def unmask(cls, mask):
+        """Return the names of the travelers set in a bitmask."""
+        return [name for name, bit in cls.bits() if mask >> bit & 1]
+
+    @classmethod
+    def create_defaults(cls):
+        """
+        Add the ``DEFAULT_TRAVELERS`` to a database without travelers.
+
+        :return: The travelers added.
+        """
+        if db.session.query(cls.id).first():
+            return []
+        travelers = [cls(name=name, bit=bit) for bit, name in enumerate(DEFAULT_TRAVELERS)]
+        db.session.add_all(travelers)
+        db.session.commit()
+        cls._forget()
+        return travelers
+
+    @classmethod
+    def add(cls, name):
+        """
+        Add a traveler on the lowest free bit.
+
+        :param name: A lowercase identifier, used as the key of the traveler's
+            flag in visited entries.
+        :return: The new traveler.
+        :raises ValueError: If the name is invalid or taken, or every bit is in use.
+        """
+        if not isinstance(name, str) or not NAME_PATTERN.match(name) or name in RESERVED_NAMES:
+            raise ValueError("name must be a lowercase identifier other than "
+                             + ', '.join(sorted(RESERVED_NAMES)))
+        if db.session.query(cls.id).filter(cls.name == name).first():
+            raise ValueError(f"Traveler {name} already exists")
+        used = {bit for (bit,) in db.session.query(cls.bit)}
+        free = [bit for bit in range(MAX_TRAVELERS) if bit not in used]
+        if not free:
+            raise ValueError(f"There can be at most {MAX_TRAVELERS} travelers")
+
+        traveler = cls(name=name, bit=free[0])
+        db.session.add(traveler)
+        db.session.commit()
+        cls._forget()
+        return traveler
@@ -0,0 +1,133 @@
+import hashlib
+from datetime import datetime
+from functools import wraps
+
+from flask import make_response, request
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app.extensions import db
+
+
+class TableVersion(db.Model):
+    """A version counter per table, bumped in the transaction of every write to it."""
+    __tablename__ = 'table_version'
+
+    table_name = db.Column(db.String(64), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    @classmethod
+    def current(cls, tables):
+        """
+        Get the versions of some tables in a single query.
+
+        :param tables: Table names.
+        :return: A dict mapping each table name to a tuple of its version and
+            the time it was last written, ``(0, None)`` if it never was.
+        """
+        rows = (db.session.query(cls.table_name, cls.version, cls.updated_at)
+                .filter(cls.table_name.in_(tables)))
+        versions = {table: (0, None) for table in tables}
+        versions.update({table: (version, updated_at) for table, version, updated_at in rows})
+        return versions
+
+
+def bump_versions(connection, tables):
+    """
+    Increment the versions of tables within the transaction of ``connection``.
+
+    :param connection: The connection of the transaction writing the tables.
+    :param tables: Table names.
+    """
+    table = TableVersion.__table__
+    now = datetime.utcnow()
+    dialect = connection.dialect.name
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    elif dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    else:
+        dialect_insert = None
+
+    for name in sorted(tables):
+        if dialect_insert:
+            # A single upsert, so concurrent first writers of a table don't race on the primary key
+            statement = dialect_insert(table).values(table_name=name, version=1, updated_at=now)
+            connection.execute(statement.on_conflict_do_update(
+                index_elements=[table.c.table_name],
+                set_={'version': table.c.version + 1, 'updated_at': statement.excluded.updated_at},
+            ))
+            continue
+        result = connection.execute(
+            table.update()
+            .where(table.c.table_name == name)
+            .values(version=table.c.version + 1, updated_at=now)
+        )
+        if result.rowcount == 0:
+            connection.execute(table.insert().values(table_name=name, version=1, updated_at=now))
+
+
+@event.listens_for(Session, 'after_flush')
+def _bump_flushed_tables(session, flush_context):
+    tables = {obj.__table__.name for obj in session.new | session.deleted}
+    tables |= {obj.__table__.name for obj in session.dirty if session.is_modified(obj)}
+    tables.discard(TableVersion.__tablename__)
+    if tables:
+        bump_versions(session.connection(), tables)
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _bump_bulk_tables(orm_execute_state):
+    # Bulk INSERT, UPDATE and DELETE statements bypass the flush
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        table = orm_execute_state.statement.table
+        if table.name != TableVersion.__tablename__:
+            bump_versions(orm_execute_state.session.connection(), [table.name])
+
+
+def versioned(*models, key=None):
+    """
+    Decorator answering GET requests conditionally on the versions of tables.
+
+    The strong ETag hashes the request path and query string with the
+    versions of the tables of ``models``, and Last-Modified is the time they
+    were last written. A request whose If-None-Match or If-Modified-Since
+    still matches is answered with 304 Not Modified before the view runs, so
+    no rows are loaded or serialized.
+
+    Args:
+        *models: The models whose tables the view reads.
+        key (callable, optional): Returns any other input the response depends on, such as the current month, to hash into the ETag.
+    """
+    tables = [model.__table__.name for model in models]
+
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            versions = TableVersion.current(tables)
+            payload = repr((request.full_path, sorted((table, version) for table, (version, _) in versions.items()),
+                            key() if key else None))
+            etag = hashlib.sha256(payload.encode()).hexdigest()[:32]
+            written = [updated_at for _, updated_at in versions.values() if updated_at]
+            last_modified = max(written).replace(microsecond=0) if written else None
+
+            if request.if_none_match:
+                fresh = request.if_none_match.contains(etag)
+            else:
+                since = request.if_modified_since
+                fresh = bool(last_modified and since and last_modified <= since.replace(tzinfo=None))
+            if fresh:
+                response = make_response('', 304)
+                response.set_etag(etag)
+                return response
+
+            response = make_response(f(*args, **kwargs))
+            if response.status_code == 200:
+                response.set_etag(etag)
+                if last_modified:
+                    response.last_modified = last_modified
+                response.cache_control.no_cache = True
+            return response
+        return decorated_function
+    return decorator
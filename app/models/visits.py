@@ -0,0 +1,300 @@
+import uuid
+from datetime import date
+
+from sqlalchemy import event, extract, func, select
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import get_history
+
+from app.extensions import db
+from app.models.lookup import PrimaryKeyLookup
+from app.models.serialize import Serializable
+from app.models.travel import Visited
+from app.models.travelers import Traveler
+from app.models.versions import TableVersion, bump_versions
+
+# Prefix of the per-year versions of the visit table in TableVersion
+YEAR_VERSION = 'visit:'
+
+# Version bumped by bulk writes, whose years are unknown
+ALL_YEARS_VERSION = 'visit:*'
+
+# Most results kept in the per-worker cache
+CACHE_SIZE = 256
+
+_year_cache = {}
+
+
+class Visit(PrimaryKeyLookup, Serializable, db.Model):
+    """
+    A dated stay of a traveler at a place of one of the maps.
+
+    Visits are indexed on their arrival date, so questions about a date or a
+    year are range scans, and on the place for the first visit of every place.
+    """
+    id = db.Column(db.String(36), primary_key=True)
+    traveler_id = db.Column(db.Integer, db.ForeignKey('traveler.id'), nullable=False)
+    which_map = db.Column(db.String(50), nullable=False)
+    name = db.Column(db.String(120), nullable=False)
+    arrived = db.Column(db.Date, nullable=False)
+    departed = db.Column(db.Date, nullable=True)  # None for a single day
+
+    __table_args__ = (
+        db.Index('ix_visit_arrived', 'arrived'),
+        db.Index('ix_visit_traveler_id_arrived', 'traveler_id', 'arrived'),
+        db.Index('ix_visit_which_map_name_arrived', 'which_map', 'name', 'arrived'),
+    )
+
+    def to_dict(self):
+        data = super().to_dict()
+        data['traveler'] = db.session.get(Traveler, self.traveler_id).name
+        return data
+
+    @classmethod
+    def add(cls, traveler, which_map, name, arrived, departed=None):
+        """
+        Add a visit and mark the place as visited by the traveler.
+
+        :param traveler: The name of the traveler.
+        :param which_map: The map of the place, 'world', 'states' or 'cities'.
+        :param name: The name of the place.
+        :param arrived: The arrival date.
+        :param departed: The departure date, None for a single day.
+        :return: The new visit.
+        :raises ValueError: If the traveler does not exist or the visit ends before it starts.
+        """
+        traveler_id = cls._traveler_id(traveler)
+        if departed is not None and departed < arrived:
+            raise ValueError("departed must not be before arrived")
+
+        visit = cls(id=str(uuid.uuid4()), traveler_id=traveler_id, which_map=which_map, name=name,
+                    arrived=arrived, departed=departed)
+        db.session.add(visit)
+        Visited.mark_visited({which_map: [name]}, traveler)
+        return visit
+
+    @classmethod
+    def column_values(cls, data):
+        """
+        Translate the fields of an API payload into column values.
+
+        :param data: A dict of fields, with the traveler's name under
+            'traveler' and the dates as ISO 8601 strings.
+        :return: A dict of column values.
+        :raises ValueError: If the traveler does not exist or a date is invalid.
+        """
+        values = {}
+        for key, value in data.items():
+            if key == 'traveler':
+                values['traveler_id'] = cls._traveler_id(value)
+            elif key in ('arrived', 'departed'):
+                values[key] = date.fromisoformat(value) if isinstance(value, str) else value
+            elif key in ('which_map', 'name'):
+                values[key] = value
+        return values
+
+    @classmethod
+    def update_entry(cls, id, data):
+        """
+        Update a visit, marking its place as visited if the place or traveler changed.
+
+        :param id: The id of the visit.
+        :param data: A dict of fields, as taken by ``column_values``.
+        :return: The updated visit, or None if it does not exist.
+        :raises ValueError: If a field is invalid or the visit would end before it starts.
+        """
+        visit = cls.get_by_id(id)
+        if visit is None:
+            return None
+        for key, value in cls.column_values(data).items():
+            setattr(visit, key, value)
+        if visit.departed is not None and visit.departed < visit.arrived:
+            db.session.rollback()
+            raise ValueError("departed must not be before arrived")
+
+        traveler = db.session.get(Traveler, visit.traveler_id).name
+        Visited.mark_visited({visit.which_map: [visit.name]}, traveler)
+        return visit
+
+    @classmethod
+    def delete_by_id(cls, id):
+        visit = cls.get_by_id(id)
+        if visit:
+            db.session.delete(visit)
+            db.session.commit()
+            return True
+        return False
+
+    @staticmethod
+    def _traveler_id(name):
+        traveler_id = db.session.query(Traveler.id).filter(Traveler.name == name).scalar()
+        if traveler_id is None:
+            raise ValueError(f"Unknown traveler: {name}")
+        return traveler_id
+
+    @classmethod
+    def _filters(cls, which_map=None, traveler=None):
+        filters = []
+        if which_map is not None:
+            filters.append(cls.which_map == which_map)
+        if traveler is not None:
+            filters.append(cls.traveler_id == cls._traveler_id(traveler))
+        return filters
+
+    @classmethod
+    def _rows(cls, query):
+        return [dict(row._mapping) for row in db.session.execute(query)]
+
+    @classmethod
+    def list(cls, start=None, end=None, which_map=None, traveler=None):
+        """
+        List the visits overlapping a date range, ordered by arrival.
+
+        :param start: The first date of the range, defaults to the first visit.
+        :param end: The last date of the range, defaults to the last visit.
+        :param which_map: The map to list, defaults to every map.
+        :param traveler: The name of the traveler to list, defaults to everyone.
+        :return: A list of visit dicts with the traveler's name under 'traveler'.
+        """
+        query = (select(cls.id, Traveler.name.label('traveler'), cls.which_map, cls.name, cls.arrived, cls.departed)
+                 .join(Traveler, Traveler.id == cls.traveler_id)
+                 .where(*cls._filters(which_map, traveler))
+                 .order_by(cls.arrived, cls.id))
+        if end is not None:
+            query = query.where(cls.arrived <= end)
+        if start is not None:
+            query = query.where(func.coalesce(cls.departed, cls.arrived) >= start)
+        return cls._rows(query)
+
+    @classmethod
+    def on(cls, day, traveler=None):
+        """
+        Find where the travelers were on a date.
+
+        :param day: The date.
+        :param traveler: The name of the traveler, defaults to everyone.
+        :return: A list of the visits spanning the date.
+        """
+        return cls.list(start=day, end=day, traveler=traveler)
+
+    @classmethod
+    def _first_visits(cls, before, which_map=None, traveler=None):
+        # Number the visits of every place by arrival, the first one is when it was new.
+        # Without a traveler a place is new the first time anyone visits it.
+        partition = [cls.which_map, cls.name] + ([cls.traveler_id] if traveler is not None else [])
+        numbered = (select(cls.which_map, cls.name, cls.arrived,
+                           func.row_number().over(partition_by=partition, order_by=(cls.arrived, cls.id))
+                           .label('visit_number'))
+                    .where(cls.arrived < before, *cls._filters(which_map, traveler))
+                    .subquery())
+        return select(numbered.c.which_map, numbered.c.name, numbered.c.arrived).where(numbered.c.visit_number == 1)
+
+    @classmethod
+    def new_places(cls, year, which_map=None, traveler=None):
+        """
+        List the places visited for the first time in a year.
+
+        :param year: The year.
+        :param which_map: The map to list, defaults to every map.
+        :param traveler: The name of the traveler, defaults to anyone.
+        :return: A list of dicts with the 'which_map' and 'name' of every
+            place and the date it was first 'arrived' at, in date order.
+        """
+        first = cls._first_visits(date(year + 1, 1, 1), which_map, traveler).subquery()
+        query = (select(first)
+                 .where(first.c.arrived >= date(year, 1, 1))
+                 .order_by(first.c.arrived, first.c.which_map, first.c.name))
+        return cls._rows(query)
+
+    @classmethod
+    def new_places_per_year(cls, which_map=None, traveler=None):
+        """
+        Count the places visited for the first time in every year.
+
+        :param which_map: The map to count, defaults to every map.
+        :param traveler: The name of the traveler, defaults to anyone.
+        :return: A list of dicts with the 'year', the number of 'new' places
+            that year and the running 'total' of places, in year order.
+        """
+        first = cls._first_visits(date.max, which_map, traveler).subquery()
+        year = extract('year', first.c.arrived).label('year')
+        new = func.count().label('new')
+        query = (select(year, new, func.sum(func.count()).over(order_by=year).label('total'))
+                 .group_by(year)
+                 .order_by(year))
+        return [{'year': int(row['year']), 'new': row['new'], 'total': int(row['total'])}
+                for row in cls._rows(query)]
+
+    @classmethod
+    def status_as_of(cls, day, which_map):
+        """
+        Return the visit status of the places of a map as of a date.
+
+        :param day: The date.
+        :param which_map: The map, 'world', 'states' or 'cities'.
+        :return: A dict mapping the names of the places visited by then to a
+            flag per traveler, like ``Visited.visit_status``.
+        """
+        rows = (db.session.query(cls.name, Traveler.name)
+                .join(Traveler, Traveler.id == cls.traveler_id)
+                .filter(cls.which_map == which_map, cls.arrived <= day)
+                .distinct())
+        names = Traveler.names()
+        status = {}
+        for place, traveler in rows:
+            status.setdefault(place, dict.fromkeys(names, False))[traveler] = True
+        return status
+
+
+def year_token(year):
+    """
+    Return the versions the results about a year and the years before it depend on.
+
+    A visit written in a year bumps that year's version, so results about
+    past years stay valid until a visit in one of them changes.
+    """
+    versions = (db.session.query(TableVersion.table_name, TableVersion.version)
+                .filter(TableVersion.table_name.like(YEAR_VERSION + '%')))
+    return tuple(sorted(
+        (name, version) for name, version in versions
+        if name == ALL_YEARS_VERSION or int(name[len(YEAR_VERSION):]) <= year
+    ))
+
+
+def cached_per_year(key, year, compute):
+    """
+    Return a result about a year from the per-worker cache, computing it on a miss.
+
+    :param key: A hashable key of the result, without the year.
+    :param year: The latest year the result depends on.
+    :param compute: Computes the result.
+    :return: A tuple of the token the result is valid for and the result.
+    """
+    token = year_token(year)
+    cached = _year_cache.get((key, year))
+    if cached is None or cached[0] != token:
+        if len(_year_cache) >= CACHE_SIZE:
+            _year_cache.clear()
+        cached = _year_cache[(key, year)] = (token, compute())
+    return cached
+
+
+@event.listens_for(Session, 'after_flush')
+def _bump_visit_years(session, flush_context):
+    years = set()
+    visits = [obj for obj in list(session.new) + list(session.deleted) if isinstance(obj, Visit)]
+    visits += [obj for obj in session.dirty if isinstance(obj, Visit) and session.is_modified(obj)]
+    for obj in visits:
+        # A moved visit changes the years it left as well as the ones it moved to
+        dates = [value for attribute in ('arrived', 'departed')
+                 for value in [getattr(obj, attribute)] + list(get_history(obj, attribute).deleted)
+                 if value is not None]
+        years.update(range(min(dates).year, max(dates).year + 1))
+    if years:
+        bump_versions(session.connection(), [f'{YEAR_VERSION}{year}' for year in years])
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _bump_bulk_visit_years(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        if orm_execute_state.statement.table.name == Visit.__tablename__:
+            bump_versions(orm_execute_state.session.connection(), [ALL_YEARS_VERSION])
@@ -50,6 +50,60 @@ document.addEventListener('DOMContentLoaded', function() {
             .catch(error => console.error('Error deleting link:', error));
         }
     }
+    // Move a link between its new neighbors, which updates only that link on the server
+    function moveLink(id, afterId, beforeId) {
+        fetch(apiURL + "/" + id + "/move", {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+            },
+            body: JSON.stringify({ after: afterId, before: beforeId }),
+        })
+        .then(response => {
+            if (!response.ok) {
+                throw new Error(response.statusText);
+            }
+            return response.json();
+        })
+        .then(data => console.log('Link moved:', data))
+        .catch(error => {
+            console.error('Error moving link:', error);
+            fetchLinks(); // Restore the order saved on the server
+        });
+    }
+
+    // The row being dragged, if any
+    let draggedRow = null;
+
+    function makeDraggable(row) {
+        row.draggable = true;
+        row.style.cursor = 'move';
+        row.addEventListener('dragstart', function(event) {
+            draggedRow = row;
+            event.dataTransfer.effectAllowed = 'move';
+        });
+        row.addEventListener('dragover', function(event) {
+            event.preventDefault();
+        });
+        row.addEventListener('drop', function(event) {
+            event.preventDefault();
+            if (!draggedRow || draggedRow === row) {
+                return;
+            }
+            // Drop above or below the row depending on which half the pointer is over
+            const rect = row.getBoundingClientRect();
+            const below = event.clientY > rect.top + rect.height / 2;
+            linksListElement.insertBefore(draggedRow, below ? row.nextSibling : row);
+
+            const previous = draggedRow.previousElementSibling;
+            const next = draggedRow.nextElementSibling;
+            moveLink(draggedRow.dataset.id, previous ? previous.dataset.id : null, next ? next.dataset.id : null);
+        });
+        row.addEventListener('dragend', function() {
+            draggedRow = null;
+        });
+    }
+
     // Fetch and display the links
     function fetchLinks() {
         fetch(apiURL)
@@ -97,6 +151,8 @@ document.addEventListener('DOMContentLoaded', function() {
         linksListElement.innerHTML = '';
         links.forEach(link => {
             const row = linksListElement.insertRow();
+            row.dataset.id = link.id;
+            makeDraggable(row);
             const viewModeHTML = `
                 <td><a href="${link.url}" target="_blank">${link.name}</a></td>
                 <td>${link.notes || ''}</td>
@@ -109,6 +165,7 @@ document.addEventListener('DOMContentLoaded', function() {
     
             // Attach event listeners to buttons
             row.querySelector('.edit-button').addEventListener('click', function() {
+                row.draggable = false; // Let the inputs be selected with the mouse
                 this.closest('tr').innerHTML = `
                     <td><input type="text" class="form-control link-name" value="${link.name}" data-id="${link.id}"></td>
                     <td><input type="text" class="form-control link-url" value="${link.url}" data-id="${link.id}"></td>
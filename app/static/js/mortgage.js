@@ -16,11 +16,10 @@ document.getElementById('mortgageForm').addEventListener('submit', function(e) {
     calculateMonthlyPayment(principal, interestRate, loanTerm);
 });
 
-// Helper function to add months to a date
-function addMonthsToDate(startDate, months) {
-    const date = new Date(startDate);
-    date.setMonth(date.getMonth() + months);
-    return date;
+// Function to turn a 'YYYY-MM' month into a local date
+function monthToDate(month) {
+    const [year, number] = month.split('-').map(Number);
+    return new Date(year, number - 1, 1);
 }
 
 // Function to format date as 'Month Year'
@@ -29,34 +28,9 @@ function formatDate(date) {
     return date.toLocaleDateString('en-US', options);
 }
 
-// Function to calculate amortization details
-function calculateAmortization(principal, interestRate, loanTerm, startDate) {
-    let schedule = [];
-    let monthlyInterestRate = interestRate / 100 / 12;
-    let monthlyPayment = (principal * monthlyInterestRate) / (1 - Math.pow(1 + monthlyInterestRate, -loanTerm * 12));
-    let totalPrincipalPaid = 0;
-    let totalInterestPaid = 0;
-    let currentDate = new Date();
-
-    for (let i = 0; i < loanTerm * 12; i++) {
-        let paymentDate = addMonthsToDate(startDate, i);
-        let interestPayment = principal * monthlyInterestRate;
-        let principalPayment = monthlyPayment - interestPayment;
-        principal -= principalPayment;
-        totalPrincipalPaid += principalPayment;
-        totalInterestPaid += interestPayment;
-        schedule.push({
-            paymentDate: paymentDate,
-            principalPayment: principalPayment,
-            interestPayment: interestPayment,
-            totalPayment: monthlyPayment,
-            balance: principal,
-            totalPrincipalPaid: totalPrincipalPaid,
-            totalInterestPaid: totalInterestPaid,
-            isCurrent: paymentDate >= currentDate && addMonthsToDate(startDate, i - 1) < currentDate
-        });
-    }
-    return schedule;
+// Function to fetch the amortization schedule computed on the server, with an array per field
+function fetchSchedule(mortgageId) {
+    return fetch(`/finances/api/mortgage/${mortgageId}/schedule?format=columns`).then(response => response.json());
 }
 
 // Calculate monthly mortgage payment
@@ -85,30 +59,30 @@ function calculateMortgageEndDate(startDate, termYears) {
 }
 
 // Function to build chart data
-function buildChartData(amortizationSchedule) {
+function buildChartData(schedule) {
     return {
-        labels: amortizationSchedule.map(item => formatDate(item.paymentDate)),
+        labels: schedule.month.map(month => formatDate(monthToDate(month))),
         datasets: [
             {
                 label: 'Remaining Balance',
                 backgroundColor: 'rgba(135, 206, 250, 0.2)', // Light blue
                 borderColor: 'rgba(135, 206, 250, 1)', // Blue
                 pointStyle: false,
-                data: amortizationSchedule.map(item => item.balance),
+                data: schedule.balance,
             },
             {
                 label: 'Principal Paid To Date',
                 backgroundColor: 'rgba(0, 0, 0, 0.2)', // Light black
                 borderColor: 'rgba(0, 0, 0, 1)', // Black
                 pointStyle: false,
-                data: amortizationSchedule.map(item => item.totalPrincipalPaid),
+                data: schedule.total_principal,
             },
             {
                 label: 'Interest Paid To Date',
                 backgroundColor: 'rgba(255, 165, 0, 0.2)', // Light orange
                 borderColor: 'rgba(255, 165, 0, 1)', // Orange
                 pointStyle: false,
-                data: amortizationSchedule.map(item => item.totalInterestPaid),
+                data: schedule.total_interest,
             }
         ]
     };
@@ -224,25 +198,9 @@ function updateEscrow(mortgageId) {
     });
 }
 
-// Function to calculate monthly interest
-function calculateMonthlyInterest(principal, annualInterestRate) {
-    const monthlyInterestRate = annualInterestRate / 12 / 100;
-    return principal * monthlyInterestRate;
-}
-
-// Function to calculate monthly principal
-function calculateMonthlyPrincipal(monthlyPayment, monthlyInterest) {
-    return monthlyPayment - monthlyInterest;
-}
-
-// Function to fetch bonus payments
-function fetchBonusPayments() {
-    return fetch('/finances/api/aggregated_rsu_payouts').then(response => response.json());
-}
-
-// Fetch savings amount
-function fetchLatestSavings() {
-    return fetch('/finances/api/savings/latest').then(response => response.json());
+// Function to fetch the cash-flow projection computed on the server
+function fetchProjection(months = 24) {
+    return fetch(`/finances/api/projection?months=${months}`).then(response => response.json());
 }
 
 // Do the comma thing
@@ -250,19 +208,8 @@ function formatCurrency(number) {
     return '$' + parseFloat(number).toFixed(2).replace(/\d(?=(\d{3})+\.)/g, '$&,');
 }
 
-// Function to calculate monthly interest
-function calculateMonthlyInterest(remainingPrincipal, annualInterestRate) {
-    const monthlyInterestRate = annualInterestRate / 12 / 100;
-    return remainingPrincipal * monthlyInterestRate;
-}
-
-// Function to calculate monthly principal
-function calculateMonthlyPrincipal(totalMonthlyPayment, monthlyInterest, monthlyEscrow) {
-    return totalMonthlyPayment - monthlyInterest - monthlyEscrow;
-}
-
 // Function to build the finance table HTML
-function buildTableHTML(mortgages, payouts, latestSavings) {
+function buildTableHTML(projection) {
     let tableHTML = `
         <div class="table-responsive">
             <table class="table table-striped table-hover table-bordered">
@@ -280,31 +227,18 @@ function buildTableHTML(mortgages, payouts, latestSavings) {
                 <tbody>
     `;
 
-    const currentDate = new Date();
-    const currentYear = currentDate.getFullYear();
-
-    mortgages.forEach(mortgage => {
-        let remainingPrincipal = mortgage.principal;
-
-        for (let monthOffset = 0; monthOffset < 24; monthOffset++) {
-            const date = new Date(currentYear, currentDate.getMonth() + monthOffset, 1);
-            const monthlyInterest = calculateMonthlyInterest(remainingPrincipal, mortgage.interest_rate);
-            const monthlyPrincipal = calculateMonthlyPrincipal(mortgage.monthly_payment, monthlyInterest, mortgage.monthly_escrow);
-            remainingPrincipal -= monthlyPrincipal;
-            latestSavings += (payouts[monthOffset] ? payouts[monthOffset].amount : 0) - (monthlyPrincipal + monthlyInterest);
-
-            tableHTML += `
-                <tr>
-                    <td>${date.toLocaleDateString('en-US', { year: 'numeric', month: 'long' })}</td>
-                    <td>${formatCurrency(latestSavings)}</td>
-                    <td>${formatCurrency(mortgage.monthly_payment)}</td>
-                    <td>${formatCurrency(mortgage.monthly_escrow)}</td>
-                    <td>${formatCurrency(monthlyPrincipal)}</td>
-                    <td>${formatCurrency(monthlyInterest)}</td>
-                    <td>${formatCurrency((payouts[monthOffset] ? payouts[monthOffset].amount : 0))}</td>
-                </tr>
-            `;
-        }
+    projection.forEach(row => {
+        tableHTML += `
+            <tr>
+                <td>${monthToDate(row.month).toLocaleDateString('en-US', { year: 'numeric', month: 'long' })}</td>
+                <td>${formatCurrency(row.balance)}</td>
+                <td>${formatCurrency(row.payment)}</td>
+                <td>${formatCurrency(row.escrow)}</td>
+                <td>${formatCurrency(row.principal)}</td>
+                <td>${formatCurrency(row.interest)}</td>
+                <td>${formatCurrency(row.payout)}</td>
+            </tr>
+        `;
     });
 
     tableHTML += `</tbody></table></div>`;
@@ -330,32 +264,24 @@ function handleMortgagesResponse(mortgages) {
 
 // Function to render the chart for a mortgage
 function renderMortgageChart(mortgage) {
-    const amortizationSchedule = calculateAmortization(mortgage.principal, mortgage.interest_rate, mortgage.loan_term, mortgage.start_date);
-    const chartData = buildChartData(amortizationSchedule);
-    const currentPeriodIndex = amortizationSchedule.findIndex(item => item.isCurrent);
-    const ctx = document.getElementById(`chart-${mortgage.id}`).getContext('2d');
-    buildChart(ctx, chartData, currentPeriodIndex);
-}
-
-// Function to handle the response for latest savings
-function handleLatestSavingsResponse(latestSavings, mortgages, payouts) {
-    const financeDiv = document.getElementById('financeOverview');
-    if (latestSavings && !latestSavings.error) {
-        // Ensure you are using the mortgages and payouts data correctly here
-        financeDiv.innerHTML = buildTableHTML(mortgages, payouts, latestSavings.balance);
-    } else {
-        console.error('Error fetching latest savings data:', latestSavings.error);
-    }
+    fetchSchedule(mortgage.id)
+        .then(schedule => {
+            const chartData = buildChartData(schedule);
+            const now = new Date();
+            const currentMonth = `${now.getFullYear()}-${String(now.getMonth() + 1).padStart(2, '0')}`;
+            const currentPeriodIndex = schedule.month.indexOf(currentMonth);
+            const ctx = document.getElementById(`chart-${mortgage.id}`).getContext('2d');
+            buildChart(ctx, chartData, currentPeriodIndex);
+        })
+        .catch(error => console.error('Error fetching amortization schedule:', error));
 }
 
 // Main function to build the finance table
 function buildFinanceTable() {
-    Promise.all([fetchMortgages(), fetchBonusPayments(), fetchLatestSavings()])
-        .then(([mortgages, payouts, latestSavings]) => {
-            // Now pass the mortgages and payouts to the function that needs them
-            handleLatestSavingsResponse(latestSavings, mortgages, payouts);
+    Promise.all([fetchMortgages(), fetchProjection()])
+        .then(([mortgages, projection]) => {
+            document.getElementById('financeOverview').innerHTML = buildTableHTML(projection);
             handleMortgagesResponse(mortgages);
-            // You can also handle payouts here if needed
         })
         .catch(error => {
             console.error('Error fetching data:', error);
@@ -9,15 +9,84 @@ var geoJsonLayer;
 
 // Define the URLs for the API endpoints
 const visitedDataUrl = '/travel/api/visited?whichMap=' + whichMap;
+const visitedChangesUrl = '/travel/api/visited/changes';
+const visitedStreamUrl = '/travel/api/visited/stream';
+const statusUrl = '/travel/api/styled/' + whichMap + '/status';
+const travelersUrl = '/travel/api/travelers';
 
-const mapDataURL = '/static/data/' + whichMap + '.json'
+// Sequence number of the last visited change applied
+var lastChangeSeq = 0;
+
+// Zoom level from which geometry is drawn from server-side tiles instead of
+// the low detail map data
+const tileMinZoom = 4;
 
 var mapData = [];
 
+// Visit status of every feature by its code, for coloring the tiles
+var statusByCode = {};
+
+// Travelers ordered by bit, each with the name of its flag in visited entries and its fill color
+var travelers = [];
+
+// Fill color of the places visited by several travelers, as SHARED_COLOR in travelers.py
+const sharedColor = 'purple';
+
 console.log("Set blank mapData variable")
 console.log(mapData)
 
-// Fetch the right map data
+// Fetch the travelers and build their checkboxes and lists
+async function loadTravelers() {
+    const response = await fetch(travelersUrl);
+    travelers = await response.json();
+
+    const checks = document.getElementById('travelerChecks');
+    const lists = document.getElementById('travelerLists');
+    checks.innerHTML = '';
+    lists.innerHTML = '';
+    travelers.forEach(traveler => {
+        const label = travelerLabel(traveler.name);
+        const check = document.createElement('div');
+        check.className = 'form-check form-check-inline';
+        check.innerHTML = '<input class="form-check-input" type="checkbox">'
+            + '<label class="form-check-label"></label>';
+        check.firstChild.id = 'visited-' + traveler.name;
+        check.lastChild.htmlFor = 'visited-' + traveler.name;
+        check.lastChild.textContent = label + ' visited';
+        checks.appendChild(check);
+
+        lists.appendChild(createList(label + ' Visited', 'visitedList-' + traveler.name));
+    });
+    lists.appendChild(createList(travelers.length === 2 ? 'Both Visited' : 'Visited Together', 'togetherVisitedList'));
+}
+
+function travelerLabel(name) {
+    return name.charAt(0).toUpperCase() + name.slice(1).replace(/_/g, ' ');
+}
+
+// Function to create a titled list
+function createList(title, id) {
+    const section = document.createElement('div');
+    const heading = document.createElement('h4');
+    heading.textContent = title;
+    const list = document.createElement('ul');
+    list.id = id;
+    list.className = 'list-group';
+    section.appendChild(heading);
+    section.appendChild(list);
+    return section;
+}
+
+// Copy the traveler flags and to-do flag of a visited entry, all false for none
+function visitStatusOf(entry) {
+    const visitStatus = { todo: Boolean(entry && entry.todo) };
+    travelers.forEach(traveler => {
+        visitStatus[traveler.name] = Boolean(entry && entry[traveler.name]);
+    });
+    return visitStatus;
+}
+
+// Fetch the right map data, a static artifact cached for good by the browser
 async function loadMap() {
     try {
       const response = await fetch(mapDataURL);
@@ -33,10 +102,23 @@ async function loadMap() {
     }
   }
 
+// Fetch the visit status of the map features, keyed by their code
+async function loadStatus() {
+    try {
+      const response = await fetch(statusUrl);
+      if (!response.ok) {
+        throw new Error('Network response was not ok ' + response.statusText);
+      }
+      statusByCode = await response.json();
+    } catch (error) {
+      console.error('There has been a problem fetching the visit status:', error);
+    }
+  }
+
 
 // Fetch the visited countries data with retry on 500 status code
 function fetchAndUpdateVisitedData(attempt = 1) {
-    fetch(visitedDataUrl)
+    return fetch(visitedDataUrl)
         .then(response => {
             if (!response.ok) {
                 // If the response status code is 500, retry up to 5 times
@@ -55,7 +137,9 @@ function fetchAndUpdateVisitedData(attempt = 1) {
         .then(data => {
             // Assign the data to the visitedData variable
             visitedData = data;
-            updateMap();
+
+            // Names are joined onto feature codes by the server, reload the status to redraw
+            loadStatus().then(restyle);
 
             // Function to update the list of visited countries
             updateVisitedList();
@@ -64,11 +148,112 @@ function fetchAndUpdateVisitedData(attempt = 1) {
         .catch(error => console.error('Error fetching visited countries data:', error));
 }
 
-function getCountryVisitStatus(countryName) {
+// Start following the change feed from the current sequence number
+function fetchChangeCursor() {
+    return fetch(visitedChangesUrl)
+        .then(response => response.json())
+        .then(data => { lastChangeSeq = data.last; });
+}
+
+// Reload the full list when the changes since lastChangeSeq are no longer available
+function resetVisitedData() {
+    return fetchChangeCursor().then(() => fetchAndUpdateVisitedData());
+}
+
+// Fetch and apply the visited changes since the last one applied
+function fetchChanges() {
+    return fetch(visitedChangesUrl + '?since=' + lastChangeSeq)
+        .then(response => {
+            if (response.status === 410) {
+                return resetVisitedData();
+            }
+            if (!response.ok) {
+                throw new Error(`Request failed with status ${response.status}`);
+            }
+            return response.json().then(data => {
+                applyVisitedChanges(data.changes);
+                lastChangeSeq = Math.max(lastChangeSeq, data.last);
+                if (data.more) {
+                    return fetchChanges();
+                }
+            });
+        })
+        .catch(error => console.error('Error fetching visited changes:', error));
+}
+
+// Follow the changes made in other tabs, EventSource reconnects from the last event by itself
+function followChanges() {
+    if (!window.EventSource) {
+        return;
+    }
+    const source = new EventSource(visitedStreamUrl + '?since=' + lastChangeSeq);
+    source.addEventListener('change', event => applyVisitedChanges([JSON.parse(event.data)]));
+    source.addEventListener('reset', () => {
+        source.close();
+        resetVisitedData().then(followChanges);
+    });
+}
+
+// Update the visited data and the feature styles in place from a list of changes
+function applyVisitedChanges(changes) {
+    var restyled = false;
+    var reload = false;
+    var citiesChanged = false;
+
+    changes.forEach(change => {
+        if (change.seq <= lastChangeSeq) {
+            return;
+        }
+        lastChangeSeq = change.seq;
+
+        const previous = visitedData.find(entry => entry.id === change.id)
+            || citiesVisitedData.find(entry => entry.id === change.id);
+        const entry = change.op === 'upsert' ? change.entry : null;
+        const placeMap = entry ? entry.which_map : previous && previous.which_map;
+        if (placeMap === 'cities') {
+            citiesChanged = true;
+            return;
+        }
+        if (placeMap !== whichMap) {
+            return;
+        }
+
+        visitedData = visitedData.filter(item => item.id !== change.id);
+        if (entry) {
+            visitedData.push(entry);
+        }
+        const name = entry ? entry.name : previous.name;
+        const visitStatus = visitStatusOf(entry);
+        const codes = places.filter(place => place.name === name).map(place => place.code);
+        if (codes.length === 0) {
+            // Name variants are matched to features by the server, reload the status for those
+            reload = true;
+        }
+        codes.forEach(code => {
+            statusByCode[code] = visitStatus;
+        });
+        restyled = true;
+    });
+
+    if (reload) {
+        loadStatus().then(restyle);
+    } else if (restyled) {
+        restyle();
+    }
+    if (restyled || reload) {
+        visitedData.sort((a, b) => a.name.localeCompare(b.name));
+        updateVisitedList();
+    }
+    if (citiesChanged && citiesLoaded) {
+        fetchCitiesVisitedData();
+        fetchCitiesStatus();
+    }
+}
+
+function getCountryVisitStatus(countryName, data = visitedData) {
     // Find the country in visitedData that matches the given name
-    var country = visitedData.find(c => c.name === countryName);
-    return country ? { john: country.john, marcia: country.marcia, todo: country.todo }
-        : { john: false, marcia: false, todo: false };
+    var country = data.find(c => c.name === countryName);
+    return visitStatusOf(country);
 }
 
 // Function to create a list item
@@ -81,26 +266,24 @@ function createListItem(text) {
 
 // Function to update the lists
 function updateVisitedList() {
-    // Find the list elements
-    const bothVisitedList = document.getElementById('bothVisitedList');
-    const marciaVisitedList = document.getElementById('marciaVisitedList');
-    const johnVisitedList = document.getElementById('johnVisitedList');
+    // Find the list elements and clear any existing list items
+    const togetherVisitedList = document.getElementById('togetherVisitedList');
     const todoList = document.getElementById('todoList');
-
-    // Clear any existing list items
-    bothVisitedList.innerHTML = '';
-    marciaVisitedList.innerHTML = '';
-    johnVisitedList.innerHTML = '';
+    const visitedLists = {};
+    travelers.forEach(traveler => {
+        visitedLists[traveler.name] = document.getElementById('visitedList-' + traveler.name);
+        visitedLists[traveler.name].innerHTML = '';
+    });
+    togetherVisitedList.innerHTML = '';
     todoList.innerHTML = '';
 
     // Add countries to the respective lists
     visitedData.forEach(country => {
-        if (country.john && country.marcia) {
-        bothVisitedList.appendChild(createListItem(country.name));
-        } else if (country.marcia) {
-        marciaVisitedList.appendChild(createListItem(country.name));
-        } else if (country.john) {
-        johnVisitedList.appendChild(createListItem(country.name));
+        const visitors = travelers.filter(traveler => country[traveler.name]);
+        if (visitors.length > 1) {
+        togetherVisitedList.appendChild(createListItem(country.name));
+        } else if (visitors.length === 1) {
+        visitedLists[visitors[0].name].appendChild(createListItem(country.name));
         }
         if (country.todo) {
         todoList.appendChild(createListItem(country.name));
@@ -108,27 +291,26 @@ function updateVisitedList() {
     });
 }
 
-function style(feature) {
-    // Get the visit status for the country
-    var visitStatus = getCountryVisitStatus(feature.properties.name);
-
-    // Determine the color based on the 'john' and 'marcia' properties
+// Determine the fill color of a place from its visit status, as visit_color in render.py
+function statusColor(visitStatus) {
+    const visitors = travelers.filter(traveler => visitStatus[traveler.name]);
     var color;
-    if (visitStatus.john && visitStatus.marcia) {
-        color = 'purple'; // Both John and Marcia have visited
-    } else if (visitStatus.marcia) {
-        color = 'red'; // Only Marcia has visited
-    } else if (visitStatus.john) {
-        color = 'blue'; // Only John has visited
+    if (visitors.length > 1) {
+        color = sharedColor; // Several travelers have visited
+    } else if (visitors.length === 1) {
+        color = visitors[0].color; // Only one traveler has visited
     } else if (visitStatus.todo) {
         color = 'black'; // To visit
     } else {
-        color = 'grey'; // Neither has visited
+        color = 'grey'; // No one has visited
     }
+    return color;
+}
 
-    // Return the style object with the determined color
+function style(feature) {
+    // The visit status is joined onto the feature codes by the server
     return {
-        fillColor: color,
+        fillColor: statusColor(statusByCode[feature.properties.code] || {}),
         weight: 2,
         opacity: 1,
         color: 'white',
@@ -141,12 +323,13 @@ document.getElementById('countryForm').addEventListener('submit', function(event
 
     // Get the form data
     const countryName = document.getElementById('countryName').value;
-    const visitedJohn = document.getElementById('visitedJohn').checked;
-    const visitedMarcia = document.getElementById('visitedMarcia').checked;
+    const selectedOption = document.getElementById('countryName').selectedOptions[0];
+    const placeMap = selectedOption.dataset.whichMap || whichMap;
+    const placeData = placeMap === 'cities' ? citiesVisitedData : visitedData;
     const todo = document.getElementById('todo').checked;
 
     // Find the country in the visitedData array
-    const countryData = visitedData.find(country => country.name === countryName);
+    const countryData = placeData.find(country => country.name === countryName);
 
     // Determine if this is an add or update operation based on the presence of an ID in the visitedData
     const method = countryData ? 'PUT' : 'POST';
@@ -157,11 +340,12 @@ document.getElementById('countryForm').addEventListener('submit', function(event
     // Create the request body
     const requestBody = {
         name: countryName,
-        john: visitedJohn,
-        marcia: visitedMarcia,
         todo: todo,
-        which_map: whichMap,
+        which_map: placeMap,
     };
+    travelers.forEach(traveler => {
+        requestBody[traveler.name] = document.getElementById('visited-' + traveler.name).checked;
+    });
 
     // Add the country_id to the requestBody only if it exists
     if (countryData && countryData.id) {
@@ -184,8 +368,8 @@ document.getElementById('countryForm').addEventListener('submit', function(event
         document.getElementById('countryForm').reset();
         // Update the UI as needed
     })
-    .then(fetchAndUpdateVisitedData())
-    .then(updateVisitedList())
+    // Apply only what changed instead of reloading the whole list
+    .then(() => fetchChanges())
     .catch((error) => {
         console.error('Error:', error);
     });
@@ -205,7 +389,7 @@ function populateCountryDropdown() {
     dropdown.appendChild(defaultOption);
 
     // Map the country names and sort them
-    countries = mapData.features.map(feature => feature.properties.name).sort();
+    countries = places.map(place => place.name).sort();
 
     // Add countries as options
     countries.forEach(country => {
@@ -214,6 +398,91 @@ function populateCountryDropdown() {
         option.value = country;
         dropdown.appendChild(option);
     });
+
+    // Add cities once their layer has been loaded
+    if (citiesLoaded) {
+        const group = document.createElement('optgroup');
+        group.label = 'Cities';
+        citiesLayer.toGeoJSON().features.map(feature => feature.properties.name).sort().forEach(city => {
+            const option = document.createElement('option');
+            option.textContent = city;
+            option.value = city;
+            option.dataset.whichMap = 'cities';
+            group.appendChild(option);
+        });
+        dropdown.appendChild(group);
+    }
+}
+
+// Urban areas overlay, only fetched once the layer is enabled
+var citiesLayer;
+var citiesLoaded = false;
+var citiesVisitedData = [];
+var citiesStatusByCode = {};
+
+function cityStyle(feature) {
+    return {
+        fillColor: statusColor(citiesStatusByCode[feature.properties.code] || {}),
+        weight: 1,
+        opacity: 1,
+        color: 'white',
+        fillOpacity: 0.9
+    };
+}
+
+function fetchCitiesVisitedData() {
+    return fetch('/travel/api/visited?whichMap=cities')
+        .then(response => response.json())
+        .then(data => {
+            citiesVisitedData = data;
+        })
+        .catch(error => console.error('Error fetching visited cities data:', error));
+}
+
+// Fetch the visit status of the cities and restyle them
+async function fetchCitiesStatus() {
+    const response = await fetch('/travel/api/styled/cities/status');
+    if (!response.ok) {
+        throw new Error('Network response was not ok ' + response.statusText);
+    }
+    citiesStatusByCode = await response.json();
+    citiesLayer.setStyle(cityStyle);
+}
+
+// Fetch the static cities artifact and draw it
+async function fetchCitiesData() {
+    const response = await fetch(citiesDataURL);
+    if (!response.ok) {
+        throw new Error('Network response was not ok ' + response.statusText);
+    }
+    citiesLayer.addData(await response.json());
+}
+
+async function loadCities() {
+    try {
+        await Promise.all([fetchCitiesStatus(), fetchCitiesData()]);
+        citiesLayer.setStyle(cityStyle);
+        citiesLoaded = true;
+        populateCountryDropdown();
+        fetchCitiesVisitedData();
+    } catch (error) {
+        console.error('There has been a problem loading the cities:', error);
+    }
+}
+
+if (citiesDataURL) {
+    citiesLayer = L.geoJSON(null, {
+        style: cityStyle,
+        onEachFeature: function (feature, layer) {
+            layer.bindTooltip(feature.properties.name, { className: 'countryLabel' });
+        }
+    });
+    L.control.layers(null, { 'Cities': citiesLayer }).addTo(map);
+    map.on('overlayadd', function (event) {
+        if (event.layer === citiesLayer && !citiesLoaded) {
+            loadCities();
+        }
+    });
 }
 
 function updateMap() {
@@ -222,7 +491,7 @@ function updateMap() {
         map.removeLayer(geoJsonLayer);
     }
 
-    // Create a new GeoJSON layer and add it to the map
+    // Create a new GeoJSON layer, which showMapLayer adds to the map
     geoJsonLayer = L.geoJSON(mapData, {
         style: style,
         onEachFeature: function (feature, layer) {
@@ -234,18 +503,140 @@ function updateMap() {
                 });
             }
         }
-    }).addTo(map);
+    });
+}
 
-    if (whichMap == "states") {
-        map.flyTo([34.20, -118.53], 3.5);
+// The low detail map data is only drawn below tileMinZoom, so it is fetched
+// the first time the map is zoomed out that far instead of on every page load
+var mapDataLoading = null;
+
+function showMapLayer() {
+    const wanted = map.getZoom() < tileMinZoom;
+    if (wanted && !mapDataLoading) {
+        mapDataLoading = loadMap().then(() => {
+            updateMap();
+            showMapLayer();
+        });
+    }
+    if (!geoJsonLayer) {
+        return;
+    }
+    if (wanted && !map.hasLayer(geoJsonLayer)) {
+        geoJsonLayer.setStyle(style);
+        map.addLayer(geoJsonLayer);
+    } else if (!wanted && map.hasLayer(geoJsonLayer)) {
+        map.removeLayer(geoJsonLayer);
     }
 }
 
+// Restyle the features and redraw the tiles, e.g. after the visited data changed
+function restyle() {
+    if (geoJsonLayer) {
+        geoJsonLayer.setStyle(style);
+    }
+    redrawTiles();
+}
+
+// Grid layer drawing the server-side tiles onto canvases
+var TileLayer = L.GridLayer.extend({
+    createTile: function (coords, done) {
+        const tile = document.createElement('canvas');
+        const size = this.getTileSize();
+        tile.width = size.x;
+        tile.height = size.y;
+
+        fetch('/travel/tiles/' + whichMap + '/' + coords.z + '/' + coords.x + '/' + coords.y + '.json')
+            .then(response => response.json())
+            .then(data => {
+                tile.tileData = data;
+                drawTile(tile);
+                done(null, tile);
+            })
+            .catch(error => done(error, tile));
+        return tile;
+    }
+});
+
+// Draw the features of a tile with the same colors as style()
+function drawTile(tile) {
+    const ctx = tile.getContext('2d');
+    const scale = tile.width / tile.tileData.extent;
+    ctx.clearRect(0, 0, tile.width, tile.height);
+    ctx.strokeStyle = 'white';
+    ctx.lineWidth = 2;
+
+    tile.tileData.features.forEach(feature => {
+        // The path is kept on the feature for redraws and tooltips
+        if (!feature.path) {
+            feature.path = new Path2D();
+            feature.rings.forEach(ring => {
+                feature.path.moveTo(ring[0] * scale, ring[1] * scale);
+                for (let i = 2; i < ring.length; i += 2) {
+                    feature.path.lineTo(ring[i] * scale, ring[i + 1] * scale);
+                }
+                feature.path.closePath();
+            });
+        }
+        ctx.globalAlpha = 0.7;
+        ctx.fillStyle = statusColor(statusByCode[feature.code] || {});
+        ctx.fill(feature.path, 'evenodd');
+        ctx.globalAlpha = 1;
+        ctx.stroke(feature.path);
+    });
+}
+
+var tileLayer = new TileLayer({ minZoom: tileMinZoom, maxNativeZoom: 10 }).addTo(map);
+
+// Redraw the loaded tiles, e.g. after the visited data changed
+function redrawTiles() {
+    Object.values(tileLayer._tiles).forEach(item => {
+        if (item.el.tileData) {
+            drawTile(item.el);
+        }
+    });
+}
+
+map.on('zoomend', showMapLayer);
+
+// Above tileMinZoom the feature layer is off the map, so tooltips come from
+// hit testing the features of the tile under the pointer
+const tileTooltip = L.tooltip({ direction: 'center', className: 'countryLabel' });
+
+function tileFeatureAt(latlng) {
+    const zoom = tileLayer._tileZoom;
+    const size = tileLayer.getTileSize();
+    const point = map.project(latlng, zoom);
+    const coords = point.unscaleBy(size).floor();
+    const item = tileLayer._tiles[coords.x + ':' + coords.y + ':' + zoom];
+    if (!item || !item.el.tileData) {
+        return null;
+    }
+    const offset = point.subtract(coords.scaleBy(size));
+    const ctx = item.el.getContext('2d');
+    return item.el.tileData.features.find(feature =>
+        feature.path && ctx.isPointInPath(feature.path, offset.x, offset.y, 'evenodd')) || null;
+}
+
+map.on('mousemove', function (event) {
+    const feature = map.getZoom() >= tileMinZoom ? tileFeatureAt(event.latlng) : null;
+    if (feature) {
+        tileTooltip.setLatLng(event.latlng).setContent(feature.name);
+        map.openTooltip(tileTooltip);
+    } else {
+        map.closeTooltip(tileTooltip);
+    }
+});
+
 async function initialize() {
-    await loadMap(); // Wait for loadMap to finish
-    updateMap();     // Now you can call updateMap
+    await Promise.all([loadTravelers(), loadStatus()]); // The travelers and the visit status
+    showMapLayer();  // Draw the map data below tileMinZoom, the tiles draw it above
+    if (whichMap == "states") {
+        map.flyTo([34.20, -118.53], 3.5);
+    }
     populateCountryDropdown(); // And then populateCountryDropdown
-    fetchAndUpdateVisitedData(); // Finally, call fetchAndUpdateVisitedData
+    await fetchChangeCursor(); // Note where the change feed is before loading the full list
+    await fetchAndUpdateVisitedData(); // Then call fetchAndUpdateVisitedData
+    followChanges(); // Finally, follow the changes made elsewhere
   }
   
   // Call initialize to start the process
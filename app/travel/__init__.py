@@ -2,4 +2,4 @@ from flask import Blueprint
 
 bp = Blueprint('travel', __name__, url_prefix='/travel')
 
-from app.travel import routes
\ No newline at end of file
+from app.travel import routes, commands
\ No newline at end of file
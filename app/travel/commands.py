@@ -0,0 +1,63 @@
+import os
+import shutil
+
+import click
+from flask import current_app
+
+from ..models.geodata import LAYERS, build_layer, data_dir
+from ..models.geostore import build_store
+from ..models.gps_import import import_points as import_gps_points
+
+from app.travel import bp
+
+
+@bp.cli.command('build-geodata')
+@click.option('--layer', 'layers', multiple=True, type=click.Choice(list(LAYERS)),
+              help='Layer to build. Defaults to every layer.')
+@click.option('--output', default=data_dir, show_default=True,
+              help='Directory the artifacts are written to.')
+def build_geodata(layers, output):
+    """
+    Compile the shapefiles in country_data/ into map artifacts.
+
+    Every layer is written once per detail level as compact GeoJSON with
+    simplified geometry and capped coordinate precision, under a
+    content-hashed name with pre-compressed siblings and a manifest.
+    """
+    for which_map in layers or LAYERS:
+        try:
+            artifacts = build_layer(which_map, output)
+        except (OSError, ValueError) as e:
+            click.echo(f"Skipping {which_map}: {e}", err=True)
+            continue
+        for artifact in artifacts:
+            click.echo(f"{artifact['path']}: {artifact['bytes']:,} bytes "
+                       f"({artifact['gzip_bytes']:,} gzipped), {artifact['vertices']:,} vertices")
+
+        # Compile the geometry store up front instead of on the first request
+        if output == data_dir:
+            build_store(which_map)
+
+        # Tiles are cut from the artifacts, drop the ones rendered from the previous build
+        shutil.rmtree(os.path.join(current_app.instance_path, 'tiles', which_map), ignore_errors=True)
+
+
+@bp.cli.command('import-points')
+@click.argument('files', nargs=-1, required=True, type=click.Path(exists=True, dir_okay=False))
+@click.option('--traveler', required=True, help='Name of the traveler to mark the places as visited for.')
+def import_points(files, traveler):
+    """
+    Mark the places in GPX tracks and photo EXIF positions as visited.
+
+    Points are streamed from every file, deduplicated on a coarse grid and
+    resolved to countries, US states and urban areas in batches.
+    """
+    try:
+        result = import_gps_points(((path, path) for path in files), traveler)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    click.echo(f"{result['points']:,} points in {result['unique']:,} grid cells")
+    for visited in result['added']:
+        click.echo(f"Added {visited.which_map}: {visited.name}")
+    for visited in result['updated']:
+        click.echo(f"Updated {visited.which_map}: {visited.name}")
@@ -1,10 +1,30 @@
-from flask import Flask, jsonify, render_template, request, Blueprint, redirect, url_for, session, make_response, session, current_app, abort
+from flask import Flask, jsonify, render_template, request, Blueprint, redirect, url_for, session, make_response, session, current_app, abort, send_file
 import json
-from ..models.travel import Visited, Links
-from ..models.auth import require_email_authorization
+import os
+from datetime import date
+from sqlalchemy.exc import IntegrityError
+from ..models.travel import Visited, Links, links_file_path, visited_file_path
+from ..models.travelers import Traveler
+from ..models.visits import Visit, cached_per_year
+from ..models.auth import require_email_authorization, require_email_or_share_token, share_token
+from ..models.versions import versioned
+from ..models.batch import MAX_BATCH_SIZE
+from ..models.bulk import load_file
+from ..models.changes import ChangeLog, change_stream
+from ..models.serialize import LAYOUTS, json_response
+from ..models.geodata import LEVELS, artifact_file, available_layers
+from ..models.geostore import open_store
+from ..models.tiles import get_tile, is_valid_tile
+from ..models.render import DEFAULT_WIDTH, RENDER_BOUNDS, get_render, render_width
+from ..models.locate import locate_names
+from ..models.styled import styled_geojson, styled_status
+from ..models.gps_import import import_points
 
 from app.travel import bp
 
+# Largest page of visited entries returned at once
+MAX_PAGE_SIZE = 1000
+
 
 @bp.route('/world')
 @require_email_authorization
@@ -12,12 +32,14 @@ def world_map():
     """
     Display a world map with visited countries.
 
-    This route handles the main page view of the application, where a world map highlighting visited countries is displayed. It requires email authorization before access is granted.
+    This route handles the main page view of the application, where a world map highlighting visited countries is displayed. The page gets the name and code of every country inline, and fetches the map geometry only when zoomed out past the server-side tiles. It requires email authorization before access is granted.
 
     Returns:
         render_template (flask.Response): A Flask response object that renders the 'visited_map.html' template with the title 'Visited World'.
     """
-    return render_template('travel/visited_map.html', title='Visited World')
+    return render_template('travel/visited_map.html', title='Visited World',
+                           map_data_url=url_for('static', filename='data/' + artifact_file('world', 'low')),
+                           places=open_store('world', 'low').properties)
 
 @bp.route('/states')
 @require_email_authorization
@@ -25,12 +47,17 @@ def states():
     """
     Display a US map with visited states.
 
-    This route serves the page that shows a map of the United States, highlighting the states that have been visited. Access to this page is restricted and requires email authorization before viewing.
+    This route serves the page that shows a map of the United States, highlighting the states that have been visited, with an optional layer of urban areas. Access to this page is restricted and requires email authorization before viewing.
 
     Returns:
         render_template (flask.Response): A Flask response object that renders the 'visited_map.html' template with the title 'Visited States'.
     """
-    return render_template('travel/visited_map.html', title='Visited States')
+    cities_data_url = None
+    if 'cities' in available_layers():
+        cities_data_url = url_for('static', filename='data/' + artifact_file('cities', 'low'))
+    return render_template('travel/visited_map.html', title='Visited States',
+                           map_data_url=url_for('static', filename='data/' + artifact_file('states', 'low')),
+                           cities_data_url=cities_data_url, places=open_store('states', 'low').properties)
 
 @bp.route('/links')
 @require_email_authorization
@@ -45,34 +72,337 @@ def links():
     """
     return render_template('travel/links.html', title='Travel Links')
 
+@bp.route('/tiles/<which_map>/<int:z>/<int:x>/<int:y>.json')
+def map_tile(which_map, z, x, y):
+    """
+    Serve a single map tile.
+
+    This endpoint returns the geometry of one z/x/y tile of a map layer, clipped to the tile and simplified for its zoom level. Tiles are rendered on first request and cached on disk under the instance folder, where nginx serves them directly once they exist.
+
+    Args:
+        which_map (str): The map layer, 'world', 'states' or 'cities'.
+        z (int): The zoom level.
+        x (int): The tile column.
+        y (int): The tile row.
+
+    Returns:
+        flask.Response: A JSON response containing the tile, or a 404 error if the layer or tile does not exist.
+    """
+    if which_map not in available_layers('high') or not is_valid_tile(z, x, y):
+        abort(404, description="Tile not found")
+
+    path = get_tile(os.path.join(current_app.instance_path, 'tiles'), which_map, z, x, y)
+    return send_file(path, mimetype='application/json', max_age=30 * 24 * 3600)
+
+@bp.route('/map/<which_map>.<any(svg, png):image_format>')
+@require_email_or_share_token
+def map_image(which_map, image_format):
+    """
+    Serve a rendered image of a map colored by visited status.
+
+    This endpoint renders the same coloring as the interactive map on the server, as a small SVG or PNG suitable for share links, thumbnails and low-power clients. It requires email authorization, or a 'token' query parameter from /api/map/<which_map>/share, so an image can be shared without exposing the visited data to everyone. Renders are cached on disk under the instance folder, keyed by a hash of the visited entries of the map, so an image is only rendered again once the visited data changes.
+
+    Args:
+        which_map (str): The map, 'world', 'states' or 'cities'.
+        image_format (str): The image format, 'svg' or 'png'.
+        width (int, optional): A query parameter with the image width in pixels, rounded up to 256, 512, 1024 or 2048 so only those sizes are ever rendered. Defaults to 1024.
+        token (str, optional): A query parameter with a share token signed for the map.
+
+    Returns:
+        flask.Response: The image, or a 404 error if the map does not exist.
+    """
+    if which_map not in RENDER_BOUNDS or which_map not in available_layers('low'):
+        abort(404, description="Map not found")
+    width = render_width(request.args.get('width', default=DEFAULT_WIDTH, type=int))
+
+    path = get_render(os.path.join(current_app.instance_path, 'renders'), which_map, image_format, width)
+    mimetype = 'image/svg+xml' if image_format == 'svg' else 'image/png'
+    return send_file(path, mimetype=mimetype, max_age=0)
+
+@bp.route('/api/map/<which_map>/share', methods=['GET'])
+@require_email_authorization
+def share_map_image(which_map):
+    """
+    Produces share links for the rendered images of a map.
+
+    The links carry a token signed with the application's secret key, which lets anyone holding them view the SVG and PNG images of this map, and only of this map, for 90 days. Rotating the secret key revokes every link.
+
+    Args:
+        which_map (str): The map, 'world', 'states' or 'cities'.
+
+    Returns:
+        flask.Response: A JSON response with the 'token' and the 'svg' and 'png' image URLs, or a 404 error if the map does not exist.
+    """
+    if which_map not in RENDER_BOUNDS or which_map not in available_layers('low'):
+        abort(404, description="Map not found")
+    token = share_token(which_map)
+    return jsonify({
+        'token': token,
+        **{image_format: url_for('travel.map_image', which_map=which_map, image_format=image_format, token=token,
+                                 _external=True)
+           for image_format in ('svg', 'png')},
+    })
+
+@bp.route('/api/styled/<which_map>', methods=['GET'])
+@require_email_authorization
+def styled_map(which_map):
+    """
+    Produces the GeoJSON of a map with the visited status merged into every feature.
+
+    This endpoint returns the map geometry with a flag per traveler and 'todo' added to the properties of each feature, joined on the feature code with an alias table for name variants, so the client can style features without looking them up. The document is cached until a visited entry of the map changes and carries an ETag, so unchanged maps are answered with 304 Not Modified.
+
+    Args:
+        which_map (str): The map, 'world', 'states' or 'cities'.
+        level (str, optional): A query parameter with the detail level, 'low', 'medium' or 'high'. Defaults to 'low'.
+
+    Returns:
+        flask.Response: A GeoJSON response, a 400 error if the level is unknown or a 404 error if the map does not exist.
+    """
+    level = request.args.get('level', default='low')
+    if level not in LEVELS:
+        abort(400, description="Unknown level")
+    if which_map not in available_layers(level):
+        abort(404, description="Map not found")
+
+    digest, body = styled_geojson(which_map, level)
+    response = make_response(body)
+    response.mimetype = 'application/json'
+    response.set_etag(digest)
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+@bp.route('/api/styled/<which_map>/status', methods=['GET'])
+@require_email_authorization
+def styled_map_status(which_map):
+    """
+    Produces the visit status of every visited feature of a map, keyed by feature code.
+
+    The map page draws the static, content-hashed geometry artifact and styles it with this payload, which is joined on the feature code like '/api/styled/<which_map>' but only a few kilobytes. It is cached until a visited entry of the map changes and carries an ETag, so unchanged maps are answered with 304 Not Modified.
+
+    Args:
+        which_map (str): The map, 'world', 'states' or 'cities'.
+
+    Returns:
+        flask.Response: A JSON object mapping feature codes to a flag per traveler and 'todo', or a 404 error if the map does not exist.
+    """
+    if which_map not in available_layers('low'):
+        abort(404, description="Map not found")
+
+    digest, body = styled_status(which_map)
+    response = make_response(body)
+    response.mimetype = 'application/json'
+    response.set_etag(digest)
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+@bp.route('/api/locate', methods=['GET'])
+@require_email_authorization
+def locate():
+    """
+    Find the country and US state containing a point.
+
+    Args:
+        lat (float): A query parameter with the latitude of the point.
+        lon (float): A query parameter with the longitude of the point.
+
+    Returns:
+        flask.Response: A JSON response mapping each map ('world', 'states', 'cities') to the name of the place containing the point, or null if there is none.
+    """
+    lat = request.args.get('lat', type=float)
+    lon = request.args.get('lon', type=float)
+    if lat is None or lon is None:
+        abort(400, description="lat and lon are required")
+
+    names = locate_names([lat], [lon])
+    return jsonify({which_map: found[0] for which_map, found in names.items()})
+
+@bp.route('/api/locate', methods=['POST'])
+@require_email_authorization
+def locate_batch():
+    """
+    Find the countries and US states containing a batch of points.
+
+    This endpoint accepts a JSON payload of the form {"points": [[lat, lon], ...]} and resolves all points in one vectorized pass per map.
+
+    Returns:
+        flask.Response: A JSON response mapping each map ('world', 'states', 'cities') to a list with, for every point in order, the name of the place containing it or null.
+    """
+    data = request.get_json()
+    if not data or not isinstance(data.get('points'), list):
+        abort(400, description="Missing points")
+
+    try:
+        lats, lons = zip(*data['points']) if data['points'] else ((), ())
+        names = locate_names(lats, lons)
+    except (TypeError, ValueError):
+        abort(400, description="Points must be [lat, lon] pairs")
+    return jsonify(names)
+
 @bp.route('/api/visited', methods=['GET'])
 @require_email_authorization
+@versioned(Visited, Traveler)
 def get_visited():
     """
     Produces a JSON list of visited details.
 
-    This endpoint returns a list of places (countries or states) and their visited status. The list can be filtered by the type of map ('world' or 'states') using the 'whichMap' query parameter.
+    This endpoint returns a list of places (countries, states or cities) and their visited status. The list is filtered by the type of map ('world', 'states' or 'cities') using the 'whichMap' query parameter, with an indexed query ordered by name. Passing 'limit' pages through the list with a keyset cursor, and 'fields' restricts the columns returned.
 
     Args:
         whichMap (str, optional): A query parameter that determines which list to send. Defaults to 'world'.
+        fields (str, optional): A query parameter with a comma-separated list of the fields to return, e.g. 'name,john'. Defaults to every field.
+        format (str, optional): A query parameter with the layout, 'records' for an array of objects or 'columns' for an object with an array per field. Defaults to 'records'.
+        limit (int, optional): A query parameter with the page size, at most 1000. Defaults to returning the whole list.
+        after (str, optional): A query parameter with the 'next' cursor of the previous page.
 
     Returns:
-        flask.Response: A JSON response containing an array of places with their visited status.
+        flask.Response: A JSON response containing an array of places with their visited status, or, when 'limit' is given, an object with the page in 'items' and the cursor of the next page in 'next' (null on the last page). In the 'columns' layout the arrays per field sit next to 'next'. Large lists are streamed. A 400 error is returned for unknown fields or layouts, an invalid limit or an invalid cursor.
     """
     # Get the 'whichMap' query parameter from the URL
     which_map = request.args.get('whichMap', default='world', type=str).removeprefix('Visited ').lower()
-    
-    # Load the visited data from the file
-    visited = Visited.load_visited_data()
-    
-    # Filter the visited data based on the 'which_map' key
-    filtered_visited = [place for place in visited if place.get('which_map') == which_map]
-    
-    return jsonify(filtered_visited)
+    fields = request.args.get('fields')
+    fields = [field.strip() for field in fields.split(',') if field.strip()] if fields else None
+    limit = request.args.get('limit', type=int)
+    if limit is not None and not 1 <= limit <= MAX_PAGE_SIZE:
+        abort(400, description=f"limit must be between 1 and {MAX_PAGE_SIZE}")
+    layout = request.args.get('format', default='records')
+    if layout not in LAYOUTS:
+        abort(400, description=f"format must be one of {', '.join(LAYOUTS)}")
+
+    try:
+        fields, rows, next_cursor = Visited.query_map(which_map, fields=fields, limit=limit,
+                                                      after=request.args.get('after'))
+    except ValueError as e:
+        abort(400, description=str(e))
+
+    return json_response(fields, rows, layout, extra=None if limit is None else {'next': next_cursor})
+
+
+@bp.route('/api/visited/stats', methods=['GET'])
+@require_email_authorization
+@versioned(Visited, Traveler)
+def visited_stats():
+    """
+    Produces summary counts of the visited places.
+
+    This endpoint counts the places per map, per traveler and per combination of travelers in a single grouped query on the travelers bitmask, so the summary never needs the full list in the browser.
+
+    Args:
+        whichMap (str, optional): A query parameter with the map to count, 'world', 'states' or 'cities'. Defaults to every map.
+
+    Returns:
+        flask.Response: A JSON response mapping each map to its 'total' number of places, its number of 'todo' places, the number 'visited' by any traveler, a count per traveler under 'travelers' and the 'combinations' of travelers with their counts, most common first.
+    """
+    which_map = request.args.get('whichMap')
+    return jsonify(Visited.stats(which_map.removeprefix('Visited ').lower() if which_map else None))
+
+
+@bp.route('/api/visited/import', methods=['POST'])
+@require_email_authorization
+def import_visited():
+    """
+    Mark the places in uploaded GPX tracks and photos as visited.
+
+    This endpoint accepts a multipart upload of one or more GPX or JPEG files in the 'files' field. The points are streamed from the files, deduplicated on a coarse grid and resolved to countries, US states and urban areas, and the matching visited entries are updated in one transaction.
+
+    Args:
+        traveler (str): A query parameter with the name of the traveler to mark the places for.
+
+    Returns:
+        flask.Response: A JSON response with the number of points read and the added and updated visited entries.
+    """
+    traveler = request.args.get('traveler')
+    if traveler not in Traveler.names():
+        abort(400, description=f"traveler must be one of {', '.join(Traveler.names())}")
+    files = request.files.getlist('files')
+    if not files:
+        abort(400, description="No files uploaded")
+
+    try:
+        result = import_points(((file.stream, file.filename) for file in files), traveler)
+    except ValueError as e:
+        abort(400, description=str(e))
+    return jsonify({
+        'points': result['points'],
+        'unique': result['unique'],
+        'added': [visited.to_dict() for visited in result['added']],
+        'updated': [visited.to_dict() for visited in result['updated']],
+    })
+
+@bp.route('/api/visited/batch', methods=['POST'])
+@require_email_authorization
+def batch_visited():
+    """
+    Apply a batch of visited entry changes in a single transaction.
+
+    This endpoint accepts a JSON payload of the form {"operations": [...]}, where every operation is {"op": "create", "data": {...}}, {"op": "update", "id": ..., "data": {...}} or {"op": "delete", "id": ...}. The valid operations are applied with one bulk statement per kind of operation and committed together, so a whole trip costs a single round trip and commit. Invalid operations are reported and skipped.
 
+    Returns:
+        flask.Response: A JSON response with a 'results' list holding, for every operation in order, its status (201 created, 200 updated or deleted, 400 invalid, 404 not found), the id and the resulting entry, or a 400 error if the payload is not a list of at most 1000 operations.
+    """
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or not isinstance(data.get('operations'), list) or len(data['operations']) > MAX_BATCH_SIZE:
+        abort(400, description=f"operations must be a list of at most {MAX_BATCH_SIZE} operations")
+
+    return jsonify({'results': Visited.apply_batch(data['operations'])})
+
+def _since():
+    # The browser sends the id of the last event it received when it reconnects a stream
+    since = request.headers.get('Last-Event-ID', request.args.get('since'))
+    if since is None:
+        return None
+    try:
+        since = int(since)
+    except ValueError:
+        since = -1
+    if since < 0:
+        abort(400, description="since must be a non-negative integer")
+    return since
+
+def _changes(model):
+    since = _since()
+    if since is None:
+        return jsonify({'changes': [], 'last': ChangeLog.latest(), 'more': False})
+    feed = model.changes_since(since)
+    if feed is None:
+        abort(410, description="Changes this old are no longer available, reload the full list")
+    return jsonify(feed)
+
+@bp.route('/api/visited/changes', methods=['GET'])
+@require_email_authorization
+def visited_changes():
+    """
+    Produces the visited entries changed since a sequence number.
+
+    Every write to a visited entry is numbered in a change log. Clients keep the 'last' number they have seen and ask for the changes after it, instead of reloading the whole list after every edit. Entries changed more than once are returned once, with their latest change.
+
+    Args:
+        since (int, optional): A query parameter with the last sequence number already seen. Without it, no changes are returned and 'last' is the current sequence number, to follow changes from now on.
+
+    Returns:
+        flask.Response: A JSON response with a 'changes' list, where every change has its 'seq', its 'op' ('upsert' or 'delete'), the entry 'id' and, for upserts, the current 'entry'; the 'last' sequence number read, to pass as 'since' next time; and 'more', true when there are more changes to fetch. A 410 error is returned when the changes were pruned from the log and the full list has to be reloaded.
+    """
+    return _changes(Visited)
+
+@bp.route('/api/visited/stream', methods=['GET'])
+@require_email_authorization
+def visited_stream():
+    """
+    Push visited entry changes to an open map page with Server-Sent Events.
+
+    This endpoint streams the same changes as /api/visited/changes as 'change' events, with the sequence number as the event id, so other open tabs stay in sync without polling for the full list. The stream ends once the pending changes are sent, so an open tab never holds a worker, and EventSource reconnects a few seconds later with the Last-Event-ID header and resumes where it left off. A 'reset' event means the changes were pruned from the log and the full list has to be reloaded.
+
+    Args:
+        since (int, optional): A query parameter with the last sequence number already seen. Defaults to the current sequence number. The Last-Event-ID header takes precedence on reconnects.
+
+    Returns:
+        flask.Response: A text/event-stream response.
+    """
+    since = _since()
+    return change_stream(Visited, ChangeLog.latest() if since is None else since)
 
 @bp.route('/api/visited/<uuid:visited_id>', methods=['GET'])
 @require_email_authorization
+@versioned(Visited, Traveler)
 def get_single_visited(visited_id):
     """
     Get details of a specific visited item by its ID.
@@ -85,9 +415,8 @@ def get_single_visited(visited_id):
     Returns:
         flask.Response: A JSON response containing the details of the visited item if found, or a 404 error if not found.
     """
-    visited = Visited.load_visited_data()
-    visited_entry = next((item for item in visited if item['id'] == str(visited_id)), None)
-    return jsonify(visited_entry) if visited_entry else ('', 404)
+    visited_entry = Visited.get_by_id(str(visited_id))
+    return jsonify(visited_entry.to_dict()) if visited_entry else ('', 404)
 
 
 @bp.route('/api/visited', methods=['POST'])
@@ -98,7 +427,8 @@ def add_or_update_visited():
 
     This endpoint allows for the addition of a new visited place or the update
     of an existing place's details. It accepts a JSON payload with the visited
-    place's details.
+    place's details, with a boolean per traveler under the traveler's name,
+    e.g. {"john": true}, or the names of the travelers in a 'travelers' list.
 
     Returns:
         flask.Response: A JSON response containing the newly added or updated
@@ -109,10 +439,13 @@ def add_or_update_visited():
     if not data or not data.get('name') or not data.get('which_map'):
         abort(400, description="Missing required data")
 
+    try:
+        travelers = Visited.column_values(data).get('travelers', 0)
+    except ValueError as e:
+        abort(400, description=str(e))
     new_visited = Visited.add_new_entry(
         name=data['name'],
-        john=data.get('john', False),
-        marcia=data.get('marcia', False),
+        travelers=travelers,
         todo=data.get('todo', False),
         which_map=data['which_map']
     )
@@ -137,7 +470,10 @@ def update_visited(visited_id):
         abort(400, description="No data provided")
 
     id = data['id']
-    updated_entry = Visited.update_entry(str(id), data)
+    try:
+        updated_entry = Visited.update_entry(str(id), data)
+    except ValueError as e:
+        abort(400, description=str(e))
     if updated_entry:
         return jsonify(updated_entry.to_dict()), 200
     else:
@@ -167,8 +503,221 @@ def delete_visited(id):
     else:
         abort(404, description="Visited entry not found")
 
+@bp.route('/api/travelers', methods=['GET'])
+@require_email_authorization
+@versioned(Traveler)
+def get_travelers():
+    """
+    Retrieve the travelers whose visits are tracked.
+
+    Returns:
+        flask.Response: A JSON response containing an array of travelers, each with its id, its name, which is also the key of its flag in visited entries, and its bit in the travelers bitmask and the 'color' the places only they visited are filled with.
+    """
+    return jsonify([traveler.to_dict() for traveler in Traveler.query.order_by(Traveler.bit)])
+
+@bp.route('/api/travelers', methods=['POST'])
+@require_email_authorization
+def add_traveler():
+    """
+    Add a traveler.
+
+    This endpoint accepts a JSON payload with the 'name' of the new traveler, a lowercase identifier. The traveler is given the lowest free bit of the travelers bitmask, so no schema change is needed, and visited entries get a flag under that name.
+
+    Returns:
+        flask.Response: A JSON response containing the new traveler with a 201 status code, or a 400 error if the name is invalid or taken, or all 31 bits are in use.
+    """
+    data = request.get_json(silent=True) or {}
+    try:
+        traveler = Traveler.add(data.get('name'))
+    except ValueError as e:
+        abort(400, description=str(e))
+    return jsonify(traveler.to_dict()), 201
+
+def _date_arg(name, value):
+    try:
+        return date.fromisoformat(value) if value else None
+    except ValueError:
+        abort(400, description=f"{name} must be a date in YYYY-MM-DD format")
+
+def _timeline_filters():
+    which_map = request.args.get('whichMap')
+    traveler = request.args.get('traveler')
+    if traveler is not None and traveler not in Traveler.names():
+        abort(400, description=f"traveler must be one of {', '.join(Traveler.names())}")
+    return (which_map.removeprefix('Visited ').lower() if which_map else None), traveler
+
+@bp.route('/api/visits', methods=['GET'])
+@require_email_authorization
+@versioned(Visit, Traveler)
+def get_visits():
+    """
+    Retrieve the dated visits, optionally within a date range.
+
+    This endpoint lists the visits overlapping the range in arrival order, with a range scan on the arrival date index.
+
+    Args:
+        start (str, optional): A query parameter with the first date of the range, in YYYY-MM-DD format. Defaults to the first visit.
+        end (str, optional): A query parameter with the last date of the range, in YYYY-MM-DD format. Defaults to the last visit.
+        whichMap (str, optional): A query parameter with the map to list, 'world', 'states' or 'cities'. Defaults to every map.
+        traveler (str, optional): A query parameter with the name of the traveler to list. Defaults to everyone.
+
+    Returns:
+        flask.Response: A JSON response containing an array of visits, each with its id, 'traveler' name, 'which_map', place 'name', 'arrived' and 'departed' dates, or a 400 error for an invalid date or traveler.
+    """
+    which_map, traveler = _timeline_filters()
+    return jsonify(Visit.list(start=_date_arg('start', request.args.get('start')),
+                              end=_date_arg('end', request.args.get('end')),
+                              which_map=which_map, traveler=traveler))
+
+@bp.route('/api/visits', methods=['POST'])
+@require_email_authorization
+def add_visit():
+    """
+    Add a dated visit.
+
+    This endpoint accepts a JSON payload with the 'traveler' name, the 'which_map' and 'name' of the place, the 'arrived' date and optionally the 'departed' date, in YYYY-MM-DD format. The place is also marked as visited by the traveler.
+
+    Returns:
+        flask.Response: A JSON response containing the new visit with a 201 status code, or a 400 error if a field is missing or invalid.
+    """
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or not all(data.get(key) for key in ('traveler', 'which_map', 'name', 'arrived')):
+        abort(400, description="traveler, which_map, name and arrived are required")
+
+    try:
+        values = Visit.column_values(data)
+        visit = Visit.add(data['traveler'], values['which_map'], values['name'], values['arrived'],
+                          values.get('departed'))
+    except ValueError as e:
+        abort(400, description=str(e))
+    return jsonify(visit.to_dict()), 201
+
+@bp.route('/api/visits/<uuid:visit_id>', methods=['PUT'])
+@require_email_authorization
+def update_visit(visit_id):
+    """
+    Update a dated visit.
+
+    Args:
+        visit_id (uuid.UUID): The unique identifier of the visit.
+
+    Returns:
+        flask.Response: A JSON response containing the updated visit, a 400 error if a field is invalid, or a 404 error if the visit does not exist.
+    """
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or not data:
+        abort(400, description="No data provided")
+
+    try:
+        visit = Visit.update_entry(str(visit_id), data)
+    except ValueError as e:
+        abort(400, description=str(e))
+    if visit is None:
+        abort(404, description="Visit not found")
+    return jsonify(visit.to_dict())
+
+@bp.route('/api/visits/<uuid:visit_id>', methods=['DELETE'])
+@require_email_authorization
+def delete_visit(visit_id):
+    """
+    Delete a dated visit. The place stays marked as visited.
+
+    Args:
+        visit_id (uuid.UUID): The unique identifier of the visit.
+
+    Returns:
+        flask.Response: A JSON response confirming the deletion, or a 404 error if the visit does not exist.
+    """
+    if not Visit.delete_by_id(str(visit_id)):
+        abort(404, description="Visit not found")
+    return jsonify({'message': 'Visit deleted successfully', 'id': str(visit_id)})
+
+@bp.route('/api/visits/years', methods=['GET'])
+@require_email_authorization
+def visits_per_year():
+    """
+    Count the places visited for the first time in every year.
+
+    The first visit of every place is found with a window function over the visits of the place ordered by arrival, and the first visits are grouped by year with a running total, all in one query.
+
+    Args:
+        whichMap (str, optional): A query parameter with the map to count, e.g. 'world' for new countries. Defaults to every map.
+        traveler (str, optional): A query parameter with the name of the traveler. Defaults to anyone, so a place is new the first time anyone visits it.
+
+    Returns:
+        flask.Response: A JSON response containing an array with the 'year', the number of 'new' places and the running 'total' for every year with new places.
+    """
+    which_map, traveler = _timeline_filters()
+    _, result = cached_per_year(('years', which_map, traveler), date.max.year,
+                                lambda: Visit.new_places_per_year(which_map, traveler))
+    return jsonify(result)
+
+@bp.route('/api/visits/new', methods=['GET'])
+@require_email_authorization
+def visits_new_places():
+    """
+    List the places visited for the first time in a year.
+
+    Results only depend on the visits up to that year, and are cached until one of them changes, so past years are computed once.
+
+    Args:
+        year (int): A query parameter with the year.
+        whichMap (str, optional): A query parameter with the map to list, e.g. 'world' for new countries. Defaults to every map.
+        traveler (str, optional): A query parameter with the name of the traveler. Defaults to anyone.
+
+    Returns:
+        flask.Response: A JSON response containing an array of the places, each with its 'which_map', 'name' and the date it was first 'arrived' at, or a 400 error for a missing year or an invalid traveler.
+    """
+    year = request.args.get('year', type=int)
+    if year is None or not 1 <= year < date.max.year:
+        abort(400, description="year is required")
+    which_map, traveler = _timeline_filters()
+    _, result = cached_per_year(('new', which_map, traveler), year,
+                                lambda: Visit.new_places(year, which_map, traveler))
+    return jsonify(result)
+
+@bp.route('/api/visits/on/<day>', methods=['GET'])
+@require_email_authorization
+def visits_on(day):
+    """
+    Find where the travelers were on a date.
+
+    Args:
+        day (str): The date, in YYYY-MM-DD format.
+        traveler (str, optional): A query parameter with the name of the traveler. Defaults to everyone.
+
+    Returns:
+        flask.Response: A JSON response containing an array of the visits spanning the date, or a 400 error for an invalid date or traveler.
+    """
+    day = _date_arg('day', day)
+    _, traveler = _timeline_filters()
+    _, result = cached_per_year(('on', day, traveler), day.year, lambda: Visit.on(day, traveler))
+    return jsonify(result)
+
+@bp.route('/api/visits/map', methods=['GET'])
+@require_email_authorization
+def visits_map():
+    """
+    Produces the visit status of the places of a map as of a date.
+
+    Args:
+        date (str): A query parameter with the date, in YYYY-MM-DD format.
+        whichMap (str, optional): A query parameter with the map, 'world', 'states' or 'cities'. Defaults to 'world'.
+
+    Returns:
+        flask.Response: A JSON response mapping the names of the places visited by then to a boolean per traveler, like the entries of /api/visited, or a 400 error for a missing or invalid date.
+    """
+    day = _date_arg('date', request.args.get('date'))
+    if day is None:
+        abort(400, description="date is required")
+    which_map = request.args.get('whichMap', default='world', type=str).removeprefix('Visited ').lower()
+    _, result = cached_per_year(('map', day, which_map, tuple(Traveler.names())), day.year,
+                                lambda: Visit.status_as_of(day, which_map))
+    return jsonify(result)
+
 @bp.route('/api/links', methods=['GET'])
 @require_email_authorization
+@versioned(Links)
 def get_links():
     """
     Retrieve a list of useful travel-related links.
@@ -176,9 +725,9 @@ def get_links():
     This endpoint fetches a list of travel-related links that may be useful for users. Access to this list requires email authorization, ensuring that only authorized users can retrieve the data.
 
     Returns:
-        flask.Response: A JSON response containing an array of travel-related links.
+        flask.Response: A JSON response containing an array of travel-related links, ordered by position.
     """
-    return jsonify((Links.load_links_data()))
+    return json_response(*Links.select_rows(order_by=(Links.position, Links.id)))
 
 @bp.route('/api/links', methods=['POST'])
 @require_email_authorization
@@ -203,6 +752,37 @@ def add_link():
     new_link = Links.add_link(data['name'], data['url'], data.get('notes', ''))
     return jsonify(new_link.to_dict()), 201
 
+@bp.route('/api/links/batch', methods=['POST'])
+@require_email_authorization
+def batch_links():
+    """
+    Apply a batch of link changes in a single transaction.
+
+    This endpoint accepts a JSON payload of the form {"operations": [...]}, where every operation is {"op": "create", "data": {...}}, {"op": "update", "id": ..., "data": {...}} or {"op": "delete", "id": ...}. The valid operations are applied with one bulk statement per kind of operation and committed together, so a whole trip costs a single round trip and commit. Invalid operations are reported and skipped.
+
+    Returns:
+        flask.Response: A JSON response with a 'results' list holding, for every operation in order, its status (201 created, 200 updated or deleted, 400 invalid, 404 not found), the id and the resulting link, or a 400 error if the payload is not a list of at most 1000 operations.
+    """
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or not isinstance(data.get('operations'), list) or len(data['operations']) > MAX_BATCH_SIZE:
+        abort(400, description=f"operations must be a list of at most {MAX_BATCH_SIZE} operations")
+
+    return jsonify({'results': Links.apply_batch(data['operations'])})
+
+@bp.route('/api/links/changes', methods=['GET'])
+@require_email_authorization
+def links_changes():
+    """
+    Produces the links changed since a sequence number.
+
+    Args:
+        since (int, optional): A query parameter with the last sequence number already seen. Without it, no changes are returned and 'last' is the current sequence number.
+
+    Returns:
+        flask.Response: A JSON response with the 'changes', 'last' and 'more' keys of /api/visited/changes, with links as the entries, or a 410 error when the full list has to be reloaded.
+    """
+    return _changes(Links)
+
 @bp.route('/api/links/<id>', methods=['PUT'])
 @require_email_authorization
 def update_link(id):
@@ -212,20 +792,24 @@ def update_link(id):
     This endpoint allows for updating the details of an existing link identified
     by its ID. If the link with the given ID does not exist, it returns a 404
     error. Otherwise, it updates the link with the provided JSON payload,
-    particularly the 'notes' field if specified.
+    particularly the 'notes' field if specified. The position is changed
+    through /api/links/<id>/move only, as positions are unique.
 
     Args:
         id (str): The unique identifier of the link to be updated.
 
     Returns:
-        flask.Response: A JSON response containing the updated link details, or
-        a 404 error if the link with the given ID does not exist.
+        flask.Response: A JSON response containing the updated link details, a
+        400 error if the payload sets the position, or a 404 error if the link
+        with the given ID does not exist.
     """
     link = Links.get_by_id(id)
     if not link:
         abort(404, description="Link not found")
 
     data = request.get_json()
+    if 'position' in data:
+        abort(400, description="position is changed with /api/links/<id>/move")
     try:
         link.update(**data)
         return jsonify(link.to_dict()), 200
@@ -234,6 +818,34 @@ def update_link(id):
         Links.rollback()
         return jsonify({'error': str(e)}), 500
 
+@bp.route('/api/links/<id>/move', methods=['POST'])
+@require_email_authorization
+def move_link(id):
+    """
+    Move a link between two others.
+
+    This endpoint accepts a JSON payload with the id of the link to put it 'after' and the id of the link to put it 'before', either of which may be null at the start or end of the list. Positions are sparse, so only the moved link is updated, however long the list is; the positions are spread out again by the move that finds the gap between its neighbors run out.
+
+    Args:
+        id (str): The unique identifier of the link to move.
+
+    Returns:
+        flask.Response: A JSON response containing the moved link with its new position, a 400 error if neither neighbor is given, a neighbor does not exist or the neighbors are not next to each other, a 404 error if the link does not exist, or a 409 error if concurrent moves kept taking its position.
+    """
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        abort(400, description="after or before is required")
+
+    try:
+        link = Links.move(id, after=data.get('after'), before=data.get('before'))
+    except ValueError as e:
+        abort(400, description=str(e))
+    except IntegrityError:
+        abort(409, description="The links were moved at the same time, try again")
+    if link is None:
+        abort(404, description="Link not found")
+    return jsonify(link.to_dict())
+
 @bp.route('/api/links/<id>', methods=['DELETE'])
 @require_email_authorization
 def delete_link(id):
@@ -258,6 +870,14 @@ def delete_link(id):
 @bp.route('/clearall')
 @require_email_authorization
 def rebuild():
-    Links.import_links_data()
-    Visited.import_visited_data()
+    """
+    Restore the links and visited entries from the files in the instance folder.
+
+    The rows of each table are replaced with the ones in instance/links.json and instance/visited.json by the bulk loader behind ``flask data load``, one batched transaction per table. Other tables are left alone.
+
+    Returns:
+        str: "Done" once both tables are restored.
+    """
+    load_file(Links, links_file_path, replace=True)
+    load_file(Visited, visited_file_path, replace=True)
     return "Done"
\ No newline at end of file
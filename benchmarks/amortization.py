@@ -0,0 +1,103 @@
+"""
+Time the amortization schedule of a 30-year mortgage.
+
+The benchmark times, best of ``--repeat``:
+
+- a month by month Python loop, like the one the browser used to run;
+- ``amortize``, which computes every period at once with NumPy;
+- ``mortgage_schedule`` once cached for the mortgage row;
+- the full ``GET /finances/api/mortgage/<id>/schedule`` request.
+
+The loop and ``amortize`` are checked to agree to within a cent, with a
+one-off extra payment, a recast and extra monthly principal.
+
+Usage:
+    python benchmarks/amortization.py [--repeat 200]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+PRINCIPAL = 400_000
+RATE = 6.5
+MONTHS = 360
+
+
+def best_of(repeat, f):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = f()
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+
+def python_loop(extra, recasts):
+    rate = RATE / 12 / 100
+    balance = PRINCIPAL
+    payment = balance * rate / (1 - (1 + rate) ** -MONTHS)
+    balances = []
+    for period in range(MONTHS):
+        if period in recasts:
+            payment = balance * rate / (1 - (1 + rate) ** -(MONTHS - period))
+        due = balance * (1 + rate)
+        paid = min(payment, due)
+        balance = due - paid - min(extra[period], due - paid)
+        balances.append(balance)
+        if balance < 0.005:
+            break
+    return balances
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    database = os.path.join(tempfile.mkdtemp(), 'amortization.db')
+    os.environ['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{database}'
+    os.environ['FLASK_ENV'] = 'development'
+    os.environ.setdefault('SECRET_KEY', 'benchmark')
+
+    import numpy as np
+
+    from app import create_app
+    from app.extensions import db
+    from app.models.amortization import amortize, mortgage_schedule
+    from app.models.finances import Mortgage
+
+    extra = np.full(MONTHS, 250.0)
+    extra[24] += 50_000
+    recasts = (25,)
+    expected = python_loop(extra.tolist(), recasts)
+    balances = amortize(PRINCIPAL, RATE, MONTHS, extra, recasts)[3]
+    assert len(expected) == len(balances) and np.allclose(expected, balances, atol=0.01)
+
+    app = create_app()
+    client = app.test_client()
+    with app.app_context():
+        db.create_all()
+        mortgage = Mortgage(principal=PRINCIPAL, interest_rate=RATE, start_date=datetime(2024, 1, 1),
+                            loan_term=MONTHS // 12, monthly_escrow=450)
+        db.session.add(mortgage)
+        db.session.commit()
+
+        print(f"{MONTHS} periods, best of {args.repeat}")
+        timings = [
+            ('python loop', lambda: python_loop(extra.tolist(), recasts)),
+            ('numpy amortize', lambda: amortize(PRINCIPAL, RATE, MONTHS, extra, recasts)),
+            ('cached mortgage_schedule', lambda: mortgage_schedule(mortgage)),
+            ('GET schedule request', lambda: client.get(f'/finances/api/mortgage/{mortgage.id}/schedule')),
+        ]
+        for label, f in timings:
+            seconds, _ = best_of(args.repeat, f)
+            print(f"  {label:<28} {seconds * 1e6:9.1f} us")
+
+
+if __name__ == '__main__':
+    main()
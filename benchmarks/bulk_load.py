@@ -0,0 +1,93 @@
+"""
+Time restoring the visited table with the bulk loader behind ``flask data load``.
+
+A dataset of ``--rows`` entries is written as NDJSON and as a JSON array in a
+temporary directory, then loaded into a temporary SQLite database:
+
+- the previous row-by-row import (one ORM object added per row), on
+  ``--legacy-rows`` rows since it is much slower;
+- ``load_table`` from the NDJSON and the JSON array into an empty table;
+- the same NDJSON again, which must leave the table unchanged;
+- ``dump_table`` back to NDJSON, which must match the input.
+
+Usage:
+    python benchmarks/bulk_load.py [--rows 100000] [--legacy-rows 10000]
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=100_000)
+    parser.add_argument('--legacy-rows', type=int, default=10_000)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    os.environ['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(directory, 'bulk_load.db')}"
+    os.environ.setdefault('SECRET_KEY', 'benchmark')
+
+    from app import create_app
+    from app.extensions import db
+    from app.models.bulk import dump_table, iter_records, load_table
+    from app.models.travel import Visited
+    from app.models.travelers import Traveler
+
+    records = [{'id': str(uuid.uuid4()), 'travelers': (i % 2 == 0) | (i % 3 == 0) << 1, 'name': f'Place {i}',
+                'todo': i % 5 == 0, 'which_map': ('world', 'states', 'cities')[i % 3]}
+               for i in range(args.rows)]
+    ndjson_path = os.path.join(directory, 'visited.ndjson')
+    json_path = os.path.join(directory, 'visited.json')
+    with open(ndjson_path, 'w') as file:
+        file.writelines(json.dumps(record, sort_keys=True, separators=(',', ':')) + '\n' for record in records)
+    with open(json_path, 'w') as file:
+        json.dump(records, file, indent=2)
+
+    def timed(label, f):
+        start = time.perf_counter()
+        result = f()
+        seconds = time.perf_counter() - start
+        print(f"  {label:<36} {seconds:7.2f} s")
+        return result, seconds
+
+    def load(path, file_format, replace=False):
+        with open(path) as file:
+            return load_table(Visited, iter_records(file, file_format), replace=replace)
+
+    def legacy():
+        for record in records[:args.legacy_rows]:
+            db.session.add(Visited(**record))
+        db.session.commit()
+
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        Traveler.create_defaults()
+        print(f"{args.rows:,} rows")
+        _, legacy_seconds = timed(f'row by row ({args.legacy_rows:,} rows)', legacy)
+        db.session.execute(Visited.__table__.delete())
+        db.session.commit()
+
+        _, seconds = timed('load NDJSON', lambda: load(ndjson_path, 'ndjson'))
+        timed('load JSON array, replace', lambda: load(json_path, 'json', replace=True))
+        timed('load NDJSON again', lambda: load(ndjson_path, 'ndjson'))
+        assert db.session.query(Visited).count() == args.rows
+
+        dump_path = os.path.join(directory, 'dump.ndjson')
+        with open(dump_path, 'wb') as file:
+            timed('dump NDJSON', lambda: dump_table(Visited, file))
+        with open(dump_path) as dumped, open(ndjson_path) as original:
+            assert sorted(map(json.loads, dumped), key=lambda r: r['id']) == sorted(records, key=lambda r: r['id'])
+
+        print(f"  {'speedup over row by row':<36} {legacy_seconds / args.legacy_rows * args.rows / seconds:7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
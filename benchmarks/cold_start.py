@@ -0,0 +1,111 @@
+"""
+Measure the cold start of ``app:create_app()`` and fail when it regresses.
+
+Every run imports the app and calls ``create_app()`` in a fresh interpreter,
+the same work a gunicorn worker does when it boots or is recycled. The
+median time is compared to the budget in ``cold_start_budget.json``, and
+modules that must stay deferred until the first request that needs them
+are checked as well. One extra run with ``-X importtime`` breaks the time
+down by top-level package, counting the time spent in the package's own
+modules.
+
+Usage:
+    python benchmarks/cold_start.py            # check against the budget
+    python benchmarks/cold_start.py --update   # store the current median as the budget
+
+Budgets depend on the machine, so update the stored one on the Pi itself.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BUDGET_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cold_start_budget.json')
+
+# Headroom applied to the measured median when the budget is updated
+HEADROOM = 1.25
+
+STARTUP = """
+import sys, time, json
+start = time.perf_counter()
+from app import create_app
+create_app()
+print(json.dumps({'seconds': time.perf_counter() - start, 'modules': sorted(sys.modules)}))
+"""
+
+
+def _environ():
+    env = dict(os.environ)
+    # Workers are not started from the flask CLI
+    env.pop('FLASK_RUN_FROM_CLI', None)
+    env.setdefault('SQLALCHEMY_DATABASE_URI', 'sqlite://')
+    env.setdefault('SECRET_KEY', 'benchmark')
+    return env
+
+
+def measure():
+    """Return the create_app time in seconds and the modules loaded by one cold start."""
+    result = subprocess.run([sys.executable, '-c', STARTUP], cwd=ROOT, env=_environ(),
+                            capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.splitlines()[-1])
+
+
+def import_breakdown():
+    """Return the import time in seconds spent in every top-level package, its submodules included."""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', STARTUP], cwd=ROOT, env=_environ(),
+                            capture_output=True, text=True, check=True)
+    totals = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_time, _, name = line.split('|')
+        package = name.strip().split('.')[0]
+        totals[package] = totals.get(package, 0) + int(self_time.split(':')[1]) / 1e6
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=7, help='Number of cold starts to time.')
+    parser.add_argument('--update', action='store_true', help='Store the measured median as the budget.')
+    args = parser.parse_args()
+
+    with open(BUDGET_PATH) as file:
+        budget = json.load(file)
+
+    runs = [measure() for _ in range(args.runs)]
+    median = statistics.median(run['seconds'] for run in runs)
+
+    print(f"create_app: median {median * 1000:.0f} ms over {args.runs} runs "
+          f"(min {min(run['seconds'] for run in runs) * 1000:.0f} ms)")
+    print("Import time by package:")
+    for package, seconds in sorted(import_breakdown().items(), key=lambda item: -item[1])[:15]:
+        print(f"  {package:<24} {seconds * 1000:8.1f} ms")
+
+    if args.update:
+        budget['create_app_seconds'] = round(median * HEADROOM, 3)
+        with open(BUDGET_PATH, 'w') as file:
+            json.dump(budget, file, indent=4)
+            file.write('\n')
+        print(f"Budget set to {budget['create_app_seconds'] * 1000:.0f} ms")
+        return 0
+
+    failures = []
+    if median > budget['create_app_seconds']:
+        failures.append(f"create_app took {median * 1000:.0f} ms, "
+                        f"budget is {budget['create_app_seconds'] * 1000:.0f} ms")
+    loaded = set(runs[0]['modules'])
+    for module in budget['deferred_modules']:
+        if module in loaded:
+            failures.append(f"{module} is imported at start up")
+
+    for failure in failures:
+        print(f"FAIL: {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,95 @@
+"""
+Show that single Visited lookups stay constant time as the table grows.
+
+The table is filled to increasing sizes in a temporary SQLite database. At
+each size the benchmark times the old lookup (load and serialize the whole
+table, then scan it for the id), a primary key lookup through
+``Visited.get_by_id`` with an empty identity map, and a repeat lookup that
+the identity map answers.
+
+Usage:
+    python benchmarks/pk_lookup.py
+    python benchmarks/pk_lookup.py --sizes 1000 10000 100000 250000
+
+Exits non-zero when a primary key lookup at the largest size is more than
+``--max-growth`` times slower than at the smallest.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1_000, 10_000, 100_000, 200_000])
+    parser.add_argument('--lookups', type=int, default=2_000, help='Primary key lookups timed per size.')
+    parser.add_argument('--max-growth', type=float, default=3.0)
+    args = parser.parse_args()
+
+    database = os.path.join(tempfile.mkdtemp(), 'pk_lookup.db')
+    os.environ['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{database}'
+    os.environ.setdefault('SECRET_KEY', 'benchmark')
+
+    from sqlalchemy import insert
+
+    from app import create_app
+    from app.extensions import db
+    from app.models.travel import Visited
+    from app.models.travelers import Traveler
+
+    app = create_app()
+    results = []
+    with app.app_context():
+        db.create_all()
+        Traveler.create_defaults()
+        ids = []
+        print(f"{'rows':>8} {'full scan':>12} {'get_by_id':>12} {'identity map':>14}")
+        for size in sorted(args.sizes):
+            rows = [{'id': str(uuid.uuid4()), 'name': f'Place {len(ids) + i}',
+                     'travelers': (i % 2 == 0) | (i % 3 == 0) << 1, 'todo': False, 'which_map': 'world'}
+                    for i in range(size - len(ids))]
+            db.session.execute(insert(Visited), rows)
+            db.session.commit()
+            ids.extend(row['id'] for row in rows)
+
+            # The old lookup is O(rows), a single run is enough to show it
+            target = random.choice(ids)
+            start = time.perf_counter()
+            visited = Visited.load_visited_data()
+            next(item for item in visited if item['id'] == target)
+            full_scan = time.perf_counter() - start
+
+            targets = random.choices(ids, k=args.lookups)
+            start = time.perf_counter()
+            for target in targets:
+                db.session.expunge_all()
+                Visited.get_by_id(target).to_dict()
+            lookup = (time.perf_counter() - start) / args.lookups
+
+            # The identity map only holds weak references, keep the entity alive as a request would
+            held = Visited.get_by_id(targets[0])
+            start = time.perf_counter()
+            for _ in range(args.lookups):
+                Visited.get_by_id(targets[0])
+            cached = (time.perf_counter() - start) / args.lookups
+            del held
+
+            results.append(lookup)
+            print(f"{size:>8,} {full_scan * 1000:>10.1f}ms {lookup * 1e6:>10.1f}us {cached * 1e6:>12.1f}us")
+
+    growth = results[-1] / results[0]
+    print(f"get_by_id grew {growth:.2f}x from {min(args.sizes):,} to {max(args.sizes):,} rows")
+    if growth > args.max_growth:
+        print(f"FAIL: growth exceeds {args.max_growth}x", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
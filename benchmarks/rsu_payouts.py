@@ -0,0 +1,96 @@
+"""
+Time the aggregated RSU payouts with thousands of grants.
+
+A temporary SQLite database is filled with ``--grants`` RSU bonus payments,
+through the bulk loader so the payout ledger is built once. The benchmark
+then times, best of ``--repeat``:
+
+- the previous path: load every RSU bonus payment and expand its payouts in
+  a nested year and month loop, then total them in a dict;
+- ``RsuPayout.aggregate``, one grouped range scan of the ledger;
+- the full ``GET /finances/api/aggregated_rsu_payouts`` request, without
+  its ETag.
+
+Both paths are checked to agree on the payouts still to come.
+
+Usage:
+    python benchmarks/rsu_payouts.py [--grants 5000] [--repeat 5]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def best_of(repeat, f):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = f()
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--grants', type=int, default=5000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    database = os.path.join(tempfile.mkdtemp(), 'rsu_payouts.db')
+    os.environ['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{database}'
+    os.environ['FLASK_ENV'] = 'development'
+    os.environ.setdefault('SECRET_KEY', 'benchmark')
+
+    from app import create_app
+    from app.extensions import db
+    from app.models.bulk import load_table
+    from app.models.finances import BonusPayment, RsuPayout
+
+    now = datetime.now()
+
+    def nested_loops():
+        # The per-request expansion the ledger replaces, over the same six payouts
+        totals = {}
+        for grant in BonusPayment.query.filter_by(bonus_type='rsu').all():
+            payouts = 0
+            for year in range(grant.year_assigned + 1, grant.year_assigned + 10):
+                for month in [6, 12]:
+                    if payouts < 6:
+                        payouts += 1
+                        current = datetime.now()
+                        if year > current.year or (year == current.year and month >= current.month):
+                            totals[(year, month)] = totals.get((year, month), 0) + grant.amount / 6
+        return [{'year': year, 'month': month, 'amount': amount} for (year, month), amount in sorted(totals.items())]
+
+    app = create_app()
+    client = app.test_client()
+    with app.app_context():
+        db.create_all()
+        load_table(BonusPayment, ({'bonus_type': 'rsu', 'amount': 1000.0 + index % 97 * 60,
+                                   'payment_date': f'{now.year - index % 5}-03-01',
+                                   'year_assigned': now.year - index % 5}
+                                  for index in range(args.grants)))
+        print(f"{args.grants:,} grants, {RsuPayout.query.count():,} ledger rows, best of {args.repeat}")
+
+        expected = nested_loops()
+        got = RsuPayout.aggregate(now.year, now.month)
+        assert [(row['year'], row['month']) for row in got] == [(row['year'], row['month']) for row in expected]
+        assert all(abs(a['amount'] - b['amount']) < 0.01 for a, b in zip(got, expected))
+
+        timings = [
+            ('nested loops', nested_loops),
+            ('ledger GROUP BY', lambda: RsuPayout.aggregate(now.year, now.month)),
+            ('GET aggregated_rsu_payouts', lambda: client.get('/finances/api/aggregated_rsu_payouts')),
+        ]
+        for label, f in timings:
+            seconds, _ = best_of(args.repeat, f)
+            print(f"  {label:<28} {seconds * 1000:8.2f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+"""
+Compare JSON serialization paths on a 10k row Visited listing.
+
+A temporary SQLite table is filled with ``--rows`` entries. The benchmark
+then times, best of ``--repeat`` interleaved rounds:
+
+- the previous path: load instances, ``to_dict()`` by reflecting over the
+  table columns, then ``jsonify``;
+- ``to_dict()`` through the precomputed column getter with ``jsonify``;
+- plain row tuples encoded by ``serialize.dumps`` (orjson when installed);
+- the full ``GET /travel/api/visited`` request, as records and as columns,
+  including streaming once the listing exceeds the stream threshold.
+
+Usage:
+    python benchmarks/serialization.py [--rows 10000] [--repeat 5]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def best_of(repeat, functions):
+    # The functions take turns in every round, so whichever runs first does
+    # not get a quieter heap and allocator than the others
+    times = [[] for _ in functions]
+    results = [None] * len(functions)
+    for _ in range(repeat):
+        for index, f in enumerate(functions):
+            start = time.perf_counter()
+            results[index] = f()
+            times[index].append(time.perf_counter() - start)
+    return [(min(seconds), result) for seconds, result in zip(times, results)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=10_000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    database = os.path.join(tempfile.mkdtemp(), 'serialization.db')
+    os.environ['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{database}'
+    os.environ['FLASK_ENV'] = 'development'
+    os.environ.setdefault('SECRET_KEY', 'benchmark')
+
+    from flask import jsonify
+    from sqlalchemy import insert
+
+    from app import create_app
+    from app.extensions import db
+    from app.models import serialize
+    from app.models.travel import Visited
+    from app.models.travelers import Traveler
+
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        Traveler.create_defaults()
+        db.session.execute(insert(Visited), [
+            {'id': str(uuid.uuid4()), 'name': f'Place {i}', 'travelers': (i % 2 == 0) | (i % 3 == 0) << 1,
+             'todo': i % 5 == 0, 'which_map': 'world'}
+            for i in range(args.rows)
+        ])
+        db.session.commit()
+
+    def reflective():
+        with app.test_request_context():
+            entries = [{column.name: getattr(visited, column.name) for column in visited.__table__.columns}
+                       for visited in Visited.query.all()]
+            return jsonify(entries).get_data()
+
+    def column_getter():
+        with app.test_request_context():
+            return jsonify([visited.to_dict() for visited in Visited.query.all()]).get_data()
+
+    def tuples():
+        with app.test_request_context():
+            fields, rows, _ = Visited.query_map('world')
+            return serialize.dumps(serialize.records(fields, rows))
+
+    client = app.test_client()
+    print(f"{args.rows:,} rows, JSON backend: {'orjson' if serialize.orjson else 'stdlib json'}")
+    timings = [
+        ('instances + reflective to_dict + jsonify', reflective),
+        ('instances + column getter to_dict + jsonify', column_getter),
+        ('row tuples + serialize.dumps', tuples),
+        ('GET /travel/api/visited', lambda: client.get('/travel/api/visited').get_data()),
+        ('GET /travel/api/visited?format=columns', lambda: client.get('/travel/api/visited?format=columns').get_data()),
+    ]
+    baseline = None
+    for (label, _), (seconds, body) in zip(timings, best_of(args.repeat, [f for _, f in timings])):
+        baseline = baseline or seconds
+        print(f"  {label:<42} {seconds * 1000:8.1f} ms {len(body):>10,} bytes  {baseline / seconds:5.1f}x")
+
+
+if __name__ == '__main__':
+    main()
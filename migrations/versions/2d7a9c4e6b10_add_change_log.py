@@ -0,0 +1,33 @@
+"""Add change_log
+
+Revision ID: 2d7a9c4e6b10
+Revises: 8f1d6b3e5a27
+Create Date: 2026-10-17 14:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2d7a9c4e6b10'
+down_revision = '8f1d6b3e5a27'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('change_log',
+    sa.Column('seq', sa.Integer(), nullable=False),
+    sa.Column('table_name', sa.String(length=64), nullable=False),
+    sa.Column('entity_id', sa.String(length=36), nullable=False),
+    sa.Column('op', sa.String(length=6), nullable=False),
+    sa.Column('changed_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('seq')
+    )
+    op.create_index('ix_change_log_table_name_seq', 'change_log', ['table_name', 'seq'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_change_log_table_name_seq', table_name='change_log')
+    op.drop_table('change_log')
@@ -0,0 +1,24 @@
+"""Add visited which_map, name index
+
+Revision ID: 4c9e2a7d1f03
+Revises: b3b2812ceff6
+Create Date: 2026-10-17 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4c9e2a7d1f03'
+down_revision = 'b3b2812ceff6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_visited_which_map_name', 'visited', ['which_map', 'name'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_visited_which_map_name', table_name='visited')
@@ -0,0 +1,56 @@
+"""Replace the john and marcia columns with a traveler bitmask
+
+Revision ID: 5b8e1f3a9d42
+Revises: 2d7a9c4e6b10
+Create Date: 2026-10-17 15:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5b8e1f3a9d42'
+down_revision = '2d7a9c4e6b10'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    traveler = op.create_table('traveler',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=50), nullable=False),
+    sa.Column('bit', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('name'),
+    sa.UniqueConstraint('bit')
+    )
+    op.bulk_insert(traveler, [
+        {'id': 1, 'name': 'john', 'bit': 0},
+        {'id': 2, 'name': 'marcia', 'bit': 1},
+    ])
+
+    with op.batch_alter_table('visited', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('travelers', sa.Integer(), nullable=False, server_default='0'))
+    op.execute(
+        "UPDATE visited SET travelers = "
+        "(CASE WHEN john THEN 1 ELSE 0 END) + (CASE WHEN marcia THEN 2 ELSE 0 END)"
+    )
+    with op.batch_alter_table('visited', schema=None) as batch_op:
+        batch_op.drop_column('john')
+        batch_op.drop_column('marcia')
+
+
+def downgrade():
+    with op.batch_alter_table('visited', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('john', sa.Boolean(), nullable=True))
+        batch_op.add_column(sa.Column('marcia', sa.Boolean(), nullable=True))
+    op.execute(
+        "UPDATE visited SET "
+        "john = (travelers & 1) <> 0, "
+        "marcia = (travelers & 2) <> 0"
+    )
+    with op.batch_alter_table('visited', schema=None) as batch_op:
+        batch_op.drop_column('travelers')
+
+    op.drop_table('traveler')
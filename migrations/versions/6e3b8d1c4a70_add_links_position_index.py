@@ -0,0 +1,37 @@
+"""Spread the link positions apart and add a unique index on them
+
+Revision ID: 6e3b8d1c4a70
+Revises: 9a4c2e7b3f15
+Create Date: 2026-10-17 18:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6e3b8d1c4a70'
+down_revision = '9a4c2e7b3f15'
+branch_labels = None
+depends_on = None
+
+# Links.POSITION_GAP when this revision was written
+POSITION_GAP = 1024
+
+
+def upgrade():
+    links = sa.table('links', sa.column('id', sa.String), sa.column('position', sa.Integer))
+    connection = op.get_bind()
+    ids = connection.execute(
+        sa.select(links.c.id).order_by(links.c.position.is_(None), links.c.position, links.c.id)
+    ).scalars().all()
+    # Positions were consecutive and could repeat, so renumber every link in its current order
+    connection.execute(links.update().values(position=None))
+    for index, id in enumerate(ids):
+        connection.execute(links.update().where(links.c.id == id).values(position=(index + 1) * POSITION_GAP))
+
+    op.create_index('ix_links_position', 'links', ['position'], unique=True)
+
+
+def downgrade():
+    op.drop_index('ix_links_position', table_name='links')
@@ -0,0 +1,37 @@
+"""Add table_version
+
+Revision ID: 8f1d6b3e5a27
+Revises: 4c9e2a7d1f03
+Create Date: 2026-10-17 13:00:00.000000
+
+"""
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8f1d6b3e5a27'
+down_revision = '4c9e2a7d1f03'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    table_version = op.create_table('table_version',
+    sa.Column('table_name', sa.String(length=64), nullable=False),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('table_name')
+    )
+    # Seed a row per versioned table so writers only ever update
+    now = datetime.utcnow()
+    op.bulk_insert(table_version, [
+        {'table_name': name, 'version': 1, 'updated_at': now}
+        for name in ('visited', 'links', 'mortgage', 'bonus_payment', 'savings')
+    ])
+
+
+def downgrade():
+    op.drop_table('table_version')
@@ -0,0 +1,42 @@
+"""Add the visit table of dated visits
+
+Revision ID: 9a4c2e7b3f15
+Revises: 5b8e1f3a9d42
+Create Date: 2026-10-17 17:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9a4c2e7b3f15'
+down_revision = '5b8e1f3a9d42'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('visit',
+    sa.Column('id', sa.String(length=36), nullable=False),
+    sa.Column('traveler_id', sa.Integer(), nullable=False),
+    sa.Column('which_map', sa.String(length=50), nullable=False),
+    sa.Column('name', sa.String(length=120), nullable=False),
+    sa.Column('arrived', sa.Date(), nullable=False),
+    sa.Column('departed', sa.Date(), nullable=True),
+    sa.ForeignKeyConstraint(['traveler_id'], ['traveler.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('visit', schema=None) as batch_op:
+        batch_op.create_index('ix_visit_arrived', ['arrived'], unique=False)
+        batch_op.create_index('ix_visit_traveler_id_arrived', ['traveler_id', 'arrived'], unique=False)
+        batch_op.create_index('ix_visit_which_map_name_arrived', ['which_map', 'name', 'arrived'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('visit', schema=None) as batch_op:
+        batch_op.drop_index('ix_visit_which_map_name_arrived')
+        batch_op.drop_index('ix_visit_traveler_id_arrived')
+        batch_op.drop_index('ix_visit_arrived')
+
+    op.drop_table('visit')
@@ -0,0 +1,51 @@
+"""Add the rsu_payout ledger and fill it from the bonus payments
+
+Revision ID: c71f5a2e8d36
+Revises: 6e3b8d1c4a70
+Create Date: 2026-10-17 19:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c71f5a2e8d36'
+down_revision = '6e3b8d1c4a70'
+branch_labels = None
+depends_on = None
+
+# RSUs pay out 1/6th every June and December, starting the year after they are assigned
+PAYOUTS = [(year, month) for year in (1, 2, 3) for month in (6, 12)]
+
+
+def upgrade():
+    rsu_payout = op.create_table('rsu_payout',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('bonus_payment_id', sa.Integer(), nullable=False),
+    sa.Column('year', sa.Integer(), nullable=False),
+    sa.Column('month', sa.Integer(), nullable=False),
+    sa.Column('amount', sa.Float(), nullable=False),
+    sa.ForeignKeyConstraint(['bonus_payment_id'], ['bonus_payment.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_rsu_payout_bonus_payment_id', 'rsu_payout', ['bonus_payment_id'], unique=False)
+    op.create_index('ix_rsu_payout_year_month_amount', 'rsu_payout', ['year', 'month', 'amount'], unique=False)
+
+    bonus_payment = sa.table('bonus_payment', sa.column('id', sa.Integer), sa.column('bonus_type', sa.String),
+                             sa.column('amount', sa.Float), sa.column('year_assigned', sa.Integer))
+    grants = op.get_bind().execute(
+        sa.select(bonus_payment.c.id, bonus_payment.c.amount, bonus_payment.c.year_assigned)
+        .where(bonus_payment.c.bonus_type == 'rsu')
+    ).all()
+    rows = [{'bonus_payment_id': id, 'year': year_assigned + offset, 'month': month, 'amount': amount / len(PAYOUTS)}
+            for id, amount, year_assigned in grants
+            for offset, month in PAYOUTS]
+    if rows:
+        op.bulk_insert(rsu_payout, rows)
+
+
+def downgrade():
+    op.drop_index('ix_rsu_payout_year_month_amount', table_name='rsu_payout')
+    op.drop_index('ix_rsu_payout_bonus_payment_id', table_name='rsu_payout')
+    op.drop_table('rsu_payout')
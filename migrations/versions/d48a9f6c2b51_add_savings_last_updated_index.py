@@ -0,0 +1,24 @@
+"""Add an index on savings.last_updated
+
+Revision ID: d48a9f6c2b51
+Revises: c71f5a2e8d36
+Create Date: 2026-10-17 20:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd48a9f6c2b51'
+down_revision = 'c71f5a2e8d36'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_savings_last_updated', 'savings', ['last_updated'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_savings_last_updated', table_name='savings')